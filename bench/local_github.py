@@ -0,0 +1,112 @@
+# --- GitHub Contents API のローカル代替 (ベンチマーク用) ---
+# data_layer が使う GET / PUT / DELETE だけを、メモリ上のファイルで再現する。
+#   ・ETag はファイル内容の SHA-1。If-None-Match が一致すれば 304
+#   ・Accept が raw なら本文、そうでなければ sha と base64 の content を返す
+#   ・PUT / DELETE は sha が現在の内容と一致しなければ 409 (上書きの競合)
+# with LocalGitHub(files): の間だけ requests.Session の get / put / delete を差し替える
+# (storage.GitHubStorage はセッション経由で通信する)。
+import base64
+import hashlib
+import io
+import json
+import re
+import time
+
+import requests
+
+_PATH = re.compile(r"/contents/(.+)$")
+
+
+class Response:
+
+  def __init__(self, status_code, content=b"", headers=None, body=None):
+    self.status_code = status_code
+    self.content = content
+    self.raw = io.BytesIO(content)  # stream=True で読む本文
+    self.headers = headers or {}
+    self._body = body
+
+  def close(self):
+    pass
+
+  def json(self):
+    return self._body if self._body is not None else json.loads(self.content)
+
+
+class LocalGitHub:
+
+  def __init__(self, files=None, latency=0.0):
+    # files: リポジトリ内のパス → 内容 (bytes)。latency はリクエストごとの待ち時間 (秒)
+    self.files = dict(files or {})
+    self.latency = latency
+    self.requests = []  # (メソッド, パス, 送受信したバイト数)
+    self._saved = None
+
+  @staticmethod
+  def sha(content):
+    return hashlib.sha1(content).hexdigest()
+
+  def _path(self, url):
+    m = _PATH.search(url)
+    return m.group(1) if m else None
+
+  def get(self, url, headers=None, params=None, timeout=None, stream=False):
+    if self.latency:
+      time.sleep(self.latency)
+    headers = headers or {}
+    path = self._path(url)
+    content = self.files.get(path)
+    if content is None:
+      self.requests.append(("GET", path, 0))
+      return Response(404, b'{"message": "Not Found"}')
+    etag = f'"{self.sha(content)}"'
+    if headers.get("If-None-Match") == etag:
+      self.requests.append(("GET", path, 0))
+      return Response(304, headers={"ETag": etag})
+    self.requests.append(("GET", path, len(content)))
+    if "raw" in headers.get("Accept", ""):
+      return Response(200, content, {"ETag": etag})
+    body = {"sha": self.sha(content), "content": base64.b64encode(content).decode()}
+    return Response(200, headers={"ETag": etag}, body=body)
+
+  def put(self, url, headers=None, json=None, timeout=None):
+    if self.latency:
+      time.sleep(self.latency)
+    path = self._path(url)
+    current = self.files.get(path)
+    sha = json.get("sha")
+    if (current is None and sha) or (current is not None and sha != self.sha(current)):
+      self.requests.append(("PUT", path, 0))
+      return Response(409, body={"message": "conflict"})
+    content = base64.b64decode(json["content"])
+    self.files[path] = content
+    self.requests.append(("PUT", path, len(content)))
+    return Response(
+        201 if current is None else 200,
+        body={"content": {"sha": self.sha(content)}},
+    )
+
+  def delete(self, url, headers=None, json=None, timeout=None):
+    if self.latency:
+      time.sleep(self.latency)
+    path = self._path(url)
+    current = self.files.get(path)
+    self.requests.append(("DELETE", path, 0))
+    if current is None:
+      return Response(404, b'{"message": "Not Found"}')
+    if json.get("sha") != self.sha(current):
+      return Response(409, body={"message": "conflict"})
+    del self.files[path]
+    return Response(200, body={"content": None})
+
+  def __enter__(self):
+    self._saved = (requests.Session.get, requests.Session.put, requests.Session.delete)
+    requests.Session.get = lambda session, url, **kwargs: self.get(url, **kwargs)
+    requests.Session.put = lambda session, url, **kwargs: self.put(url, **kwargs)
+    requests.Session.delete = lambda session, url, **kwargs: self.delete(url, **kwargs)
+    return self
+
+  def __exit__(self, *exc):
+    requests.Session.get, requests.Session.put, requests.Session.delete = self._saved
+    self._saved = None
+    return False
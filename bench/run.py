@@ -0,0 +1,366 @@
+# --- 分析パイプラインのベンチマーク ---
+# 合成データ (bench/synth.py) を件数を変えて作り、アプリと同じ関数で
+#   load.*   : GitHub からの取得・CSV 解析 (初回 / 304 での再確認 / スナップショットから /
+#              練習・試合の並行取得)
+#   store.*  : 型付きストアの構築 (練習・試合)
+#   cube.*   : 集計キューブの構築 (練習・スプレーチャート・試合の状況別)
+#   tab1.*   : 選手ごとの 5x5 ゾーン集計と月別推移、スプレーチャート (選手ごと・チーム全体)
+#   tab2.*   : 全指標の選手ランキング (トップ3) と表彰台の 3x3 グリッド
+#   tab4.*   : 選手ごとのストライク状況別の集計とコース別ヒートマップの値、球種別の内訳
+#   save.*   : 追記の保存と、保存後の再読み込み (追加分の取り込み)、
+#              複数セッションからの同時保存 (save_queue でまとめて 1 回で保存)
+#   sql.*    : --sql を指定したとき、組み込み SQL エンジン (sql_engine.py) での表の構築とタブ1・2・4の集計
+# の所要時間を測る。Streamlit もネットワークも使わず、GitHub は bench/local_github.py で代替する。
+#
+# 使い方 (リポジトリのルートで):
+#   python -m bench.run                               # 1k / 10k / 100k 行
+#   python -m bench.run --rows 1000 1000000 --out bench.json
+#   python -m bench.run --sql sqlite                  # SQL エンジンの段階も測る
+# 結果は JSON (各段階の試行ごとの秒数と best / median) で、--out が無ければ標準出力に書く。
+# 人が読む要約は標準エラーに出す。
+import argparse
+import dataclasses
+import datetime
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+try:
+  import resource
+except ImportError:  # Windows
+  resource = None
+
+import numpy as np
+import pandas as pd
+
+import cube
+import data_layer
+import roster
+import save_queue
+import snapshot
+import split_cube
+import spray
+import sql_engine
+import swing_store
+from bench import synth
+from bench.local_github import LocalGitHub
+
+USER, REPO = "bench", "Batting-feedback"
+PRACTICE_PATH, GAME_PATH = "data.csv", "game_data.csv"
+TOKEN = "bench-token"
+DEFAULT_ROWS = [1000, 10000, 100000]
+# タブ1・4で使う指標 (アプリの既定の選択に近いもの)
+TAB1_METRIC = "バットスピード (km/h)"
+TAB4_METRIC = "バットスピード (km/h)"
+
+
+def _measure(stage, fn, repeat, setup=None, ops=1):
+  # setup は計測に含めない。ops は 1 回の試行で行う処理の数 (選手数など)
+  samples = []
+  for _ in range(repeat):
+    if setup is not None:
+      setup()
+    t0 = time.perf_counter()
+    fn()
+    samples.append(time.perf_counter() - t0)
+  return {
+      "stage": stage,
+      "ops": ops,
+      "samples": samples,
+      "best": min(samples),
+      "median": statistics.median(samples),
+  }
+
+
+def _max_rss_mb():
+  # Linux では KiB、macOS ではバイト
+  if resource is None:
+    return None
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _reset_cache(clear_snapshot=False):
+  data_layer._cache.clear()
+  if clear_snapshot:
+    shutil.rmtree(snapshot.SNAPSHOT_DIR, ignore_errors=True)
+
+
+def _load(path):
+  return data_layer.load_dataset(USER, REPO, path, TOKEN, ttl=0)
+
+
+# --- タブごとの処理 (my_app.py と同じ集計関数を呼ぶ) ---
+def _tab1(swing_cube, players):
+  for player in players:
+    pmask = swing_cube.mask(players=[player])
+    swing_cube.date_bounds(pmask)
+    swing_cube.available_metrics(pmask)
+    if TAB1_METRIC in swing_cube.metrics:
+      swing_cube.stats(pmask, TAB1_METRIC)
+      swing_cube.zone_stats(pmask, TAB1_METRIC, layout=5)
+
+
+def _tab1_spray(spray_cube, players):
+  for mask in [spray_cube.mask(players=[p]) for p in players] + [spray_cube.mask()]:
+    for metric in spray_cube.metrics:
+      spray.cell_stats(spray_cube, mask, metric)
+
+
+def _tab1_monthly(swing_cube, players):
+  if TAB1_METRIC not in swing_cube.metrics:
+    return
+  for player in players:
+    swing_cube.monthly(swing_cube.mask(players=[player]), TAB1_METRIC)
+
+
+def _tab2(swing_cube):
+  fmask = swing_cube.mask()
+  for metric in swing_cube.available_metrics():
+    if cube.UPPER_KEY in metric:
+      top3 = swing_cube.top(fmask, metric + cube.IDEAL_SUFFIX, 3)
+    else:
+      top3 = swing_cube.top(fmask, metric, 3, ascending="スイング時間" in metric)
+    for name in top3.index:
+      swing_cube.zone_stats(fmask & swing_cube.mask(players=[name]), metric)
+
+
+def _tab4(split, players):
+  # 状況別キューブ (split_cube.SplitCube) と SQL の表 (sql_engine.SqlTable) のどちらにも同じ呼び方をする
+  if TAB4_METRIC not in split.metrics:
+    return
+  for player in players:
+    pmask = split.mask(players=[player])
+    split.strike_splits(pmask, TAB4_METRIC, smaller_better=False)
+    flip = roster.PLAYER_HANDS.get(player, "右") == "左"
+    for strikes in (None, "early", "two"):
+      split.zone_stats(pmask & split.mask(strikes=strikes), TAB4_METRIC, flip=flip)
+    split.breakdown(pmask, TAB4_METRIC, by="pitch")
+
+
+def _concurrent_saves(batch, sessions):
+  # sessions 個のスレッドから同時に登録する (save_queue が 1 つのパーティションにまとめる)
+  errors = []
+
+  def save():
+    ok, message = save_queue.submit(USER, REPO, PRACTICE_PATH, batch, TOKEN)
+    if not ok:
+      errors.append(message)
+
+  threads = [threading.Thread(target=save) for _ in range(sessions)]
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  if errors:
+    raise RuntimeError(f"save_queue: {errors[0]}")
+
+
+def _sql_stages(engine, store, game_store, players, repeat):
+  # タブ1・2 は集計キューブと同じ関数を SQL の表に対して呼ぶ
+  n = len(players)
+  results = [_measure(
+      "sql.build", lambda: sql_engine.build_table(store, engine=engine), repeat,
+  )]
+  table = sql_engine.build_table(store, engine=engine)
+  game_table = sql_engine.build_table(game_store, hand_ratio=False, engine=engine)
+  results.append(_measure("sql.tab1.zones", lambda: _tab1(table, players), repeat, ops=n))
+  results.append(_measure(
+      "sql.tab1.monthly", lambda: _tab1_monthly(table, players), repeat, ops=n,
+  ))
+  results.append(_measure(
+      "sql.tab2.podium", lambda: _tab2(table), repeat, ops=len(table.available_metrics()),
+  ))
+  results.append(_measure(
+      "sql.tab4.splits", lambda: _tab4(game_table, players), repeat, ops=n,
+  ))
+  return results
+
+
+def run_scale(rows, game_rows, repeat, seed, append_rows, latency, sql=None):
+  practice = synth.practice_frame(rows, seed)
+  game = synth.game_frame(game_rows, seed)
+  files = {
+      PRACTICE_PATH: data_layer.to_csv_bytes(practice),
+      GAME_PATH: data_layer.to_csv_bytes(game),
+  }
+  batch = synth.practice_frame(append_rows, seed + 1000)
+  players = roster.PLAYERS
+  results = []
+
+  with LocalGitHub(files, latency) as github:
+    results.append(_measure(
+        "load.cold", lambda: _load(PRACTICE_PATH), repeat,
+        setup=lambda: _reset_cache(clear_snapshot=True),
+    ))
+    results.append(_measure("load.revalidate", lambda: _load(PRACTICE_PATH), repeat))
+    results.append(_measure(
+        "load.snapshot", lambda: _load(PRACTICE_PATH), repeat, setup=_reset_cache,
+    ))
+    # 練習・試合を並行して取得 (load_many)。逐次なら load.cold 2 回分かかる
+    results.append(_measure(
+        "load.both",
+        lambda: data_layer.load_many(
+            USER, REPO, TOKEN, datasets=[PRACTICE_PATH, GAME_PATH], ttl=0,
+        ),
+        repeat,
+        setup=lambda: _reset_cache(clear_snapshot=True),
+    ))
+    raw = _load(PRACTICE_PATH)
+    raw_game = _load(GAME_PATH)
+    revision = data_layer.revision(USER, REPO, PRACTICE_PATH)
+    game_revision = data_layer.revision(USER, REPO, GAME_PATH)
+
+    results.append(_measure(
+        "store.practice", lambda: swing_store.build_store(raw, revision), repeat,
+    ))
+    results.append(_measure(
+        "store.game", lambda: swing_store.build_store(raw_game, game_revision), repeat,
+    ))
+    store = swing_store.build_store(raw, revision)
+    # 分析用ストア (my_app の analysis_only=True と同じ列だけ)
+    store = dataclasses.replace(store, df=store.df[swing_store.analysis_columns(store)])
+    game_store = swing_store.build_store(raw_game, game_revision)
+
+    results.append(_measure("cube.build", lambda: cube.build_cube(store), repeat))
+    swing_cube = cube.build_cube(store)
+    n = len(players)
+    results.append(_measure("tab1.zones", lambda: _tab1(swing_cube, players), repeat, ops=n))
+    results.append(_measure(
+        "tab1.monthly", lambda: _tab1_monthly(swing_cube, players), repeat, ops=n,
+    ))
+    results.append(_measure("cube.spray", lambda: spray.build_cube(store), repeat))
+    spray_cube = spray.build_cube(store)
+    results.append(_measure(
+        "tab1.spray", lambda: _tab1_spray(spray_cube, players), repeat, ops=n + 1,
+    ))
+    results.append(_measure(
+        "tab2.podium", lambda: _tab2(swing_cube), repeat,
+        ops=len(swing_cube.available_metrics()),
+    ))
+    results.append(_measure("cube.split", lambda: split_cube.build_cube(game_store), repeat))
+    game_split = split_cube.build_cube(game_store)
+    results.append(_measure("tab4.splits", lambda: _tab4(game_split, players), repeat, ops=n))
+    if sql:
+      results.extend(_sql_stages(sql, store, game_store, players, repeat))
+
+    # 保存: 追記 → 再読み込みでストア・キューブに追加分を取り込むまで
+    key = ("bench", rows, seed)
+    swing_store.get_store(
+        key, raw, revision, analysis_only=True,
+        history=data_layer.history(USER, REPO, PRACTICE_PATH),
+    )
+    cube.get_cube(swing_store.get_store(key, raw, revision, analysis_only=True))
+    append_samples, refresh_samples = [], []
+    for _ in range(repeat):
+      t0 = time.perf_counter()
+      ok, message = data_layer.append_rows(USER, REPO, PRACTICE_PATH, batch, TOKEN)
+      append_samples.append(time.perf_counter() - t0)
+      if not ok:
+        raise RuntimeError(f"append_rows: {message}")
+      t0 = time.perf_counter()
+      raw_now = _load(PRACTICE_PATH)
+      folded = swing_store.get_store(
+          key,
+          raw_now,
+          data_layer.revision(USER, REPO, PRACTICE_PATH),
+          analysis_only=True,
+          history=data_layer.history(USER, REPO, PRACTICE_PATH),
+      )
+      cube.get_cube(folded)
+      refresh_samples.append(time.perf_counter() - t0)
+    for stage, samples in [("save.append", append_samples), ("save.refresh", refresh_samples)]:
+      results.append({
+          "stage": stage,
+          "ops": append_rows,
+          "samples": samples,
+          "best": min(samples),
+          "median": statistics.median(samples),
+      })
+    sessions = 8
+    results.append(_measure(
+        "save.concurrent", lambda: _concurrent_saves(batch, sessions), repeat, ops=sessions,
+    ))
+    requests_made = len(github.requests)
+
+  for r in results:
+    r.update(rows=rows, game_rows=game_rows)
+  return results, {
+      "rows": rows,
+      "game_rows": game_rows,
+      "csv_bytes": len(files[PRACTICE_PATH]),
+      "game_csv_bytes": len(files[GAME_PATH]),
+      "requests": requests_made,
+      "max_rss_mb": _max_rss_mb(),
+  }
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="分析パイプラインのベンチマーク")
+  parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS,
+                      help="練習データの行数 (複数指定可)")
+  parser.add_argument("--game-ratio", type=float, default=0.3,
+                      help="練習データに対する試合データの行数の比")
+  parser.add_argument("--repeat", type=int, default=3)
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--append-rows", type=int, default=30,
+                      help="1 回の保存で追記する行数")
+  parser.add_argument("--latency", type=float, default=0.0,
+                      help="GitHub 代替のリクエストごとの待ち時間 (秒)")
+  parser.add_argument("--sql", choices=["sqlite", "duckdb"],
+                      help="組み込み SQL エンジンでの集計も測る")
+  parser.add_argument("--out", help="結果の JSON の書き込み先 (省略時は標準出力)")
+  args = parser.parse_args(argv)
+
+  report = {
+      "meta": {
+          "started": datetime.datetime.now().isoformat(timespec="seconds"),
+          "python": platform.python_version(),
+          "pandas": pd.__version__,
+          "numpy": np.__version__,
+          "platform": platform.platform(),
+          "repeat": args.repeat,
+          "seed": args.seed,
+          "latency": args.latency,
+          "sql": args.sql,
+      },
+      "scales": [],
+      "results": [],
+  }
+  saved_dir = snapshot.SNAPSHOT_DIR
+  with tempfile.TemporaryDirectory(prefix="batting-bench-") as tmp:
+    snapshot.SNAPSHOT_DIR = tmp
+    try:
+      for rows in args.rows:
+        game_rows = max(1, int(rows * args.game_ratio))
+        results, scale = run_scale(
+            rows, game_rows, args.repeat, args.seed, args.append_rows, args.latency,
+            args.sql,
+        )
+        report["results"].extend(results)
+        report["scales"].append(scale)
+        for r in results:
+          print(
+              f"{rows:>9,d} rows  {r['stage']:<16} best {r['best'] * 1000:10.2f} ms"
+              f"  median {r['median'] * 1000:10.2f} ms",
+              file=sys.stderr,
+          )
+    finally:
+      snapshot.SNAPSHOT_DIR = saved_dir
+      _reset_cache()
+
+  text = json.dumps(report, ensure_ascii=False, indent=1)
+  if args.out:
+    with open(args.out, "w", encoding="utf-8") as f:
+      f.write(text)
+  else:
+    print(text)
+
+
+if __name__ == "__main__":
+  main()
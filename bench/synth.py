@@ -0,0 +1,208 @@
+# --- ベンチマーク用の合成スイングデータ ---
+# data.csv / game_data.csv と同じ列構成の行を、指定した件数だけ乱数で作る。
+# 値はすべて CSV から読んだときと同じ文字列で持ち、センサー未取得の "-"、
+# 回転方向の "NaN:00"、空欄 (欠損) も実データに近い割合で混ぜる。
+# 選手は roster.PLAYER_HANDS の全員に均等に割り振る。
+import numpy as np
+import pandas as pd
+
+import ingest
+import roster
+import zone_engine
+
+PRACTICE_COLUMNS = [
+    "time_col", "HitID", "打球速度", "投球速度", "打球角度", "打球方向", "回転数", "飛距離",
+    "回転方向", "SpinConfidence", "StrikeZoneX", "StrikeZoneY", "Contact Depth", "BatName",
+    "SerialNumber", "Unique ID", "Session Name", "日付", "バット", "利き腕", "スイング条件",
+    "オンプレーンスコア", "体とバットの角度スコア", "体の回転による加速スコア",
+    "バットスピード (km/h)", "体の回転によるバットの加速の大きさ（初動） (G)",
+    "オンプレーンの効率 (%)", "アッパースイング度 (°)", "体とバットの角度（構え） (°)",
+    "体とバットの角度（インパクト） (°)", "バット角度 (°)", "パワー (kW)", "スイング時間 (秒)",
+    "手の最大スピード (km/h)", "打球スピード (km/h)", "打球角度 (°)", "推定飛距離 (m)",
+    "DateTime", "Player Name", "試合区別", "打席", "球目", "球速", "球種", "SB", "コース",
+    "ポイント", "時間", "ストライク", "time",
+]
+GAME_COLUMNS = [
+    "time_col", "打席", "ストライク", "球速", "球種", "SB", "コース", "ポイント", "スイング条件",
+    "オンプレーンスコア", "体とバットの角度スコア", "体の回転による加速スコア",
+    "バットスピード (km/h)", "体の回転によるバットの加速の大きさ（初動） (G)",
+    "オンプレーンの効率 (%)", "アッパースイング度 (°)", "体とバットの角度（構え） (°)",
+    "体とバットの角度（インパクト） (°)", "バット角度 (°)", "パワー (kW)", "スイング時間 (秒)",
+    "手の最大スピード (km/h)", "打球スピード (km/h)", "打球角度 (°)", "推定飛距離 (m)",
+    "試合区別", "StrikeZoneX", "StrikeZoneY", "DateTime", "Player Name", "進塁打", "時間",
+    "推定飛距離 (m).1",
+]
+
+# スイングセンサーの指標: 列名 → (平均, 標準偏差, 小数桁)
+SWING_METRICS = {
+    "オンプレーンスコア": (60, 10, 0),
+    "体とバットの角度スコア": (58, 10, 0),
+    "体の回転による加速スコア": (62, 12, 0),
+    "バットスピード (km/h)": (105, 8, 1),
+    "体の回転によるバットの加速の大きさ（初動） (G)": (16, 4, 1),
+    "オンプレーンの効率 (%)": (75, 10, 0),
+    "アッパースイング度 (°)": (12, 7, 0),
+    "体とバットの角度（構え） (°)": (98, 6, 0),
+    "体とバットの角度（インパクト） (°)": (80, 7, 0),
+    "バット角度 (°)": (-28, 9, 0),
+    "パワー (kW)": (3.4, 0.6, 2),
+    "スイング時間 (秒)": (0.15, 0.015, 2),
+    "手の最大スピード (km/h)": (32, 4, 1),
+}
+# 打球計測器の指標 (練習のみ)
+BALL_METRICS = {
+    "打球速度": (140, 15, 1),
+    "投球速度": (100, 12, 1),
+    "打球角度": (15, 18, 1),
+    "打球方向": (0, 20, 1),
+    "回転数": (2000, 600, 4),
+    "飛距離": (70, 30, 1),
+    "Contact Depth": (40, 35, 1),
+}
+
+SWING_CONDITIONS = {"BP": 0.91, "SBT": 0.07, "1BT": 0.015, "Tee": 0.005}
+OPPONENTS = [
+    "西濃運輸", "東海REX", "三菱重工east", "JR九州", "三菱兵庫", "慶應義塾", "ソフトバンク",
+    "三菱岡崎", "愛工大", "ジャイアンツ", "東海理化", "立命館大学",
+]
+GAME_KINDS = {"オープン戦": 0.8, "紅白戦": 0.05, "その他": 0.15}
+STRIKES = {"0": 0.25, "1": 0.31, "2": 0.44}
+PITCHES = {
+    "ストレート": 0.6, "スライダー": 0.14, "フォーク": 0.09, "カットボール": 0.08,
+    "カーブ": 0.04, "チェンジ": 0.03, "ツーシーム": 0.02,
+}
+RESULTS = {
+    "ファウル": 0.46, "空振り": 0.06, "左安": 0.04, "中安": 0.04, "右安": 0.03, "中飛": 0.04,
+    "左飛": 0.04, "右飛": 0.03, "遊ゴロ": 0.04, "二ゴロ": 0.03, "一ゴロ": 0.02, "三ゴロ": 0.02,
+    "進塁打": 0.15,
+}
+COURSES = {
+    "外真ん中": 0.21, "外低め": 0.17, "真ん中": 0.13, "真ん中低め": 0.13, "外高め": 0.1,
+    "内真ん中": 0.09, "真ん中高め": 0.07, "内高め": 0.06, "内低め": 0.04,
+}
+POINTS = {"やや後ろ": 0.3, "前": 0.25, "やや前": 0.2, "ジャスト": 0.15, "後ろ": 0.1}
+
+# 欠損の割合: センサー未装着 (空欄)、計測失敗 ("-")、回転方向の "NaN:00"
+SWING_MISSING_RATE = 0.28
+DASH_RATE = 0.03
+CLOCK_NAN_RATE = 0.02
+
+
+def _choice(rng, weights, n):
+  keys = np.array(list(weights), dtype=object)
+  p = np.array(list(weights.values()), dtype="float64")
+  return keys[rng.choice(len(keys), size=n, p=p / p.sum())]
+
+
+def _numbers(rng, n, mean, sd, decimals):
+  # 数値を CSV と同じ文字列にする (整数指標は小数点なし)
+  values = rng.normal(mean, sd, n).round(decimals)
+  if decimals == 0:
+    return values.astype("int64").astype(str).astype(object)
+  return values.astype(str).astype(object)
+
+
+def _blank(rng, values, rate, token=np.nan):
+  return np.where(rng.random(len(values)) < rate, token, values)
+
+
+def _players(rng, n):
+  # 全選手がほぼ同じ件数になるよう、選手番号を並べてからシャッフルする
+  players = np.array(roster.PLAYERS, dtype=object)
+  return players[rng.permutation(np.resize(np.arange(len(players)), n))]
+
+
+def _dates(rng, n, start, days):
+  day = np.sort(rng.integers(0, days, n))
+  return pd.Timestamp(start) + pd.to_timedelta(day, unit="D")
+
+
+def practice_frame(n, seed=0, start="2025-11-01", days=180):
+  rng = np.random.default_rng(seed)
+  players = _players(rng, n)
+  dates = _dates(rng, n, start, days)
+  # 9:00〜18:00 のセッション内で秒単位の時刻
+  seconds = rng.integers(9 * 3600, 18 * 3600, n)
+  stamps = dates + pd.to_timedelta(seconds, unit="s")
+  order = np.lexsort((stamps.asi8, players.astype(str)))
+  order = order[np.argsort(dates.asi8[order], kind="stable")]
+  players, stamps = players[order], stamps[order]
+  date_str = stamps.strftime("%Y-%m-%d").to_numpy(dtype=object)
+  time_str = stamps.strftime("%Y-%m-%d %H:%M:%S").to_numpy(dtype=object)
+  hit_id = stamps.as_unit("s").asi8.astype(str).astype(object)
+
+  cols = {c: np.full(n, np.nan, dtype=object) for c in PRACTICE_COLUMNS}
+  cols["time_col"] = time_str
+  cols["HitID"] = hit_id
+  for c, (mean, sd, dec) in BALL_METRICS.items():
+    cols[c] = _blank(rng, _numbers(rng, n, mean, sd, dec), DASH_RATE * 8, "-")
+  clock = (
+      pd.Series(rng.integers(0, 12, n)).map("{:02d}".format)
+      + ":"
+      + pd.Series(rng.integers(0, 60, n)).map("{:02d}".format)
+      + ":00"
+  ).to_numpy(dtype=object)
+  cols["回転方向"] = _blank(rng, _blank(rng, clock, CLOCK_NAN_RATE, "NaN:00"), DASH_RATE * 6, "-")
+  cols["SpinConfidence"] = np.full(n, "1", dtype=object)
+  cols["StrikeZoneX"] = rng.uniform(-45, 45, n).round(1).astype(str).astype(object)
+  cols["StrikeZoneY"] = rng.uniform(25, 130, n).round(1).astype(str).astype(object)
+  cols["BatName"] = np.full(n, "-", dtype=object)
+  cols["SerialNumber"] = np.full(n, "V3P4CG1Q2129A", dtype=object)
+  cols["Unique ID"] = "105660@" + hit_id
+  cols["Session Name"] = np.full(n, "untitled", dtype=object)
+  cols["スイング条件"] = _choice(rng, SWING_CONDITIONS, n)
+
+  # スイングセンサーの値はセンサーを付けていない行ではまとめて空欄
+  attached = rng.random(n) >= SWING_MISSING_RATE
+  for c, (mean, sd, dec) in SWING_METRICS.items():
+    values = _blank(rng, _numbers(rng, n, mean, sd, dec), DASH_RATE, "-")
+    cols[c] = np.where(attached, values, np.nan)
+  cols["日付"] = np.where(attached, time_str, np.nan)
+  hands = np.array([roster.PLAYER_HANDS[p] for p in roster.PLAYERS], dtype=object)
+  hand_idx = pd.Index(roster.PLAYERS).get_indexer(players)
+  cols["利き腕"] = np.where(attached, hands[hand_idx], np.nan)
+  cols["バット"] = np.where(attached, np.full(n, "1", dtype=object), np.nan)
+  for c in ["打球スピード (km/h)", "打球角度 (°)", "推定飛距離 (m)"]:
+    cols[c] = np.full(n, "-", dtype=object)
+
+  cols["DateTime"] = date_str + " " + time_str
+  cols["Player Name"] = players
+  cols["試合区別"] = ingest.PRACTICE_CATEGORY
+  return pd.DataFrame(cols, columns=PRACTICE_COLUMNS)
+
+
+def game_frame(n, seed=0, start="2026-03-01", days=120):
+  rng = np.random.default_rng(seed + 1)
+  players = _players(rng, n)
+  dates = _dates(rng, n, start, days)
+  date_str = dates.strftime("%Y-%m-%d").to_numpy(dtype=object)
+  # 同じ日は同じ対戦相手
+  day_opponent = rng.integers(0, len(OPPONENTS), days)
+  day = ((dates - pd.Timestamp(start)) // pd.Timedelta(days=1)).to_numpy()
+  opponents = np.array(OPPONENTS, dtype=object)[day_opponent[day]]
+
+  cols = {c: np.full(n, np.nan, dtype=object) for c in GAME_COLUMNS}
+  cols["time_col"] = opponents
+  cols["打席"] = rng.integers(1, 6, n).astype(str).astype(object)
+  cols["ストライク"] = _choice(rng, STRIKES, n)
+  cols["球速"] = rng.integers(115, 152, n).astype(str).astype(object)
+  cols["球種"] = _choice(rng, PITCHES, n)
+  cols["SB"] = _choice(rng, RESULTS, n)
+  cols["コース"] = _choice(rng, COURSES, n)
+  cols["ポイント"] = _blank(rng, _choice(rng, POINTS, n), 0.09)
+  cols["スイング条件"] = _blank(rng, np.full(n, "Live Pitch", dtype=object), 0.7)
+  for c, (mean, sd, dec) in SWING_METRICS.items():
+    cols[c] = _numbers(rng, n, mean, sd, dec)
+  cols["試合区別"] = _choice(rng, GAME_KINDS, n)
+  # 座標は登録時と同じくコースから変換する
+  x, y = zone_engine.course_to_coords(cols["コース"])
+  cols["StrikeZoneX"] = x.astype(str).astype(object)
+  cols["StrikeZoneY"] = y.astype(str).astype(object)
+  cols["DateTime"] = date_str + " " + opponents
+  cols["Player Name"] = players
+  cols["時間"] = _blank(
+      rng,
+      (pd.Series(rng.integers(9, 18, n)).map("{:02d}".format) + ":00:00").to_numpy(dtype=object),
+      0.35,
+  )
+  return pd.DataFrame(cols, columns=GAME_COLUMNS)
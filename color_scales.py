@@ -0,0 +1,220 @@
+# --- 指標の色分け (表形式のカラースケール) ---
+# 各スケールは「境界値の並び」と「区間ごとの色」の表で表す。
+#   Fixed : 区間内は固定色
+#   Ramp  : 基準値からの距離で濃さ (intensity 0〜1) が変わるグラデーション
+# colorize は値の配列 (グリッド全体や全スイング) をまとめて区間に振り分け、
+# 区間ごとに 1 回の NumPy 演算で色を決める。RGBA 文字列は 0〜255 の表から引くだけ。
+# 色の種類 (スケール名) は metrics.color_scale が列名から決める。
+import dataclasses
+
+import numpy as np
+
+EMPTY_FILL, EMPTY_FONT = "rgba(255, 255, 255, 0.1)", "white"
+
+# グラデーションの色: 1 チャンネルを 255 に固定し、残りを x = int(255 * (1 - intensity)) にする
+_RAMP_CSS = {
+    "red": np.array([f"rgba(255, {x}, {x}, 0.9)" for x in range(256)], dtype=object),
+    "green": np.array([f"rgba({x}, 255, {x}, 0.9)" for x in range(256)], dtype=object),
+    "blue": np.array([f"rgba({x}, {x}, 255, 0.9)" for x in range(256)], dtype=object),
+}
+
+BLUE = "rgba(0, 0, 255, 0.9)"
+LIGHT_BLUE = "rgba(173, 216, 230, 0.9)"
+WHITE = "rgba(255, 255, 255, 0.9)"
+PINK = "rgba(255, 182, 193, 0.9)"
+RED = "rgba(255, 0, 0, 0.9)"
+
+
+@dataclasses.dataclass(frozen=True)
+class Fixed:
+  fill: str
+  font: str
+
+
+@dataclasses.dataclass(frozen=True)
+class Ramp:
+  channel: str  # 255 に固定するチャンネル ("red" / "green" / "blue")
+  origin: float
+  width: float
+  peak: bool = False  # True: origin で最も濃い (1 - 距離/width)。False: origin から離れるほど濃い
+  white_from: float = None  # intensity がこれ以上 (white_strict なら超える) で文字を白に
+  white_strict: bool = True
+
+  def intensity(self, v):
+    dist = np.abs(v - self.origin)
+    if self.peak:
+      return np.where(dist <= self.width, 1.0 - dist / self.width, 0.0)
+    return np.minimum(dist / self.width, 1.0)
+
+
+@dataclasses.dataclass(frozen=True)
+class Scale:
+  # edges: (境界値, 境界値ちょうどを上側の区間に含めるか)。bins は len(edges) + 1 個
+  edges: tuple
+  bins: tuple
+
+  def bin_index(self, v):
+    idx = np.zeros(v.shape, dtype="int64")
+    for value, upper_closed in self.edges:
+      idx += (v >= value) if upper_closed else (v > value)
+    return idx
+
+
+def _upper(base, low, high):
+  # アッパースイング度: 高さごとの理想範囲 [low, high]。範囲内は base で最も赤い
+  return Scale(
+      ((low, True), (high, False)),
+      (
+          Ramp("green", low, 15.0),
+          Ramp("red", base, (high - low) / 2, peak=True),
+          Ramp("blue", high, 15.0),
+      ),
+  )
+
+
+SCALES = {
+    "white": Scale((), (Fixed("#FFFFFF", "black"),)),
+    "launch_angle": Scale(
+        ((8.0, True), (22.0, False)),
+        (
+            Ramp("green", 8.0, 15.0),
+            Ramp("red", 15.0, 7.0, peak=True, white_from=0.5),
+            Ramp("blue", 22.0, 15.0, white_from=0.5),
+        ),
+    ),
+    # 152 と 153 の間は「それ以外」(赤) に入る
+    "exit_velocity": Scale(
+        ((140, True), (145, True), (152, False), (153, True), (160, False)),
+        (
+            Fixed(BLUE, "white"),
+            Fixed(LIGHT_BLUE, "black"),
+            Fixed(WHITE, "black"),
+            Fixed(RED, "white"),
+            Fixed(PINK, "black"),
+            Fixed(RED, "white"),
+        ),
+    ),
+    # 手の最大スピードはバットスピードとの比 (効率) で色分けする
+    "hand_efficiency": Scale(
+        ((2.7, True), (3.0, True), (3.2, False), (3.4, False)),
+        (
+            Fixed("rgba(0, 128, 0, 0.9)", "white"),
+            Fixed("rgba(144, 238, 144, 0.9)", "black"),
+            Ramp("red", 3.1, 0.1, peak=True, white_from=0.5),
+            Fixed(LIGHT_BLUE, "black"),
+            Fixed(BLUE, "white"),
+        ),
+    ),
+    "power": Scale(
+        ((3, True), (3.5, False), (4, False), (4.5, False)),
+        (
+            Fixed(BLUE, "white"),
+            Fixed(LIGHT_BLUE, "black"),
+            Fixed(WHITE, "black"),
+            Fixed(PINK, "black"),
+            Fixed(RED, "white"),
+        ),
+    ),
+    "rotation_accel": Scale(
+        ((5, False), (10, False), (14, False), (20, False)),
+        (
+            Fixed(BLUE, "white"),
+            Fixed(LIGHT_BLUE, "black"),
+            Fixed(WHITE, "black"),
+            Fixed(PINK, "black"),
+            Fixed(RED, "white"),
+        ),
+    ),
+    "bat_speed": Scale(
+        ((100, True), (110, False), (120, True)),
+        (
+            Fixed(BLUE, "white"),
+            Fixed(WHITE, "black"),
+            Ramp("red", 110.0, 10.0, white_from=0.6, white_strict=False),
+            Fixed(RED, "white"),
+        ),
+    ),
+    "swing_time": Scale(
+        ((0.14, True), (0.15, True), (0.16, True), (0.17, True)),
+        (
+            Fixed(RED, "white"),
+            Fixed("rgba(255, 180, 180, 0.9)", "black"),
+            Fixed(WHITE, "black"),
+            Fixed("rgba(180, 180, 255, 0.9)", "black"),
+            Fixed(BLUE, "white"),
+        ),
+    ),
+    "default": Scale(
+        ((105, False),),
+        (
+            Ramp("blue", 105.0, 30.0, white_from=0.4, white_strict=False),
+            Ramp("red", 105.0, 30.0, white_from=0.4, white_strict=False),
+        ),
+    ),
+}
+# アッパースイング度は高さ (3x3 の行: 0 高め / 1 真ん中 / 2 低め) ごとに理想範囲が違う
+UPPER_SCALES = (_upper(6.5, 3.0, 10.0), _upper(11.5, 8.0, 15.0), _upper(15.0, 10.0, 20.0))
+
+
+def _apply(scale, v, fill, font, sel):
+  idx = scale.bin_index(v)
+  for b, spec in enumerate(scale.bins):
+    m = sel & (idx == b)
+    if not m.any():
+      continue
+    if isinstance(spec, Fixed):
+      fill[m] = spec.fill
+      font[m] = spec.font
+      continue
+    intensity = spec.intensity(v[m])
+    x = np.trunc(255 * (1 - intensity)).astype("int64")
+    fill[m] = _RAMP_CSS[spec.channel][x]
+    if spec.white_from is None:
+      font[m] = "black"
+    else:
+      white = intensity > spec.white_from if spec.white_strict else intensity >= spec.white_from
+      font[m] = np.where(white, "white", "black")
+
+
+def colorize(values, scale="default", rows=None):
+  # values と同じ形の (塗り色, 文字色) の配列。0 と欠損は薄い白。
+  # rows はアッパースイング度で使う 3x3 の行 (values と同じ形・スカラーも可)
+  v = np.asarray(values, dtype="float64")
+  fill = np.full(v.shape, EMPTY_FILL, dtype=object)
+  font = np.full(v.shape, EMPTY_FONT, dtype=object)
+  sel = ~(np.isnan(v) | (v == 0))
+  if scale == "upper_swing" and rows is not None:
+    rows = np.broadcast_to(np.asarray(rows), v.shape)
+    high, middle = rows == 0, rows == 1
+    # 高め・真ん中以外の行はすべて低めの範囲
+    for upper, row_sel in zip(UPPER_SCALES, (high, middle, ~(high | middle))):
+      _apply(upper, v, fill, font, sel & row_sel)
+  else:
+    _apply(SCALES.get(scale, SCALES["default"]), v, fill, font, sel)
+  return fill, font
+
+
+def plotly_colorscale(scale, vmin, vmax, samples=33, row=None):
+  # [vmin, vmax] の値を 0〜1 に対応させた Plotly の colorscale (単一トレースのヒートマップ・散布図用)。
+  # 固定色の区間は両端、グラデーションの区間は samples 点と濃さの折れ目で表し、区間の境目は
+  # 同じ位置に両側の色を並べて段差にする (Plotly の線形補間で colorize と同じ色になる)。
+  # row はアッパースイング度の高さ (3x3 の行)
+  spec = UPPER_SCALES[row] if scale == "upper_swing" and row is not None else SCALES.get(scale, SCALES["default"])
+  if not vmax > vmin:
+    vmax = vmin + 1.0
+  bounds = [vmin] + [e for e, _ in spec.edges if vmin < e < vmax] + [vmax]
+  values = [vmin]
+  for lo, hi in zip(bounds[:-1], bounds[1:]):
+    # 区間の両端はその区間の色 (境界値ちょうどの色は vmin / vmax と段差の反対側で決まる)
+    points = [np.nextafter(lo, np.inf), np.nextafter(hi, -np.inf)]
+    b = spec.bins[spec.bin_index(np.array([(lo + hi) / 2]))[0]]
+    if isinstance(b, Ramp):
+      kinks = (b.origin - b.width, b.origin, b.origin + b.width)
+      points += list(np.linspace(lo, hi, samples)[1:-1]) + [k for k in kinks if lo < k < hi]
+    values += sorted(points)
+  values = np.array(values + [vmax])
+  positions = np.clip((values - vmin) / (vmax - vmin), 0.0, 1.0)
+  # 0 ちょうどは「データなし」の色になるので、わずかにずらす
+  values[values == 0] = np.finfo("float64").tiny
+  fill, _ = colorize(values, scale, None if row is None else np.full(len(values), row))
+  return [[float(p), c] for p, c in zip(positions, fill)]
@@ -0,0 +1,327 @@
+# --- 集計キューブ (選手 × スイング条件 × 日付 × ゾーン × 指標) ---
+# 練習データをリビジョンごとに一度だけ集計しておき、
+# タブ1・2の期間・打撃条件・指標の切り替えは生データを走査せず、
+# キューブの行 (グループ) を絞り込んで足し合わせるだけで答える。
+# 各グループ・各指標について件数 / 合計 / 二乗和 / 最小 / 最大を持つ。
+# データが追記されたリビジョンでは、追加行だけを集計して既存のキューブに足し込む。
+import dataclasses
+import threading
+
+import numpy as np
+import pandas as pd
+
+import swing_store
+import zone_engine
+
+# ゾーンは 5x5 の行・列 (欠損は -1) を +1 して 0〜5 の 6 マスで持つ
+ZONE_SLOTS = 6
+ZONE_COLS = (swing_store.ZONE_ROW5, swing_store.ZONE_COL5)
+NO_DAY = np.iinfo("int32").min
+KEY_COLS = ("player", "cond", "day", "zone")
+# グループごとの行数と、グループ × 指標ごとの件数 / 合計 / 二乗和 / 最小 / 最大
+STAT_FIELDS = ("rows", "count", "total", "sumsq", "vmin", "vmax")
+# 5x5 の行・列 → 3x3 の行・列 (先頭は欠損)
+_TO_3X3 = np.array([-1, 0, 0, 1, 2, 2])
+_TO_5X5 = np.array([-1, 0, 1, 2, 3, 4])
+
+UPPER_KEY = "アッパースイング度"
+IDEAL_SUFFIX = "::ideal"
+# アッパースイング度の理想範囲 [高め, 真ん中, 低め]
+UPPER_IDEAL_LOW = np.array([3.0, 8.0, 10.0])
+UPPER_IDEAL_HIGH = np.array([10.0, 15.0, 20.0])
+
+
+@dataclasses.dataclass(frozen=True)
+class Cube:
+  player_names: tuple
+  cond_names: tuple
+  metrics: tuple
+  player: np.ndarray  # グループごとの選手コード
+  cond: np.ndarray
+  day: np.ndarray  # 1970-01-01 からの日数 (日付なしは NO_DAY)
+  zone: np.ndarray  # zr5_slot * ZONE_SLOTS + zc5_slot
+  rows: np.ndarray  # グループ内の行数
+  count: np.ndarray  # (グループ数, 指標数)
+  total: np.ndarray
+  sumsq: np.ndarray
+  vmin: np.ndarray
+  vmax: np.ndarray
+
+  @property
+  def n_groups(self):
+    return len(self.rows)
+
+  def metric_index(self, metric):
+    return self.metrics.index(metric)
+
+  def mask(self, players=None, conds=None, start=None, end=None):
+    m = np.ones(self.n_groups, dtype=bool)
+    if players is not None:
+      m &= np.isin(self.player, _codes(self.player_names, players))
+    if conds is not None:
+      m &= np.isin(self.cond, _codes(self.cond_names, conds))
+    if start is not None:
+      m &= (self.day != NO_DAY) & (self.day >= to_day(start))
+    if end is not None:
+      m &= (self.day != NO_DAY) & (self.day <= to_day(end))
+    return m
+
+  def row_count(self, mask):
+    return int(self.rows[mask].sum())
+
+  def observed_players(self, mask=None):
+    codes = self.player if mask is None else self.player[mask]
+    return [self.player_names[i] for i in np.unique(codes)]
+
+  def available_metrics(self, mask=None):
+    count = self.count if mask is None else self.count[mask]
+    has = count.sum(axis=0) > 0
+    return [m for m, h in zip(self.metrics, has) if h and IDEAL_SUFFIX not in m]
+
+  def date_bounds(self, mask):
+    days = self.day[mask]
+    days = days[days != NO_DAY]
+    if len(days) == 0:
+      return None, None
+    return from_day(days.min()), from_day(days.max())
+
+  def stats(self, mask, metric):
+    # (件数, 平均, 最小, 最大)
+    j = self.metric_index(metric)
+    count = self.count[mask, j].sum()
+    if count == 0:
+      return 0, np.nan, np.nan, np.nan
+    return (
+        int(count),
+        self.total[mask, j].sum() / count,
+        np.nanmin(self.vmin[mask, j]),
+        np.nanmax(self.vmax[mask, j]),
+    )
+
+  def zone_stats(self, mask, metric, layout=3, flip=False):
+    j = self.metric_index(metric)
+    to_idx = _TO_3X3 if layout == 3 else _TO_5X5
+    zone = self.zone[mask]
+    return zone_engine.aggregate(
+        to_idx[zone // ZONE_SLOTS],
+        to_idx[zone % ZONE_SLOTS],
+        self.count[mask, j],
+        self.total[mask, j],
+        self.vmin[mask, j],
+        self.vmax[mask, j],
+        layout,
+        flip,
+    )
+
+  def by_player(self, mask, metric):
+    # 選手ごとの平均 (データのある選手のみ)
+    j = self.metric_index(metric)
+    n = len(self.player_names)
+    count = np.bincount(self.player[mask], weights=self.count[mask, j], minlength=n)
+    total = np.bincount(self.player[mask], weights=self.total[mask, j], minlength=n)
+    has = count > 0
+    return pd.Series(
+        total[has] / count[has],
+        index=[p for p, h in zip(self.player_names, has) if h],
+    )
+
+  def top(self, mask, metric, n=3, ascending=False):
+    # 平均の上位 n 人 (ascending=True なら小さい順)
+    return self.by_player(mask, metric).sort_values(ascending=ascending).head(n)
+
+  def monthly(self, mask, metric):
+    # 月ごとの平均・最大・最小 (Month_Sort 順)
+    j = self.metric_index(metric)
+    sel = mask & (self.day != NO_DAY) & (self.count[:, j] > 0)
+    if not sel.any():
+      return pd.DataFrame(columns=["Month_Sort", "Month_Name", "mean", "max", "min"])
+    months = self.day[sel].astype("datetime64[D]").astype("datetime64[M]")
+    uniq, inv = np.unique(months, return_inverse=True)
+    count = np.bincount(inv, weights=self.count[sel, j])
+    total = np.bincount(inv, weights=self.total[sel, j])
+    v_max = np.full(len(uniq), -np.inf)
+    v_min = np.full(len(uniq), np.inf)
+    np.maximum.at(v_max, inv, self.vmax[sel, j])
+    np.minimum.at(v_min, inv, self.vmin[sel, j])
+    month_ts = pd.DatetimeIndex(uniq)
+    return pd.DataFrame({
+        "Month_Sort": month_ts.strftime("%Y-%m"),
+        "Month_Name": [f"{m}月" for m in month_ts.month],
+        "mean": total / count,
+        "max": v_max,
+        "min": v_min,
+    })
+
+
+def _codes(names, values):
+  lookup = {n: i for i, n in enumerate(names)}
+  return np.array([lookup[v] for v in values if v in lookup], dtype="int64")
+
+
+# 日付 ↔ 1970-01-01 からの日数 (date_index・split_cube・sql_engine も同じものを使う)
+def to_day(value):
+  return int(np.datetime64(pd.Timestamp(value).date(), "D").astype("int64"))
+
+
+def from_day(day):
+  return pd.Timestamp(np.datetime64(int(day), "D")).date()
+
+
+def _metric_arrays(store, df):
+  arrays = {}
+  for metric in store.metric_cols:
+    vals = swing_store.metric_values(df, metric).to_numpy()
+    arrays[metric] = vals
+    if UPPER_KEY in metric:
+      # 高さごとの理想範囲に入ったかどうか (1/0)。高さ不明・値なしは NaN
+      r = df[swing_store.ZONE_ROW3].to_numpy()
+      ok = (vals >= UPPER_IDEAL_LOW[r]) & (vals <= UPPER_IDEAL_HIGH[r])
+      arrays[metric + IDEAL_SUFFIX] = np.where(
+          (r < 0) | np.isnan(vals), np.nan, ok.astype("float64")
+      )
+  return arrays
+
+
+def group_stats(keys, arrays):
+  # keys: 集計する行のキー (整数の列。インデックスは arrays の 0 始まりの行位置)、arrays: 指標 → 全行の値。
+  # (キーの列 → グループごとのコード, STAT_FIELDS → グループ × 指標の配列) を返す
+  gid, uniq = pd.MultiIndex.from_frame(keys).factorize()
+  n_groups = len(uniq)
+  shape = (n_groups, len(arrays))
+  count = np.zeros(shape)
+  total = np.zeros(shape)
+  sumsq = np.zeros(shape)
+  vmin = np.full(shape, np.inf)
+  vmax = np.full(shape, -np.inf)
+  positions = keys.index.to_numpy()
+  for j, vals in enumerate(arrays.values()):
+    vals = vals[positions]
+    valid = ~np.isnan(vals)
+    g, v = gid[valid], vals[valid]
+    count[:, j] = np.bincount(g, minlength=n_groups)
+    total[:, j] = np.bincount(g, weights=v, minlength=n_groups)
+    sumsq[:, j] = np.bincount(g, weights=v * v, minlength=n_groups)
+    np.minimum.at(vmin[:, j], g, v)
+    np.maximum.at(vmax[:, j], g, v)
+  vmin[count == 0] = np.nan
+  vmax[count == 0] = np.nan
+  stats = {
+      "rows": np.bincount(gid, minlength=n_groups).astype("float64"),
+      "count": count,
+      "total": total,
+      "sumsq": sumsq,
+      "vmin": vmin,
+      "vmax": vmax,
+  }
+  return _levels(uniq, keys.columns), stats
+
+
+def merge_stats(head_keys, head_stats, tail_keys, tail_stats):
+  # 同じキーのグループは件数・合計を足し、最小・最大を取り直す (引数・戻り値は group_stats と同じ形)。
+  # tail のコードは head のカテゴリを先頭にそのまま含むカテゴリに従う
+  keys = pd.DataFrame({k: np.concatenate([head_keys[k], tail_keys[k]]) for k in head_keys})
+  gid, uniq = pd.MultiIndex.from_frame(keys).factorize()
+  n_groups = len(uniq)
+
+  def add(name):
+    a, b = head_stats[name], tail_stats[name]
+    out = np.zeros((n_groups,) + a.shape[1:])
+    np.add.at(out, gid, np.concatenate([a, b]))
+    return out
+
+  def pick(name, ufunc):
+    a, b = head_stats[name], tail_stats[name]
+    out = np.full((n_groups,) + a.shape[1:], np.nan)
+    ufunc.at(out, gid, np.concatenate([a, b]))
+    return out
+
+  stats = {name: add(name) for name in ("rows", "count", "total", "sumsq")}
+  stats["vmin"] = pick("vmin", np.fmin)
+  stats["vmax"] = pick("vmax", np.fmax)
+  return _levels(uniq, keys.columns), stats
+
+
+def stat_arrays(cube):
+  return {name: getattr(cube, name) for name in STAT_FIELDS}
+
+
+def _levels(uniq, columns):
+  return {name: np.asarray(uniq.get_level_values(i), dtype="int64") for i, name in enumerate(columns)}
+
+
+def build_cube(store, df=None, zone_cols=ZONE_COLS, metric_arrays=None):
+  # df を渡すと (追加行などの) 一部の行だけを集計する。選手・条件のコードは store のカテゴリに従う。
+  # zone_cols はゾーンの軸にする 5x5 の (行, 列) の列、metric_arrays は (store, df) -> {指標: 値}
+  # (スプレーチャートは打球のマスと打球の指標で同じキューブを作る。spray.py)
+  if df is None:
+    df = store.df
+  player = df[store.player_col].astype("category")
+  cond = df[store.cond_col].astype("category")
+  day = df[swing_store.DATE_COL].to_numpy().astype("datetime64[D]")
+  row_col, col_col = zone_cols
+  keys = pd.DataFrame({
+      "player": player.cat.codes.to_numpy(),
+      "cond": cond.cat.codes.to_numpy(),
+      "day": np.where(np.isnat(day), NO_DAY, day.astype("int64")).astype("int64"),
+      "zone": (df[row_col].to_numpy().astype("int64") + 1) * ZONE_SLOTS + (
+          df[col_col].to_numpy().astype("int64") + 1
+      ),
+  })
+  # 選手が欠損している行はどの選手にも属さないので除外する
+  keys = keys[keys["player"] >= 0]
+  arrays = (metric_arrays or _metric_arrays)(store, df)
+  group_keys, stats = group_stats(keys, arrays)
+  return Cube(
+      tuple(player.cat.categories),
+      tuple(cond.cat.categories),
+      tuple(arrays),
+      **group_keys,
+      **stats,
+  )
+
+
+def merge_cubes(head, tail):
+  # tail の選手・条件のカテゴリは head のカテゴリを先頭にそのまま含む
+  group_keys, stats = merge_stats(
+      {k: getattr(head, k) for k in KEY_COLS}, stat_arrays(head),
+      {k: getattr(tail, k) for k in KEY_COLS}, stat_arrays(tail),
+  )
+  return Cube(tail.player_names, tail.cond_names, head.metrics, **group_keys, **stats)
+
+
+# --- リビジョン単位のメモ化 ---
+_cubes = {}
+_lock = threading.Lock()
+
+
+def memoized(cache, key, store, build, merge, reusable=None):
+  # cache: key -> (リビジョン, 集計)。同じリビジョンならそのまま返し、親リビジョンの集計があれば
+  # 追加行だけを build(store, tail) して merge(集計, 追加分) で足し込む。
+  # reusable(集計) が False のとき (指標の列が変わったなど) は足し込まずに作り直す
+  with _lock:
+    cached = cache.get(key)
+  if cached is not None and store.revision is not None and cached[0] == store.revision:
+    return cached[1]
+  if (
+      cached is not None
+      and store.parent_revision is not None
+      and cached[0] == store.parent_revision
+      and (reusable is None or reusable(cached[1]))
+  ):
+    # 追記されたリビジョン → 追加行だけを集計して足し込む
+    tail = store.df.iloc[store.parent_rows:]
+    built = cached[1]
+    if not tail.empty:
+      built = merge(built, build(store, tail))
+  else:
+    built = build(store)
+  if store.revision is not None and store.key is not None:
+    with _lock:
+      cache[key] = (store.revision, built)
+  return built
+
+
+def get_cube(store, build=build_cube):
+  # build を変えたキューブ (スプレーチャートなど) は別々にメモ化する
+  key = store.key if build is build_cube else (store.key, build.__module__)
+  return memoized(_cubes, key, store, build, merge_cubes)
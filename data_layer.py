@@ -0,0 +1,411 @@
+# --- データ取得レイヤー ---
+# Streamlit の再実行ごとに CSV 全体をダウンロードしないよう、
+# 解析済み DataFrame をプロセス共通でキャッシュする。
+# 鮮度確認は ETag を使った条件付きリクエスト (変更がなければ 304) で行い、
+# さらに FRESHNESS_TTL_SEC 以内の再実行ではリクエスト自体を省略する。
+#
+# --- 追記型の保存形式 ---
+# data.csv 本体は書き換えず、登録ごとに新しいパーティションファイルを
+#   data_parts/20260210-103647-1a2b3c4d.csv
+# として追加し、data_parts/manifest.json に一覧を記録する。
+# 読み込み時は本体 + マニフェストに載ったパーティションを結合する。
+# パーティションは一度書いたら変更しないので、取得後は無期限にキャッシュする。
+#
+# 新しいパーティションが増えただけのときは、既存の結合済みデータの後ろに
+# 新しい行だけを連結する。データセットのエントリには「以前のリビジョン → その時点の行数」
+# の履歴を持たせ、ストアや集計キューブはそこから追加分だけを取り込む。
+#
+# 取得した CSV は ETag と一緒に Parquet スナップショットとしても保存し (snapshot.py)、
+# プロセス再起動直後でも条件付きリクエスト → 304 ならスナップショットを使う。
+#
+# 実際の読み書きは storage.py の保存先 (GitHub / ローカル / SQLite) に任せる。
+# CSV は受信しながら解析し (ダウンロードの完了を待たない)、複数のデータセットや
+# パーティションは load_many / load_dataset がスレッドで並行して取得する。
+#
+# 旧形式のファイル (toyota_baseball_db.csv) は変換関数を渡すと本体の前に結合し、
+# 同じデータセットの一部として扱う (リビジョンには旧形式の ETag も含める)。
+import concurrent.futures
+import datetime
+import functools
+import io
+import json
+import random
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+import snapshot
+import storage
+
+FRESHNESS_TTL_SEC = 20.0
+MAX_WORKERS = storage.POOL_SIZE
+# マニフェスト更新の競合時の再試行 (回数と、2 回目以降の待ち時間の基準。毎回倍にする)
+SAVE_ATTEMPTS = 5
+SAVE_BACKOFF_SEC = 0.2
+
+_cache = {}  # (種別, user, repo, path) -> {"etag", "value", "checked_at"}
+_lock = threading.Lock()
+
+
+def partition_dir(path):
+  return f"{path.rsplit('.', 1)[0]}_parts"
+
+
+def manifest_path(path):
+  return f"{partition_dir(path)}/manifest.json"
+
+
+def backend(user, repo, token):
+  return storage.get_backend(user, repo, token)
+
+
+def parse_csv(content):
+  # content は bytes か、受信中の本文を読むファイルオブジェクト
+  if isinstance(content, bytes):
+    content = io.BytesIO(content)
+  df = pd.read_csv(content, dtype=str, encoding="utf-8-sig")
+  df.columns = df.columns.str.strip()
+  return df
+
+
+def parse_manifest(content):
+  return json.loads(content.decode("utf-8")).get("partitions", [])
+
+
+def _restore_snapshot(key):
+  meta, df = snapshot.read("files", key)
+  if meta is None:
+    return None
+  return {"etag": meta.get("etag"), "value": df, "checked_at": float("-inf")}
+
+
+def _load_file(user, repo, path, token, ttl, parse, default, persist=False, stream=False):
+  key = ("file", user, repo, path)
+  with _lock:
+    entry = _cache.get(key)
+  if entry is None and persist:
+    entry = _restore_snapshot(key)
+    if entry is not None:
+      with _lock:
+        _cache[key] = entry
+  now = time.monotonic()
+  # ttl が無限大のファイル (パーティション) は一度取得すれば再確認しない
+  if entry is not None and (
+      ttl == float("inf") or now - entry["checked_at"] < ttl
+  ):
+    return entry["value"]
+
+  fallback = entry["value"] if entry is not None else default
+  res = backend(user, repo, token).read(
+      path, entry["etag"] if entry is not None else None, stream=stream
+  )
+  if res.status == storage.NOT_MODIFIED and entry is not None:
+    with _lock:
+      entry["checked_at"] = now
+    return entry["value"]
+  if res.status == storage.MISSING:
+    # 未作成のファイル (パーティション未登録など) も「空」としてキャッシュする
+    value, etag = default, None
+  elif res.status != storage.OK:
+    return fallback
+  else:
+    try:
+      value = parse(res.content)
+    except Exception:
+      return fallback
+    finally:
+      if stream:
+        res.content.close()
+    etag = res.etag
+    if persist and etag:
+      snapshot.write("files", key, value, {"etag": etag})
+
+  with _lock:
+    _cache[key] = {"etag": etag, "value": value, "checked_at": now}
+  return value
+
+
+def load_csv(user, repo, path, token, ttl=FRESHNESS_TTL_SEC):
+  return _load_file(
+      user, repo, path, token, ttl, parse_csv, pd.DataFrame(), persist=True,
+      stream=True,
+  )
+
+
+def _load_partition(user, repo, part_path, token):
+  # パーティションは不変なので一度取得したら再確認しない
+  return _load_file(
+      user,
+      repo,
+      part_path,
+      token,
+      float("inf"),
+      parse_csv,
+      pd.DataFrame(),
+      persist=True,
+      stream=True,
+  )
+
+
+def _file_etag(user, repo, path):
+  entry = _cache.get(("file", user, repo, path))
+  return entry["etag"] if entry is not None else None
+
+
+def load_dataset(user, repo, path, token, ttl=FRESHNESS_TTL_SEC, legacy=None):
+  # 本体 CSV + 追記パーティションを結合したデータ。
+  # legacy = (旧形式のパス, 変換関数) を渡すと、変換した旧形式の行を先頭に加える
+  key = ("dataset", user, repo, path)
+  with _lock:
+    entry = _cache.get(key)
+  now = time.monotonic()
+  if entry is not None and now - entry["checked_at"] < ttl:
+    return entry["value"]
+
+  if legacy is None:
+    base = load_csv(user, repo, path, token, ttl=0)
+  else:
+    base, old = _map(
+        lambda load: load(),
+        [
+            lambda: load_csv(user, repo, path, token, ttl=0),
+            lambda: _load_migrated(user, repo, legacy, token),
+        ],
+    )
+  partitions = _load_file(
+      user, repo, manifest_path(path), token, 0, parse_manifest, []
+  )
+  with _lock:
+    base_etag = _file_etag(user, repo, path)
+    if legacy is not None:
+      base_etag = f"{base_etag}+{_file_etag(user, repo, legacy[0])}"
+    rev = f"{base_etag}|{_file_etag(user, repo, manifest_path(path))}"
+  if entry is not None and entry["etag"] == rev:
+    with _lock:
+      entry["checked_at"] = now
+    return entry["value"]
+
+  parts = tuple(part["file"] for part in partitions)
+  if (
+      entry is not None
+      and entry["base_etag"] == base_etag
+      and entry["parts"] == parts[: len(entry["parts"])]
+  ):
+    # 本体が同じでパーティションが増えただけ → 追加分だけを後ろに連結する
+    frames = [entry["value"]]
+    new_parts = parts[len(entry["parts"]):]
+    history = dict(entry["history"], **{entry["etag"]: len(entry["value"])})
+  else:
+    frames = [base if legacy is None else _prepend_legacy(old, base)]
+    new_parts = parts
+    history = {}
+  frames.extend(
+      part_df
+      for part_df in _map(
+          lambda name: _load_partition(
+              user, repo, f"{partition_dir(path)}/{name}", token
+          ),
+          new_parts,
+      )
+      if not part_df.empty
+  )
+  df = _concat(frames)
+
+  with _lock:
+    _cache[key] = {
+        "etag": rev,
+        "value": df,
+        "checked_at": now,
+        "base_etag": base_etag,
+        "parts": parts,
+        "history": history,
+    }
+  return df
+
+
+# --- 旧形式のデータ ---
+# 変換済みの行は旧形式ファイルの ETag ごとに一度だけ作る (変換は ingest.migrate_legacy など)
+def _load_migrated(user, repo, legacy, token):
+  path, migrate = legacy
+  raw = load_csv(user, repo, path, token, ttl=0)
+  key = ("migrated", user, repo, path)
+  with _lock:
+    etag = _file_etag(user, repo, path)
+    entry = _cache.get(key)
+  if entry is not None and etag is not None and entry["etag"] == etag:
+    return entry["value"]
+  value = migrate(raw)
+  with _lock:
+    _cache[key] = {"etag": etag, "value": value}
+  return value
+
+
+def _prepend_legacy(old, base):
+  # 旧形式の行は先頭に置く (登録は常に末尾に追記されるので、追加分の取り込みはそのまま使える)。
+  # 列の並びは本体に合わせ、旧形式にだけある列は後ろに付ける
+  df = _concat([old, base])
+  if old.empty or base.empty:
+    return df
+  extra = [c for c in old.columns if c not in base.columns]
+  return df[list(base.columns) + extra]
+
+
+def _map(fn, items):
+  # 順序を保ったまま並行して実行する (1 件以下ならそのまま呼ぶ)
+  items = list(items)
+  if len(items) <= 1:
+    return [fn(item) for item in items]
+  with concurrent.futures.ThreadPoolExecutor(
+      max_workers=min(MAX_WORKERS, len(items))
+  ) as pool:
+    return list(pool.map(fn, items))
+
+
+def load_many(
+    user, repo, token, datasets=(), files=(), ttl=FRESHNESS_TTL_SEC, legacy=None
+):
+  # 複数のデータセット (本体 + パーティション) と単独の CSV を並行して取得・解析する。
+  # 結果は {パス: DataFrame}。それぞれのキャッシュにも入るので、直後の load_dataset /
+  # load_csv はリクエストせずに同じものを返す。legacy はデータセットのパス → load_dataset の legacy
+  legacy = legacy or {}
+  jobs = [
+      (path, functools.partial(load_dataset, legacy=legacy.get(path)))
+      for path in datasets
+  ] + [(path, load_csv) for path in files]
+  results = _map(lambda job: job[1](user, repo, job[0], token, ttl=ttl), jobs)
+  return {path: df for (path, _), df in zip(jobs, results)}
+
+
+def _concat(frames):
+  frames = [f for f in frames if not f.empty]
+  if not frames:
+    return pd.DataFrame()
+  if len(frames) == 1:
+    return frames[0]
+  return pd.concat(frames, ignore_index=True)
+
+
+def revision(user, repo, path):
+  # キャッシュ済みデータセットのリビジョン (本体とマニフェストの ETag)。未取得なら None
+  with _lock:
+    entry = _cache.get(("dataset", user, repo, path))
+  return entry["etag"] if entry is not None else None
+
+
+def history(user, repo, path):
+  # 以前のリビジョン → その時点の行数。現在のデータはそれらの行を先頭にそのまま含む
+  with _lock:
+    entry = _cache.get(("dataset", user, repo, path))
+  return dict(entry["history"]) if entry is not None else {}
+
+
+def to_csv_bytes(df):
+  save_df = df.copy()
+  for col in save_df.columns:
+    save_df[col] = (
+        save_df[col].astype(str).replace("nan", "").replace("NaT", "")
+    )
+  return save_df.to_csv(index=False).encode("utf-8-sig")
+
+
+def _manifest_entry(name, df):
+  entry = {
+      "file": name,
+      "rows": int(len(df)),
+      "created": datetime.datetime.now().isoformat(timespec="seconds"),
+  }
+  if "Player Name" in df.columns:
+    entry["players"] = sorted(
+        df["Player Name"].dropna().astype(str).unique().tolist()
+    )
+  if "DateTime" in df.columns:
+    dates = df["DateTime"].dropna().astype(str).str[:10]
+    if not dates.empty:
+      entry["dates"] = [dates.min(), dates.max()]
+  return entry
+
+
+def _manifest_bytes(partitions):
+  return json.dumps(
+      {"partitions": partitions}, ensure_ascii=False, indent=1
+  ).encode("utf-8")
+
+
+def append_rows(user, repo, path, new_df, token):
+  # 新しい行だけをパーティションとして書き込み、マニフェストに追記する
+  store = backend(user, repo, token)
+  now = datetime.datetime.now()
+  name = f"{now:%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}.csv"
+  part_path = f"{partition_dir(path)}/{name}"
+  part_bytes = to_csv_bytes(new_df)
+  res = store.write(part_path, part_bytes, f"Add data {now}")
+  if res.status not in [storage.OK, storage.CREATED]:
+    return False, f"エラー {res.status}"
+  part_sha = res.sha
+
+  # マニフェストは前回の保存で覚えた SHA と内容を使い、他の端末が先に更新していて
+  # 競合したときだけ取り直して、自分のパーティションだけを追記し直す (パーティションは書き直さない)。
+  # 取り直しても続けて競合する (同時に保存が集中している) ときは間隔を空ける。
+  # 競合し続けてマニフェストに載せられなかったパーティションは誰も読まないので消しておく
+  # (通信エラーのときはマニフェストが更新されたかどうか分からないので残す)
+  m_path = manifest_path(path)
+  for attempt in range(SAVE_ATTEMPTS):
+    if attempt >= 2:
+      time.sleep(SAVE_BACKOFF_SEC * 2 ** (attempt - 2) * (1 + random.random()))
+    res = store.read_for_update(m_path, fresh=attempt > 0)
+    if res.status == storage.OK:
+      sha, partitions = res.sha, parse_manifest(res.content)
+    elif res.status == storage.MISSING:
+      sha, partitions = None, []
+    else:
+      store.delete(part_path, f"Remove unsaved data {now}", part_sha)
+      return False, f"マニフェスト取得エラー {res.status}"
+    partitions.append(_manifest_entry(name, new_df))
+    res = store.write(
+        m_path, _manifest_bytes(partitions), f"Update manifest {now}", sha=sha
+    )
+    if not storage.is_conflict(res.status):
+      break
+  if res.status not in [storage.OK, storage.CREATED]:
+    if storage.is_conflict(res.status):
+      store.delete(part_path, f"Remove unsaved data {now}", part_sha)
+    return False, f"マニフェスト更新エラー {res.status}"
+  _publish_append(user, repo, path, part_path, parse_csv(part_bytes), partitions)
+  return True, "成功"
+
+
+def _publish_append(user, repo, path, part_path, part_df, partitions):
+  # 保存した行をキャッシュ済みのデータセットに直接連結し、新しいリビジョンとして公開する。
+  # 次回の読み込みはダウンロードし直さず、ストア・キューブも追加分だけを取り込む。
+  # マニフェストは ETag を捨てて次回必ず取り直す (本当の ETag に置き換わる)
+  ds_key = ("dataset", user, repo, path)
+  with _lock:
+    entry = _cache.get(ds_key)
+    if entry is None:
+      for key in [("file", user, repo, path), ("file", user, repo, manifest_path(path))]:
+        _cache.pop(key, None)
+      return
+    now = time.monotonic()
+    _cache[("file", user, repo, part_path)] = {
+        "etag": None, "value": part_df, "checked_at": now,
+    }
+    _cache[("file", user, repo, manifest_path(path))] = {
+        "etag": None, "value": partitions, "checked_at": float("-inf"),
+    }
+    name = part_path.rsplit("/", 1)[-1]
+    if tuple(p["file"] for p in partitions) != entry["parts"] + (name,):
+      # 他の端末が同時に追記したパーティションが自分の分より前にある → ここでは公開しない。
+      # 次回の読み込みでマニフェストの順に追加分を連結する (自分の分はキャッシュ済み)
+      entry["checked_at"] = float("-inf")
+      return
+    rev = f"{entry['base_etag']}|local-{name}"
+    _cache[ds_key] = {
+        "etag": rev,
+        "value": _concat([entry["value"], part_df]),
+        "checked_at": now,
+        "base_etag": entry["base_etag"],
+        "parts": entry["parts"] + (name,),
+        "history": dict(entry["history"], **{entry["etag"]: len(entry["value"])}),
+    }
@@ -0,0 +1,89 @@
+# --- 選手ごとの日付索引 ---
+# ストアの行位置を (選手, 日付) の順に並べた配列を、データのリビジョンごとに一度だけ作る。
+# 選手の全データ・期間の絞り込みは、毎回の再実行で全行を比較する代わりに
+# 選手の区間の中を二分探索して取り出す (返す行位置は元の並び順)。
+# 日付はストア構築時に解析済みの DATE_COL (swing_store.py) を使う。
+import dataclasses
+import threading
+
+import numpy as np
+
+import cube
+import swing_store
+
+NO_DAY = np.iinfo("int64").min  # 日付なし。並べると選手の区間の先頭に来る
+
+
+@dataclasses.dataclass(frozen=True)
+class DateIndex:
+  player_names: tuple
+  starts: np.ndarray  # 選手コード i の区間は order[starts[i]:starts[i + 1]]
+  order: np.ndarray  # (選手, 日付) 順の行位置
+  days: np.ndarray  # order と同じ並びの 1970-01-01 からの日数
+  revision: object = None
+
+  def _span(self, player):
+    try:
+      i = self.player_names.index(player)
+    except ValueError:
+      return 0, 0
+    return self.starts[i], self.starts[i + 1]
+
+  def rows(self, player, start=None, end=None):
+    # 選手の行位置 (元の並び順)。期間を指定すると日付なしの行は含めない
+    lo, hi = self._span(player)
+    if start is not None or end is not None:
+      days = self.days[lo:hi]
+      first = NO_DAY + 1 if start is None else cube.to_day(start)
+      last = np.iinfo("int64").max if end is None else cube.to_day(end)
+      lo, hi = (
+          lo + np.searchsorted(days, first, side="left"),
+          lo + np.searchsorted(days, last, side="right"),
+      )
+    return np.sort(self.order[lo:max(lo, hi)])
+
+  def bounds(self, player):
+    # 日付のある行の最初と最後の日 (無ければ None, None)
+    lo, hi = self._span(player)
+    days = self.days[lo:hi]
+    days = days[days != NO_DAY]
+    if len(days) == 0:
+      return None, None
+    return cube.from_day(days[0]), cube.from_day(days[-1])
+
+
+def build_index(store):
+  df = store.df
+  if store.empty or store.player_col not in df.columns:
+    empty = np.zeros(0, dtype="int64")
+    return DateIndex((), np.zeros(1, dtype="int64"), empty, empty, store.revision)
+  player = df[store.player_col].astype("category")
+  codes = player.cat.codes.to_numpy().astype("int64")
+  day = df[swing_store.DATE_COL].to_numpy().astype("datetime64[D]")
+  day_int = np.where(np.isnat(day), NO_DAY, day.astype("int64"))
+  # 選手が欠損している行はどの選手にも属さないので除外する
+  has_player = np.flatnonzero(codes >= 0)
+  order = has_player[np.lexsort((day_int[has_player], codes[has_player]))]
+  starts = np.searchsorted(codes[order], np.arange(len(player.cat.categories) + 1))
+  return DateIndex(
+      tuple(player.cat.categories), starts, order, day_int[order], store.revision
+  )
+
+
+# --- リビジョン単位のメモ化 ---
+# 並べ替えは全行でも一瞬なので、追記されたリビジョンでも作り直す
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_index(store):
+  key = store.key
+  with _lock:
+    cached = _indexes.get(key)
+  if cached is not None and store.revision is not None and cached.revision == store.revision:
+    return cached
+  index = build_index(store)
+  if store.revision is not None and key is not None:
+    with _lock:
+      _indexes[key] = index
+  return index
@@ -0,0 +1,78 @@
+# --- 登録済みの行の索引 (重複登録の防止) ---
+# データセットの全行のキー (ingest.row_keys のハッシュ) を並べ替えた配列として持ち、
+# 新しく登録する行が登録済みかどうかを二分探索で調べる (CSV 全体は走査しない)。
+# 索引はデータのリビジョンごとに一度だけ作り、スナップショット (snapshot.py) にも保存する。
+# 追記されただけのリビジョンでは追加行のキーだけを足す。
+import dataclasses
+import threading
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import snapshot
+
+
+@dataclasses.dataclass(frozen=True)
+class Index:
+  hashes: np.ndarray  # 並べ替え済み・重複なしの uint64
+  rows: int  # 索引に含めたデータセットの行数
+  revision: object = None
+
+  def contains(self, hashes):
+    if len(self.hashes) == 0:
+      return np.zeros(len(hashes), dtype=bool)
+    pos = np.searchsorted(self.hashes, hashes).clip(max=len(self.hashes) - 1)
+    return self.hashes[pos] == hashes
+
+  def duplicates(self, new_df):
+    # 登録済みの行と、アップロード内で同じキーが 2 回目以降に出てくる行 (行ごとのキーのみ)
+    hashes, by_row = ingest.row_keys(new_df)
+    dup = self.contains(hashes)
+    dup |= by_row & pd.Series(hashes).duplicated().to_numpy()
+    return dup
+
+
+def build_index(raw, revision=None):
+  hashes, _ = ingest.row_keys(raw)
+  return Index(np.unique(hashes), len(raw), revision)
+
+
+def _fold(index, raw, revision):
+  hashes, _ = ingest.row_keys(raw.iloc[index.rows:])
+  return Index(np.union1d(index.hashes, hashes), len(raw), revision)
+
+
+def _restore(key, revision):
+  meta, df = snapshot.read("dedup", key)
+  if meta is None or meta.get("revision") != revision:
+    return None
+  return Index(df["hash"].to_numpy(dtype="uint64"), meta["rows"], revision)
+
+
+# --- リビジョン単位のメモ化 ---
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_index(key, raw, revision, history=None):
+  # history: 以前のリビジョン → その時点の行数 (data_layer.history)
+  with _lock:
+    cached = _indexes.get(key)
+  if cached is not None and revision is not None and cached.revision == revision:
+    return cached
+  index = None
+  if cached is not None and history and history.get(cached.revision) == cached.rows:
+    index = _fold(cached, raw, revision)
+  if index is None and revision is not None:
+    index = _restore(key, revision)
+  if index is None:
+    index = build_index(raw, revision)
+  if revision is not None:
+    snapshot.write(
+        "dedup", key, pd.DataFrame({"hash": index.hashes}),
+        {"revision": revision, "rows": index.rows},
+    )
+    with _lock:
+      _indexes[key] = index
+  return index
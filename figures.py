@@ -0,0 +1,291 @@
+# --- 図の組み立て (Plotly) ---
+# マスごと・スイングごとに shape / annotation / trace を追加すると、
+# 図の JSON とブラウザの描画時間がデータ量に比例して増える。
+# ここでは
+#   ・ゾーンの色分けは 1 つの Heatmap (マスごとの色は離散カラースケールで指定)
+#   ・数値ラベルは 1 つの文字だけの Scatter (文字色は配列で指定)
+#   ・マスの枠線は 1 本の path
+#   ・スイングの点は 1 つの Scattergl (WebGL)
+#   ・スプレーチャートの扇形のマスは 1 つの Barpolar
+# にまとめ、点の数が POINT_BUDGET を超える場合はサーバー側で間引いてから送る。
+#
+# 組み立てた図と元の集計グリッドは (データのリビジョン, 選手, 絞り込み条件, 指標) を
+# キーに FigureCache へ保存し、同じ表示に戻ったときは辞書の参照だけで済ませる。
+import collections
+import os
+import sys
+import threading
+
+import numpy as np
+import plotly.graph_objects as go
+
+POINT_BUDGET = int(os.environ.get("BATTING_POINT_BUDGET", "4000"))
+FIGURE_CACHE_MB = float(os.environ.get("BATTING_FIGURE_CACHE_MB", "64"))
+
+
+def decimate(n, budget=POINT_BUDGET, seed=0):
+  # 表示する行の位置 (昇順)。budget 以下ならすべて。再実行しても同じ点が選ばれるよう乱数は固定
+  if budget is None or n <= budget:
+    return np.arange(n)
+  rng = np.random.default_rng(seed)
+  return np.sort(rng.choice(n, size=budget, replace=False))
+
+
+def add_points(fig, x, y, colors, size=14, line_color="white", line_width=1.2, colorscale=None):
+  # colorscale = (Plotly の colorscale, cmin, cmax) を渡すと colors は値の配列として色を付ける
+  # (color_scales.plotly_colorscale。点ごとの色の文字列を作らない)
+  marker = dict(size=size, line=dict(width=line_width, color=line_color))
+  if colorscale is None:
+    marker["color"] = list(colors)
+  else:
+    scale, cmin, cmax = colorscale
+    marker.update(color=np.asarray(colors), colorscale=scale, cmin=cmin, cmax=cmax)
+  fig.add_trace(
+      go.Scattergl(
+          x=np.asarray(x),
+          y=np.asarray(y),
+          mode="markers",
+          marker=marker,
+          showlegend=False,
+      )
+  )
+  return fig
+
+
+def _discrete_colorscale(colors):
+  # z = マス番号 0..n-1 がそのマスの色になるカラースケール
+  n = len(colors)
+  if n == 1:
+    return [[0.0, colors[0]], [1.0, colors[0]]]
+  return [[i / (n - 1), c] for i, c in enumerate(colors)]
+
+
+def grid_path(x_edges, y_edges):
+  # マスの枠線をまとめた 1 本の SVG path
+  x0, x1 = x_edges[0], x_edges[-1]
+  y0, y1 = y_edges[0], y_edges[-1]
+  segs = [f"M {x} {y0} L {x} {y1}" for x in x_edges]
+  segs += [f"M {x0} {y} L {x1} {y}" for y in y_edges]
+  return " ".join(segs)
+
+
+def add_grid(
+    fig,
+    colors,
+    x_edges,
+    y_edges,
+    labels=None,
+    font_colors=None,
+    hover=None,
+    line=None,
+    font_size=14,
+    label_offset=0.0,
+    sublabels=None,
+    sub_font_size=10,
+    sub_offset=0.0,
+):
+  # colors / labels / font_colors / hover は (行, 列) の 2 次元配列で、行 0 が上 (高め)。
+  # x_edges は左から、y_edges は上から並べたマスの境界。
+  # labels の空文字のマスには文字を出さない。line は枠線の dict (None なら枠線なし)
+  colors = np.asarray(colors, dtype=object)
+  n_rows, n_cols = colors.shape
+  x_edges = np.asarray(x_edges, dtype="float64")
+  y_edges = np.asarray(y_edges, dtype="float64")
+  # Heatmap は y が昇順なので、行を下から並べ直して渡す
+  z = np.arange(n_rows * n_cols).reshape(n_rows, n_cols)[::-1]
+  heat = dict(
+      z=z,
+      x=x_edges,
+      y=y_edges[::-1],
+      colorscale=_discrete_colorscale(list(colors.ravel())),
+      zmin=0,
+      zmax=max(n_rows * n_cols - 1, 1),
+      showscale=False,
+  )
+  if hover is not None:
+    heat.update(hovertext=np.asarray(hover, dtype=object)[::-1], hoverinfo="text")
+  else:
+    heat.update(hoverinfo="skip")
+  fig.add_trace(go.Heatmap(**heat))
+
+  if line is not None:
+    fig.add_shape(type="path", path=grid_path(x_edges, y_edges), line=line)
+
+  cx = (x_edges[:-1] + x_edges[1:]) / 2
+  cy = (y_edges[:-1] + y_edges[1:]) / 2
+  cell_h = np.abs(np.diff(y_edges))
+  if font_colors is None:
+    font_colors = np.full(colors.shape, "black", dtype=object)
+  font_colors = np.asarray(font_colors, dtype=object)
+  text_rows = [
+      (labels, font_size, label_offset, "bold"),
+      (sublabels, sub_font_size, sub_offset, "normal"),
+  ]
+  for texts, size, offset, weight in text_rows:
+    if texts is None:
+      continue
+    texts = np.asarray(texts, dtype=object)
+    r, c = np.nonzero(texts != "")
+    if len(r) == 0:
+      continue
+    fig.add_trace(
+        go.Scatter(
+            x=cx[c],
+            y=cy[r] + offset * cell_h[r],
+            text=list(texts[r, c]),
+            mode="text",
+            textfont=dict(size=size, color=list(font_colors[r, c]), weight=weight),
+            hoverinfo="skip",
+            showlegend=False,
+        )
+    )
+  return fig
+
+
+def add_fan(
+    fig,
+    colors,
+    angle_edges,
+    radius_edges,
+    labels=None,
+    font_colors=None,
+    hover=None,
+    line=None,
+    font_size=12,
+):
+  # 扇形のマス (スプレーチャート) を 1 つの Barpolar と 1 つの文字だけの Scatterpolar で描く。
+  # colors / labels / font_colors / hover は (半径の段, 角度) の 2 次元配列で、行 0 が中心側。
+  # 角度は 0° が真上、右回りが正 (layout の polar は呼び出し側で設定する)
+  colors = np.asarray(colors, dtype=object)
+  n_rings, n_sectors = colors.shape
+  angle_edges = np.asarray(angle_edges, dtype="float64")
+  radius_edges = np.asarray(radius_edges, dtype="float64")
+  theta = np.tile((angle_edges[:-1] + angle_edges[1:]) / 2, n_rings)
+  width = np.tile(np.diff(angle_edges), n_rings)
+  base = np.repeat(radius_edges[:-1], n_sectors)
+  r = np.repeat(np.diff(radius_edges), n_sectors)
+  bar = dict(
+      r=r,
+      base=base,
+      theta=theta,
+      width=width,
+      marker=dict(color=list(colors.ravel()), line=line or dict(width=0)),
+      showlegend=False,
+  )
+  if hover is not None:
+    bar.update(hovertext=list(np.asarray(hover, dtype=object).ravel()), hoverinfo="text")
+  else:
+    bar.update(hoverinfo="skip")
+  fig.add_trace(go.Barpolar(**bar))
+
+  if labels is not None:
+    texts = np.asarray(labels, dtype=object).ravel()
+    if font_colors is None:
+      font_colors = np.full(colors.shape, "black", dtype=object)
+    font_colors = np.asarray(font_colors, dtype=object).ravel()
+    shown = np.flatnonzero(texts != "")
+    if len(shown):
+      fig.add_trace(
+          go.Scatterpolar(
+              r=(base + r / 2)[shown],
+              theta=theta[shown],
+              text=list(texts[shown]),
+              mode="text",
+              textfont=dict(size=font_size, color=list(font_colors[shown])),
+              hoverinfo="skip",
+              showlegend=False,
+          )
+      )
+  return fig
+
+
+# --- 図のキャッシュ (LRU・容量上限付き) ---
+# 図のサイズはトレースのデータ配列から見積もる (JSON に書き出すと図を作るより遅い)
+_TRACE_ARRAYS = ("x", "y", "z", "r", "theta", "text", "customdata")
+_STYLE_ARRAYS = (("marker", "color"), ("marker", "size"), ("textfont", "color"))
+_FIGURE_OVERHEAD = 16 * 1024  # レイアウト・トレースの設定など配列以外の分
+
+
+def _array_nbytes(value):
+  # 数値は 8 バイトとして数える (2 次元のリストは行ごとに足す)
+  if isinstance(value, np.ndarray):
+    return value.nbytes
+  if isinstance(value, (tuple, list)):
+    if value and isinstance(value[0], (tuple, list, np.ndarray)):
+      return sum(_array_nbytes(v) for v in value)
+    return 8 * len(value)
+  return 0
+
+
+def _figure_nbytes(fig):
+  size = _FIGURE_OVERHEAD
+  for trace in fig.data:
+    for name in _TRACE_ARRAYS:
+      size += _array_nbytes(getattr(trace, name, None))
+    for parent, name in _STYLE_ARRAYS:
+      size += _array_nbytes(getattr(getattr(trace, parent, None), name, None))
+  return size
+
+
+def _nbytes(value):
+  # キャッシュに載せる値のおおよそのサイズ
+  if isinstance(value, go.Figure):
+    return _figure_nbytes(value)
+  if isinstance(value, np.ndarray):
+    return value.nbytes
+  if isinstance(value, (tuple, list)):
+    return sum(_nbytes(v) for v in value)
+  if isinstance(value, dict):
+    return sum(_nbytes(v) for v in value.values())
+  return sys.getsizeof(value)
+
+
+class FigureCache:
+
+  def __init__(self, max_bytes):
+    self.max_bytes = max_bytes
+    self._entries = collections.OrderedDict()  # key -> (値, バイト数)
+    self._bytes = 0
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def get_or_build(self, key, build):
+    # キャッシュした図は共有されるので、呼び出し側で書き換えないこと
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+      self.misses += 1
+    value = build()
+    size = _nbytes(value)
+    if size > self.max_bytes:
+      return value
+    with self._lock:
+      old = self._entries.pop(key, None)
+      if old is not None:
+        self._bytes -= old[1]
+      self._entries[key] = (value, size)
+      self._bytes += size
+      # 古いものから容量上限に収まるまで捨てる
+      while self._bytes > self.max_bytes and self._entries:
+        _, (_, dropped) = self._entries.popitem(last=False)
+        self._bytes -= dropped
+    return value
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+
+  @property
+  def nbytes(self):
+    return self._bytes
+
+  def __len__(self):
+    return len(self._entries)
+
+
+cache = FigureCache(int(FIGURE_CACHE_MB * 1024 * 1024))
@@ -0,0 +1,261 @@
+# --- Excel 取り込み (タブ3) ---
+# センサーの Excel を登録用の行に整形する処理をまとめる。
+# 整形ではセンサーの書き出しのプレースホルダー ("-" / "NaN:00" など) を欠損にし、
+# 打球を計測できなかった行に印を付ける (clean_rows)。
+# 登録済みかどうかの判定に使う行のキーも作る (row_keys、索引は dedup.py)。
+# 一括登録では複数の .xlsx (または zip) をプロセスプールで並列に読み込み、
+# 1 ファイルずつ登録する場合と同じ列名変換・DateTime 作成・コース座標変換をかけて
+# 1 回の保存にまとめる。
+import concurrent.futures
+import io
+import os
+import re
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+import swing_store
+import zone_engine
+
+# 1 列目 (時刻) 以外の列名変換。1 列目は常に time_col に変換する
+COLUMN_MAP = {
+    "ExitVelocity": "打球速度",
+    "PitchBallVelocity": "投球速度",
+    "LaunchAngle": "打球角度",
+    "ExitDirection": "打球方向",
+    "Spin": "回転数",
+    "Distance": "飛距離",
+    "SpinDirection": "回転方向",
+}
+PRACTICE_CATEGORY = swing_store.PRACTICE_CATEGORY
+MAX_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def add_course_coords(input_df):
+  # 試合データの「コース」列を解析して座標列を作る
+  if "コース" in input_df.columns:
+    x, y = zone_engine.course_to_coords(input_df["コース"])
+    input_df["StrikeZoneX"] = x
+    input_df["StrikeZoneY"] = y
+  return input_df
+
+
+# --- 取り込み時の整形 ---
+# センサーの書き出しでは値の無いところに "-" や "NaN:00"、空白が入る。
+# 打球を計測できなかった行は打球速度・飛距離が 0 になる (0 km/h は計測値ではない)。
+# 列ごとに一括で置き換え、計測漏れの行は SENSOR_MISS_COL に "1" を立てる
+PLACEHOLDERS = ["-", "NaN:00", "nan", "NaN", "None", ""]
+ID_COLUMNS = ["Unique ID", "HitID"]  # 先にあるものを優先してキーにする
+SENSOR_COLUMNS = [*COLUMN_MAP.values(), *ID_COLUMNS, "SpinConfidence"]
+BALL_COLUMNS = ["打球速度", "飛距離"]  # 両方 0 (または空) なら計測漏れ
+SENSOR_MISS_COL = "打球計測なし"
+
+
+def _placeholder_mask(s):
+  if s.dtype.kind in "fiub":
+    return np.zeros(len(s), dtype=bool)
+  return (s.notna() & s.astype(str).str.strip().isin(PLACEHOLDERS)).to_numpy()
+
+
+def clean_rows(df):
+  # 元の DataFrame は変更しない
+  df = df.copy()
+  for c in df.columns:
+    if c in SENSOR_COLUMNS or swing_store.is_metric_name(c):
+      mask = _placeholder_mask(df[c])
+      if mask.any():
+        df[c] = df[c].mask(mask)
+  if all(c in df.columns for c in BALL_COLUMNS):
+    ball = [pd.to_numeric(df[c], errors="coerce") for c in BALL_COLUMNS]
+    # センサーの行はあるのに (どれかの列に値がある) 打球の値が全部 0 か空
+    recorded = np.logical_or.reduce([
+        df[c].notna().to_numpy() for c in SENSOR_COLUMNS if c in df.columns
+    ])
+    zero = np.logical_and.reduce([(b.fillna(0) == 0).to_numpy() for b in ball])
+    miss = recorded & zero
+    for c in BALL_COLUMNS + ["打球角度"]:
+      if c in df.columns:
+        df[c] = df[c].mask(miss)
+    df[SENSOR_MISS_COL] = np.where(miss, "1", "0")
+  return df
+
+
+# --- 重複登録の判定キー ---
+# 練習: Unique ID → HitID → (time_col, 選手, 日付) の順で使えるもの (1 行ずつ)
+# 試合: (time_col = 対戦相手, 選手, 日付)。同じ試合の同じ選手のファイルを 2 回登録したかを判定する
+def _ids(s):
+  # Excel で数値として読んだ ID ("1773207817.0") と CSV の文字列をそろえる
+  s = s.mask(_placeholder_mask(s))
+  return s.astype("string").str.strip().str.replace(r"\.0$", "", regex=True)
+
+
+def row_keys(df):
+  # (64 ビットのハッシュ, 行ごとのキーか)。行ごとのキーでないもの (試合) はアップロード内の重複を許す
+  n = len(df)
+
+  def col(c):
+    if c not in df.columns:
+      return pd.Series("", index=df.index, dtype="string")
+    return df[c].astype("string").str.strip()
+
+  date = col("DateTime").str[:10]
+  session = col("time_col").fillna("") + "|" + col("Player Name").fillna("") + "|" + date.fillna("")
+  is_game = (
+      (col("試合区別").fillna(PRACTICE_CATEGORY) != PRACTICE_CATEGORY).to_numpy()
+      if "試合区別" in df.columns
+      else np.zeros(n, dtype=bool)
+  )
+  key = ("t:" + session).where(~is_game, "g:" + session)
+  by_row = ~is_game
+  for c in reversed(ID_COLUMNS):
+    if c in df.columns:
+      ids = _ids(df[c])
+      has = ids.notna().to_numpy() & ~is_game
+      key = key.where(~has, c + ":" + ids)
+  hashes = pd.util.hash_pandas_object(key.fillna(""), index=False).to_numpy()
+  return hashes, by_row
+
+
+# --- 旧形式 (toyota_baseball_db.csv) の移行 ---
+# 2025 年分の旧形式はスイングセンサーの列が先頭で、1 列目の「日付」が
+#   "2025年 2月 5日 水曜日 11:52:39"
+# のような日本語の日時になっている (打球センサーの時刻列は無い)。
+# 列名はタブ3と同じ変換 (COLUMN_MAP) で data.csv の形にそろえ、日付は曜日を落として
+# 固定の書式で列全体を一度に解析する。time_col / DateTime は prepare_rows と同じ形にする。
+# 旧形式の DateTime 列は書き出した日なので使わない
+LEGACY_DATE_COL = "日付"
+LEGACY_DATE_FORMAT = "%Y年%m月%d日 %H:%M:%S"
+LEGACY_DROP_COLUMNS = ["DateTime", "Video Url"]
+
+
+def parse_legacy_dates(s):
+  # 空白を除くと "2025年2月5日水曜日11:52:39"。末尾 8 文字が時刻、その前の 3 文字が曜日
+  compact = s.astype("string").str.replace(" ", "", regex=False)
+  compact = compact.str.replace("\u3000", "", regex=False)
+  text = compact.str[:-11] + " " + compact.str[-8:]
+  return pd.to_datetime(text, format=LEGACY_DATE_FORMAT, errors="coerce")
+
+
+def migrate_legacy(legacy_df):
+  # 旧形式の全行を data.csv の形の行にする (元の DataFrame は変更しない)
+  if legacy_df.empty:
+    return legacy_df
+  df = legacy_df.rename(columns=lambda c: str(c).strip())
+  df = df.drop(columns=[c for c in LEGACY_DROP_COLUMNS if c in df.columns])
+  df = df.rename(columns=COLUMN_MAP)
+  stamp = parse_legacy_dates(df[LEGACY_DATE_COL]).dt.strftime("%Y-%m-%d %H:%M:%S")
+  df[LEGACY_DATE_COL] = stamp
+  df.insert(0, "time_col", stamp)
+  df["DateTime"] = stamp.str[:10] + " " + stamp
+  df["試合区別"] = PRACTICE_CATEGORY
+  if "スイング条件" not in df.columns:
+    df["スイング条件"] = "未設定"
+  return clean_rows(df)
+
+
+def prepare_rows(input_df, player, date, category=PRACTICE_CATEGORY):
+  # 読み込んだ Excel 1 ファイル分を登録用の行にする (元の DataFrame は変更しない)
+  input_df = input_df.copy()
+  input_df["試合区別"] = category
+  if category != PRACTICE_CATEGORY:
+    input_df = add_course_coords(input_df)
+  cmap = dict(COLUMN_MAP, **{input_df.columns[0]: "time_col"})
+  input_df = input_df.rename(columns=cmap)
+  date_str = date.strftime("%Y-%m-%d")
+  input_df["DateTime"] = date_str + " " + input_df["time_col"].astype(str).str.strip()
+  input_df["Player Name"] = player
+  if "スイング条件" not in input_df.columns:
+    input_df["スイング条件"] = "未設定"
+  return clean_rows(input_df)
+
+
+# --- アップロードの展開と選手・日付の推定 ---
+def expand_uploads(files):
+  # (ファイル名, 中身) のリスト。zip は中の .xlsx を展開する
+  items = []
+  for name, content in files:
+    if name.lower().endswith(".zip"):
+      with zipfile.ZipFile(io.BytesIO(content)) as zf:
+        for info in zf.infolist():
+          base = os.path.basename(info.filename)
+          if (
+              info.is_dir()
+              or not base.lower().endswith(".xlsx")
+              or base.startswith((".", "~$"))
+              or "__MACOSX" in info.filename
+          ):
+            continue
+          items.append((base, zf.read(info)))
+    elif name.lower().endswith(".xlsx"):
+      items.append((name, content))
+  return items
+
+
+_DATE_PATTERNS = [
+    re.compile(r"(20\d{2})[-_./](\d{1,2})[-_./](\d{1,2})"),
+    re.compile(r"(20\d{2})(\d{2})(\d{2})"),
+]
+
+
+def infer_date(filename):
+  for pattern in _DATE_PATTERNS:
+    for m in pattern.finditer(filename):
+      try:
+        return pd.Timestamp(int(m.group(1)), int(m.group(2)), int(m.group(3))).date()
+      except ValueError:
+        continue
+  return None
+
+
+def infer_player(filename, players):
+  # 背番号 (#10 / 10_ など) か、名字・名前がファイル名に含まれていればその選手。
+  # 名字だけなど名前の一部で複数の選手に当たるとき (同じ名字の選手がいる) は名前では決めない
+  stem = os.path.splitext(filename)[0]
+  full = [p for p in players if p.split()[1:] and all(n in stem for n in p.split()[1:])]
+  if len(full) == 1:
+    return full[0]
+  part = [p for p in players if any(len(n) >= 2 and n in stem for n in p.split()[1:])]
+  if len(part) == 1:
+    return part[0]
+  m = re.match(r"\s*#?(\d{1,2})(?!\d)", stem) or re.search(r"#(\d{1,2})(?!\d)", stem)
+  if m:
+    number = f"#{int(m.group(1))} "
+    for player in players:
+      if player.startswith(number):
+        return player
+  return None
+
+
+# --- 並列読み込み ---
+def _read_excel(content):
+  return pd.read_excel(io.BytesIO(content))
+
+
+def read_many(contents, max_workers=MAX_WORKERS):
+  # Excel の解析は CPU 負荷が高いのでプロセスプールで並列化する。
+  # プールが使えない環境 (制限されたコンテナなど) では順番に読み込む
+  contents = list(contents)
+  if len(contents) > 1 and max_workers > 1:
+    try:
+      with concurrent.futures.ProcessPoolExecutor(
+          max_workers=min(max_workers, len(contents))
+      ) as pool:
+        return list(pool.map(_read_excel, contents))
+    except (OSError, concurrent.futures.process.BrokenProcessPool):
+      pass
+  return [_read_excel(c) for c in contents]
+
+
+def build_batch(items, assignments, category=PRACTICE_CATEGORY):
+  # items: (ファイル名, 中身)、assignments: items と同じ順の (選手, 日付)
+  # 全ファイルを整形して 1 つの DataFrame にまとめる
+  frames = read_many(content for _, content in items)
+  prepared = [
+      prepare_rows(df, player, date, category=category)
+      for df, (player, date) in zip(frames, assignments)
+      if not df.empty
+  ]
+  if not prepared:
+    return pd.DataFrame()
+  return pd.concat(prepared, ignore_index=True)
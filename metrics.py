@@ -0,0 +1,198 @@
+# --- 指標レジストリ ---
+# 指標列ごとの表示ルール (単位・表示桁・小さいほど良いか・色分けの種類・指標の種類) と、
+# 選手ごとにその指標の値があるか (利用可能ビットマップ) をストアのリビジョンごとに一度だけ作る。
+# 各タブは列名の文字列照合や列全体の欠損チェックをやり直さず、ここを参照する。
+# データが追記されたリビジョンでは、追加行の件数だけを足し込む。
+import dataclasses
+import functools
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+import swing_store
+
+# 小さいほど良い指標 (スイング時間など)
+SMALLER_IS_BETTER_KEYS = ["時間", "誤差", "ブレ"]
+_UNIT = re.compile(r"\(([^()]*)\)\s*$")
+
+# 色分けの種類: (種類, 列名に含まれる文字列)。上から順に判定し、どれにも当たらなければ "default"
+COLOR_SCALE_RULES = [
+    ("white", ["バット角度", "バットの角度", "打球方向", "飛距離"]),
+    ("launch_angle", ["打球角度"]),
+    ("exit_velocity", ["打球速度"]),
+    ("hand_efficiency", [swing_store.HAND_SPEED_KEY]),
+    ("power", ["パワー"]),
+    ("rotation_accel", ["体の回転によるバットの加速の大きさ"]),
+    ("upper_swing", ["アッパースイング度"]),
+    ("bat_speed", ["バットスピード"]),
+    ("swing_time", ["スイング時間"]),
+]
+
+# 指標の種類: (種類, 列名に含まれる文字列)。上から順に判定し、どれにも当たらなければ "other"
+KIND_RULES = [
+    ("time", ["時間"]),
+    ("speed", ["速度", "スピード"]),
+    ("angle", ["角度"]),
+    ("efficiency", ["効率"]),
+    ("power", ["パワー"]),
+    ("distance", ["飛距離"]),
+    ("degree", ["度"]),  # アッパースイング度など
+]
+# 計測値の種類 (試合分析で選べる指標。"other" 以外)
+MEASURED_KINDS = tuple(kind for kind, _ in KIND_RULES)
+
+
+@dataclasses.dataclass(frozen=True)
+class MetricInfo:
+  name: str
+  dtype: str
+  unit: str
+  fmt: str  # f"{値:{fmt}}" で使う表示桁
+  smaller_is_better: bool
+  color_scale: str
+  tolerance: float  # 2名比較で「差なし」とみなす幅
+  kind: str  # KIND_RULES の種類
+
+
+@functools.lru_cache(maxsize=None)
+def color_scale(name):
+  for scale, keys in COLOR_SCALE_RULES:
+    if any(k in name for k in keys):
+      return scale
+  return "default"
+
+
+def _kind(name):
+  for kind, keys in KIND_RULES:
+    if any(k in name for k in keys):
+      return kind
+  return "other"
+
+
+@functools.lru_cache(maxsize=None)
+def describe(name, dtype="float32"):
+  # 列名から表示ルールを決める (列名ごとに一度だけ)
+  m = _UNIT.search(name)
+  is_time = "時間" in name
+  is_hand = swing_store.HAND_SPEED_KEY in name
+  return MetricInfo(
+      name=name,
+      dtype=dtype,
+      unit=m.group(1) if m else "",
+      fmt=".3f" if is_time else (".2f" if is_hand else ".1f"),
+      smaller_is_better=any(k in name for k in SMALLER_IS_BETTER_KEYS),
+      color_scale=color_scale(name),
+      tolerance=0.010 if is_time else (0.05 if is_hand else 5.0),
+      kind=_kind(name),
+  )
+
+
+@dataclasses.dataclass(frozen=True)
+class Registry:
+  metrics: tuple
+  info: dict  # 指標名 -> MetricInfo
+  players: tuple
+  counts: np.ndarray  # (選手数, 指標数) 値のある行数
+  revision: object = None
+
+  @property
+  def available(self):
+    # 選手 × 指標の利用可能ビットマップ
+    return self.counts > 0
+
+  def __getitem__(self, metric):
+    return self.info[metric]
+
+  def get(self, metric):
+    info = self.info.get(metric)
+    return info if info is not None else describe(metric)
+
+  def for_players(self, players=None, kinds=None):
+    # 指定した選手 (None なら全員) のいずれかに値がある指標 (列の順)。kinds で指標の種類を絞る
+    if players is None:
+      has = self.available.any(axis=0)
+    else:
+      idx = [self.players.index(p) for p in players if p in self.players]
+      has = self.available[idx].any(axis=0)
+    return [
+        m for m, h in zip(self.metrics, has)
+        if h and (kinds is None or self.info[m].kind in kinds)
+    ]
+
+  def for_player(self, player, kinds=None):
+    return self.for_players([player], kinds)
+
+  def format(self, metric, value):
+    return f"{value:{self.get(metric).fmt}}"
+
+
+def _counts(store, df, players):
+  codes = pd.Categorical(df[store.player_col], categories=players).codes
+  ok = codes >= 0
+  codes = codes[ok]
+  counts = np.zeros((len(players), len(store.metric_cols)), dtype="int64")
+  for j, metric in enumerate(store.metric_cols):
+    has = df[metric].notna().to_numpy()[ok]
+    counts[:, j] = np.bincount(codes, weights=has, minlength=len(players))
+  return counts
+
+
+def _players(store):
+  s = store.df[store.player_col]
+  if isinstance(s.dtype, pd.CategoricalDtype):
+    return tuple(s.cat.categories)
+  return tuple(pd.unique(s.dropna()))
+
+
+def build_registry(store):
+  if store.empty or store.player_col not in store.df.columns:
+    return Registry((), {}, (), np.zeros((0, 0), dtype="int64"), store.revision)
+  players = _players(store)
+  info = {m: describe(m, str(store.df[m].dtype)) for m in store.metric_cols}
+  return Registry(
+      tuple(store.metric_cols),
+      info,
+      players,
+      _counts(store, store.df, players),
+      store.revision,
+  )
+
+
+def _fold(registry, store):
+  # 追記分だけを数えて足す (新しい選手が増えた場合は行を追加する)
+  tail = store.df.iloc[store.parent_rows:]
+  players = _players(store)
+  counts = np.zeros((len(players), len(registry.metrics)), dtype="int64")
+  counts[[players.index(p) for p in registry.players]] = registry.counts
+  if not tail.empty:
+    counts += _counts(store, tail, players)
+  return dataclasses.replace(registry, players=players, counts=counts, revision=store.revision)
+
+
+# --- リビジョン単位のメモ化 ---
+_registries = {}
+_lock = threading.Lock()
+
+
+def get_registry(store):
+  key = store.key
+  with _lock:
+    cached = _registries.get(key)
+  if cached is not None and store.revision is not None and cached.revision == store.revision:
+    return cached
+  if (
+      cached is not None
+      and store.parent_revision is not None
+      and cached.revision == store.parent_revision
+      and cached.metrics == tuple(store.metric_cols)
+      and set(cached.players) <= set(_players(store))
+  ):
+    registry = _fold(cached, store)
+  else:
+    registry = build_registry(store)
+  if store.revision is not None and key is not None:
+    with _lock:
+      _registries[key] = registry
+  return registry
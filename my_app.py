@@ -1,312 +1,241 @@
-import base64
 import datetime
+import os
 import re  # 背番号抽出用
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-import requests
 import streamlit as st
 
+import color_scales
+import cube
+import data_layer
+import date_index
+import dedup
+import figures
+import ingest
+import metrics
+import profiling
+import save_queue
+import split_cube
+import spray
+import sql_engine
+import swing_store
+from roster import PLAYER_HANDS, PLAYERS
+from zone_engine import (
+    SPRAY_ANGLE_EDGES,
+    SPRAY_RINGS,
+    SPRAY_SECTORS,
+    SZ_X_MAX,
+    SZ_X_MIN,
+    SZ_Y_MAX,
+    SZ_Y_MIN,
+)
+
 # --- 基本設定 ---
 PW = "1189"
 GITHUB_USER = "sakanatama-hub"
 GITHUB_REPO = "Batting-feedback"
 GITHUB_FILE_PATH = "data.csv"
 GITHUB_GAME_FILE_PATH = "game_data.csv"  # 追加：試合用パス
+GITHUB_LEGACY_FILE_PATH = "toyota_baseball_db.csv"  # 旧形式のデータ (2025年分)
+# 旧形式のデータは data.csv の形に変換して練習データの先頭に結合する (BATTING_LOAD_LEGACY=0 で無効)
+LOAD_LEGACY = os.environ.get("BATTING_LOAD_LEGACY", "1") != "0"
+LEGACY = (
+    {GITHUB_FILE_PATH: (GITHUB_LEGACY_FILE_PATH, ingest.migrate_legacy)}
+    if LOAD_LEGACY
+    else {}
+)
 GITHUB_TOKEN = st.secrets["GITHUB_TOKEN"]
 
-# --- ストライクゾーン定義 (cm) ---
-SZ_X_MIN, SZ_X_MAX = -28.8, 28.8
-SZ_X_TH1, SZ_X_TH2 = -9.6, 9.6
-SZ_Y_MIN, SZ_Y_MAX = 45.0, 110.0
-SZ_Y_TH1, SZ_Y_TH2 = 66.6, 88.3
-
-PLAYER_HANDS = {
-    "#1 熊田 任洋": "左",
-    "#2 逢澤 崚介": "左",
-    "#3 三塚 武蔵": "左",
-    "#4 北村 祥治": "右",
-    "#5 前田 健伸": "左",
-    "#6 佐藤 勇基": "右",
-    "#7 西村 友哉": "右",
-    "#8 和田 佳大": "左",
-    "#9 今泉 颯太": "右",
-    "#10 福井 章吾": "左",
-    "#22 高祖 健輔": "左",
-    "#23 箱山 遥人": "右",
-    "#24 坂巻 尚哉": "右",
-    "#26 西村 彰浩": "左",
-    "#27 小畑 尋規": "右",
-    "#28 宮崎 仁斗": "右",
-    "#29 徳本 健太朗": "左",
-    "#39 柳 元珍": "左",
-    "#99 尾瀬 雄大": "左",
-    "#33 網谷 圭将": "右",
-    "#35 永濱 晃汰": "左",
-}
-PLAYERS = list(PLAYER_HANDS.keys())
-
-
-# --- 追加：コース文字列を座標に変換する関数 ---
-def convert_course_to_coord(course_str):
-  if pd.isna(course_str):
-    return None, None
-  course_str = str(course_str)
-
-  # 横位置(X)の判定
-  x = 0
-  if "内" in course_str:
-    x = -19.2  # SZ_X_TH1より外側（インコース）
-  elif "外" in course_str:
-    x = 19.2  # SZ_X_TH2より外側（アウトコース）
-  else:
-    x = 0  # 真ん中
-
-  # 高さ(Y)の判定
-  y = 77.5  # 真ん中の高さ（デフォルト）
-  if "高め" in course_str:
-    y = 99.1  # SZ_Y_TH2より上
-  elif "低め" in course_str:
-    y = 55.8  # SZ_Y_TH1より下
-
-  return x, y
+GAME_CATEGORIES = ["オープン戦", "紅白戦", "JAVA大会", "二大大会", "二大大会予選", "その他"]
 
 
 # --- GitHub連携関数 (引数にpathを追加) ---
+# 解析済みデータはプロセス内でキャッシュし、ETag が変わった時だけ再取得する
+# 本体 CSV と追記パーティション (練習データは変換済みの旧形式も) を結合したものを返す
 def load_data_from_github(path):
-  url = f"https://raw.githubusercontent.com/{GITHUB_USER}/{GITHUB_REPO}/main/{path}?nocache={datetime.datetime.now().timestamp()}"
-  try:
-    df = pd.read_csv(url, dtype=str)
-    df.columns = df.columns.str.strip()
-    return df
-  except:
-    return pd.DataFrame()
+  with profiling.span(f"load {path}"):
+    return data_layer.load_dataset(
+        GITHUB_USER, GITHUB_REPO, path, GITHUB_TOKEN, legacy=LEGACY.get(path)
+    )
+
+
+# 練習・試合 (と旧形式) のデータを並行して取得・解析する。待ち時間は合計ではなく
+# 一番遅いファイルの分だけになる。結果はキャッシュに入り、続く load_store はそれを使う
+def prefetch_from_github():
+  with profiling.span("load all"):
+    data_layer.load_many(
+        GITHUB_USER,
+        GITHUB_REPO,
+        GITHUB_TOKEN,
+        datasets=[GITHUB_FILE_PATH, GITHUB_GAME_FILE_PATH],
+        legacy=LEGACY,
+    )
+
+
+# 型付きストアはデータのリビジョンごとに一度だけ構築する
+# (再起動後は Parquet スナップショットから読み込む。追記だけのリビジョンは追加行だけを取り込む)
+def load_store(path, analysis_only=False):
+  raw = load_data_from_github(path)
+  with profiling.span(f"store {path}"):
+    return swing_store.get_store(
+        path,
+        raw,
+        data_layer.revision(GITHUB_USER, GITHUB_REPO, path),
+        analysis_only=analysis_only,
+        history=data_layer.history(GITHUB_USER, GITHUB_REPO, path),
+    )
 
 
+# 新しく登録する行だけを追記パーティションとして保存する（既存データは再送しない）
+# 同時に行われた他のセッションの登録とまとめて 1 回で保存する (save_queue.py)
+# 保存した行はキャッシュ済みのデータにそのまま連結され、次の再実行から各タブに反映される
 def save_to_github(new_df, path):
-  url = f"https://api.github.com/repos/{GITHUB_USER}/{GITHUB_REPO}/contents/{path}"
-  headers = {
-      "Authorization": f"token {GITHUB_TOKEN}",
-      "Accept": "application/vnd.github.v3+json",
-  }
-  res = requests.get(url, headers=headers)
-  sha = res.json().get("sha") if res.status_code == 200 else None
-  save_df = new_df.copy()
-  for col in save_df.columns:
-    save_df[col] = (
-        save_df[col].astype(str).replace("nan", "").replace("NaT", "")
+  with profiling.span(f"save {path}"):
+    return save_queue.submit(
+        GITHUB_USER, GITHUB_REPO, path, new_df, GITHUB_TOKEN
     )
-  csv_content = save_df.to_csv(index=False)
-  b64_content = base64.b64encode(csv_content.encode("utf-8-sig")).decode()
-  data = {
-      "message": f"Update data {datetime.datetime.now()}",
-      "content": b64_content,
-  }
-  if sha:
-    data["sha"] = sha
-  put_res = requests.put(url, headers=headers, json=data)
-  return (
-      (True, "成功")
-      if put_res.status_code in [200, 201]
-      else (False, f"エラー {put_res.status_code}")
+
+
+# 登録済みの行 (同じセッションの再アップロードなど) を除く。
+# 登録済みかどうかはデータのリビジョンごとに一度だけ作る索引で調べる (dedup.py)
+def drop_registered(input_df, path):
+  raw = load_data_from_github(path)
+  index = dedup.get_index(
+      path,
+      raw,
+      data_layer.revision(GITHUB_USER, GITHUB_REPO, path),
+      data_layer.history(GITHUB_USER, GITHUB_REPO, path),
   )
+  dup = index.duplicates(input_df)
+  return input_df[~dup], int(dup.sum())
+
+
+# 重複を除いてから保存し、結果を表示する
+def save_new_rows(input_df, path, done_message):
+  input_df, n_dup = drop_registered(input_df, path)
+  if n_dup:
+    st.info(f"ℹ️ 登録済みの {n_dup}件は除外しました")
+  if input_df.empty:
+    st.warning("⚠️ すべて登録済みのデータです。保存はしませんでした。")
+    return
+  if ingest.SENSOR_MISS_COL in input_df.columns:
+    n_miss = int((input_df[ingest.SENSOR_MISS_COL] == "1").sum())
+    if n_miss:
+      st.caption(f"※ 打球を計測できなかった {n_miss}件は打球の値を空欄にして保存します")
+  success, message = save_to_github(input_df, path)
+  if success: st.success(done_message(len(input_df))); st.balloons()
+  else: st.error(f"❌ 失敗: {message}")
 
 
 # --- 共通ユーティリティ (色定義) ---
-def get_color(val, metric_name, row_idx=None, eff_val=None):
-  if val == 0 or pd.isna(val):
-    return "rgba(255, 255, 255, 0.1)", "white"
-
-  white_metrics = ["バット角度", "バットの角度", "打球方向", "飛距離"]
-  if any(m in metric_name for m in white_metrics):
-    return "#FFFFFF", "black"
-
-  if "打球角度" in metric_name:
-    center = 15.0
-    if 8.0 <= val <= 22.0:
-      dist = abs(val - center)
-      intensity = 1.0 - (dist / 7.0)
-      gb_val = int(255 * (1 - intensity))
-      return (
-          f"rgba(255, {gb_val}, {gb_val}, 0.9)",
-          "white" if intensity > 0.5 else "black",
-      )
-    elif val < 8.0:
-      dist = min(abs(8.0 - val), 15.0)
-      intensity = dist / 15.0
-      rb_val = int(255 * (1 - intensity))
-      return f"rgba({rb_val}, 255, {rb_val}, 0.9)", "black"
-    else:
-      dist = min(abs(val - 22.0), 15.0)
-      intensity = dist / 15.0
-      rg_val = int(255 * (1 - intensity))
-      return (
-          f"rgba({rg_val}, {rg_val}, 255, 0.9)",
-          "white" if intensity > 0.5 else "black",
-      )
+# 値の配列 (グリッド全体・全スイング) をまとめて色分けする (color_scales.py の表を使う)
+# rows はアッパースイング度の理想範囲を決める高さ (3x3 の行 0〜2)。values と同じ形かブロードキャストできる形
+@profiling.timed("get_colors")
+def get_colors(values, metric_name, rows=None):
+  return color_scales.colorize(values, metrics.color_scale(metric_name), rows)
 
-  if "打球速度" in metric_name:
-    if val < 140:
-      return "rgba(0, 0, 255, 0.9)", "white"
-    elif 140 <= val < 145:
-      return "rgba(173, 216, 230, 0.9)", "black"
-    elif 145 <= val <= 152:
-      return "rgba(255, 255, 255, 0.9)", "black"
-    elif 153 <= val <= 160:
-      return "rgba(255, 182, 193, 0.9)", "black"
-    else:
-      return "rgba(255, 0, 0, 0.9)", "white"
-
-  if "手の最大スピード" in metric_name:
-    eff = eff_val if eff_val is not None else val
-    if eff < 2.7:
-      return "rgba(0, 128, 0, 0.9)", "white"
-    elif eff < 3.0:
-      return "rgba(144, 238, 144, 0.9)", "black"
-    elif 3.0 <= eff <= 3.2:
-      dist = abs(eff - 3.1)
-      intensity = 1.0 - (dist / 0.1) if dist <= 0.1 else 0.0
-      gb_val = int(255 * (1 - intensity))
-      return (
-          f"rgba(255, {gb_val}, {gb_val}, 0.9)",
-          "white" if intensity > 0.5 else "black",
-      )
-    elif eff <= 3.4:
-      return "rgba(173, 216, 230, 0.9)", "black"
-    else:
-      return "rgba(0, 0, 255, 0.9)", "white"
-
-  if "パワー" in metric_name:
-    if val < 3:
-      return "rgba(0, 0, 255, 0.9)", "white"
-    elif val <= 3.5:
-      return "rgba(173, 216, 230, 0.9)", "black"
-    elif val <= 4:
-      return "rgba(255, 255, 255, 0.9)", "black"
-    elif val <= 4.5:
-      return "rgba(255, 182, 193, 0.9)", "black"
-    else:
-      return "rgba(255, 0, 0, 0.9)", "white"
-
-  if "体の回転によるバットの加速の大きさ" in metric_name:
-    if val <= 5:
-      return "rgba(0, 0, 255, 0.9)", "white"
-    elif val <= 10:
-      return "rgba(173, 216, 230, 0.9)", "black"
-    elif val <= 14:
-      return "rgba(255, 255, 255, 0.9)", "black"
-    elif val <= 20:
-      return "rgba(255, 182, 193, 0.9)", "black"
-    else:
-      return "rgba(255, 0, 0, 0.9)", "white"
 
-  if "アッパースイング度" in metric_name and row_idx is not None:
-    if row_idx == 0:
-      base, low, high = 6.5, 3.0, 10.0
-    elif row_idx == 1:
-      base, low, high = 11.5, 8.0, 15.0
-    else:
-      base, low, high = 15.0, 10.0, 20.0
-    if low <= val <= high:
-      intensity = 1.0 - (abs(val - base) / ((high - low) / 2))
-      return (
-          f"rgba(255, {int(255*(1-intensity))}, {int(255*(1-intensity))}, 0.9)",
-          "black",
-      )
-    elif val < low:
-      intensity = min((low - val) / 15.0, 1.0)
-      return (
-          f"rgba({int(255*(1-intensity))}, 255, {int(255*(1-intensity))}, 0.9)",
-          "black",
-      )
-    else:
-      intensity = min((val - high) / 15.0, 1.0)
-      return (
-          f"rgba({int(255*(1-intensity))}, {int(255*(1-intensity))}, 255, 0.9)",
-          "black",
-      )
+# グリッドの各マスの高さ (3x3 の行)。5x5 では外側の行を隣の行として扱う
+ROWS_3X3 = np.arange(3)[:, None]
+ROWS_5X5 = np.clip(np.arange(5) - 1, 0, 2)[:, None]
 
-  if "バットスピード" in metric_name:
-    if val < 100:
-      return "rgba(0, 0, 255, 0.9)", "white"
-    elif 100 <= val <= 110:
-      return "rgba(255, 255, 255, 0.9)", "black"
-    elif 110 < val < 120:
-      intensity = (val - 110) / 10
-      gb_val = int(255 * (1 - intensity))
-      return (
-          f"rgba(255, {gb_val}, {gb_val}, 0.9)",
-          "black" if intensity < 0.6 else "white",
-      )
-    else:
-      return "rgba(255, 0, 0, 0.9)", "white"
-
-  if "スイング時間" in metric_name:
-    if val < 0.14:
-      return "rgba(255, 0, 0, 0.9)", "white"
-    elif 0.14 <= val < 0.15:
-      return "rgba(255, 180, 180, 0.9)", "black"
-    elif 0.15 <= val < 0.16:
-      return "rgba(255, 255, 255, 0.9)", "black"
-    elif 0.16 <= val < 0.17:
-      return "rgba(180, 180, 255, 0.9)", "black"
-    else:
-      return "rgba(0, 0, 255, 0.9)", "white"
-
-  base, sensitivity = 105, 30
-  diff = val - base
-  intensity = min(abs(diff) / sensitivity, 1.0)
-  color = (
-      f"rgba(255, {int(255*(1-intensity))}, {int(255*(1-intensity))}, 0.9)"
-      if diff > 0
-      else f"rgba({int(255*(1-intensity))}, {int(255*(1-intensity))}, 255, 0.9)"
-  )
-  f_color = "black" if intensity < 0.4 else "white"
-  return color, f_color
-
-
-def get_3x3_grid(df, metric):
-  grid = np.zeros((3, 3))
-  counts = np.zeros((3, 3))
-  eff_grid = np.zeros((3, 3))
-  if metric not in df.columns:
-    return grid, None
-  df_c = df.copy()
-  df_c["StrikeZoneX"] = pd.to_numeric(df_c["StrikeZoneX"], errors="coerce")
-  df_c["StrikeZoneY"] = pd.to_numeric(df_c["StrikeZoneY"], errors="coerce")
-  is_hand = (
-      "手の最大スピード" in metric and "バットスピード (km/h)" in df_c.columns
-  )
-  df_c[metric] = pd.to_numeric(df_c[metric], errors="coerce")
-  if is_hand:
-    df_c["eff_calc"] = (
-        pd.to_numeric(df_c["バットスピード (km/h)"], errors="coerce")
-        / df_c[metric]
-    )
-  valid = df_c.dropna(subset=["StrikeZoneX", "StrikeZoneY", metric])
-  for _, row in valid.iterrows():
-    c = (
-        0
-        if row["StrikeZoneX"] < SZ_X_TH1
-        else 1
-        if row["StrikeZoneX"] <= SZ_X_TH2
-        else 2
-    )
-    r = (
-        0
-        if row["StrikeZoneY"] > SZ_Y_TH2
-        else 1
-        if row["StrikeZoneY"] > SZ_Y_TH1
-        else 2
+
+# 図は (データのリビジョン, 種類, 選手・絞り込み条件・指標) ごとにキャッシュする
+# 同じ表示に戻ったときは作り直さない
+def cached_figure(kind, store, params, build):
+  build = profiling.timed(f"figure {kind}")(build)
+  if store.revision is None:
+    return build()
+  return figures.cache.get_or_build((kind, store.key, store.revision, *params), build)
+
+
+# Plotly の図の JSON 化・送信も計測する
+def show_chart(fig, **kwargs):
+  with profiling.span("plotly_chart"):
+    st.plotly_chart(fig, **kwargs)
+
+
+# タブ1・2の集計は集計キューブで行う。BATTING_SQL_ENGINE を指定したときは
+# 組み込み SQL エンジンの表で行う (どちらも同じ呼び方ができる)
+def get_analysis(store):
+  if sql_engine.enabled():
+    return sql_engine.get_table(store)
+  return cube.get_cube(store)
+
+
+# 集計キューブから 3x3 の平均と件数を取り出す (生データは走査しない)
+def get_3x3_grid(swing_cube, mask, metric):
+  if metric not in swing_cube.metrics:
+    return np.zeros((3, 3)), np.zeros((3, 3))
+  stats = swing_cube.zone_stats(mask, metric)
+  return stats.mean, stats.count
+
+
+# --- タブの遅延実行 ---
+# 状態を持つタブ (Streamlit 1.5x 以降) では選択中のタブだけが open になる。
+# 古い Streamlit では従来どおり全タブを描画する (open が None)
+def lazy_tabs(labels, key):
+  try:
+    return st.tabs(labels, key=key, on_change="rerun")
+  except TypeError:
+    return st.tabs(labels)
+
+
+def is_open(tab):
+  return getattr(tab, "open", None) is not False
+
+
+# 描画されなかったウィジェットの値は破棄されるので、非表示のタブの選択内容を引き継ぐ
+def keep_widget_state(tab, keys):
+  if is_open(tab):
+    return
+  for k in keys:
+    if k in st.session_state:
+      st.session_state[k] = st.session_state[k]
+
+
+# --- 処理時間・メモリの計測パネル (管理者のみ) ---
+def show_profile_panel(run):
+  with st.sidebar.expander("⏱️ 処理時間・メモリ", expanded=False):
+    tracing = st.checkbox(
+        "メモリのピークを計測する (tracemalloc・少し遅くなります)",
+        value=profiling.memory_tracing(),
+        key="profile_memory",
     )
-    grid[r, c] += row[metric]
-    counts[r, c] += 1
-    if is_hand:
-      eff_grid[r, c] += row["eff_calc"]
-  return (
-      np.where(counts > 0, grid / counts, 0),
-      (np.where(counts > 0, eff_grid / counts, 0) if is_hand else None),
-  )
+    profiling.set_memory_tracing(tracing)
+    if run is None:
+      return
+    summary = f"この再実行: {run.seconds * 1000:.0f} ms"
+    if run.peak_mb is not None:
+      summary += f" / メモリのピーク {run.peak_mb:.1f} MB"
+    if run.max_rss_mb is not None:
+      summary += f" / プロセス最大 {run.max_rss_mb:.0f} MB"
+    st.caption(summary)
+    if run.stages:
+      st.dataframe(
+          pd.DataFrame([(n, sec * 1000) for n, sec in run.stages], columns=["段階", "ms"]),
+          hide_index=True, use_container_width=True,
+      )
+    if run.spans:
+      spans = pd.DataFrame(
+          [(n, c, t * 1000, m * 1000) for n, (c, t, m) in run.spans.items()],
+          columns=["処理", "回数", "合計 ms", "最大 ms"],
+      ).sort_values("合計 ms", ascending=False)
+      st.dataframe(spans, hide_index=True, use_container_width=True)
+    recent = profiling.history()
+    if len(recent) > 1:
+      st.caption("直近の再実行")
+      st.dataframe(
+          pd.DataFrame({
+              "開始": [r.started.strftime("%H:%M:%S") for r in recent],
+              "ms": [r.seconds * 1000 for r in recent],
+              "ピーク MB": [r.peak_mb for r in recent],
+          }),
+          hide_index=True, use_container_width=True,
+      )
+    if profiling.LOG_PATH:
+      st.caption(f"ログ: {profiling.LOG_PATH}")
 
 
 # --- 背番号ソート用関数 ---
@@ -341,195 +270,254 @@ if not st.session_state["ok"]:
 else:
   # ログイン後のパスワード（"1189" または "3335"）を取得
   current_pw = st.session_state["password"]
+  profiling.begin_run()
 
-  # 1. データの読み込み（練習と試合を完全に分離）
-  db_practice = load_data_from_github(GITHUB_FILE_PATH)  # 練習データ
-  db_game = load_data_from_github(GITHUB_GAME_FILE_PATH)  # 試合データ
+  # 1. データの読み込み（練習と試合を完全に分離・型付きストア）
+  prefetch_from_github()
+  practice_store = load_store(GITHUB_FILE_PATH, analysis_only=True)  # 練習データ
+  game_store = load_store(GITHUB_GAME_FILE_PATH)  # 試合データ
 
   # 2. パスワードに応じたデータの絞り込み
   if current_pw == "3335":
     # 3335の場合は #33網谷 と #35永濱 のみに絞り込む
     target_players = ["#33 網谷 圭将", "#35 永濱 晃汰"]
-
-    if not db_practice.empty:
-        player_col = "Player Name" if "Player Name" in db_practice.columns else "選手名"
-        if player_col in db_practice.columns:
-            db_practice = db_practice[db_practice[player_col].isin(target_players)]
-
-    # 試合データの絞り込み
-    if not db_game.empty:
-          player_col_game = "Player Name" if "Player Name" in db_game.columns else "選手名"
-          if player_col_game in db_game.columns:
-              db_game = db_game[db_game[player_col_game].isin(target_players)]
-              
+    practice_store = swing_store.restrict_players(practice_store, target_players)
+    game_store = swing_store.restrict_players(game_store, target_players)
   else:
     # 1189の場合は全員のデータ（そのまま）
     pass
 
-  # 3. タブ1・2（練習分析）で使うメイン変数を設定
-  db_df = db_practice.copy() if not db_practice.empty else pd.DataFrame()
+  # 3. 各タブで使うメイン変数を設定（型変換済みなのでコピー不要）
+  db_df = practice_store.df
+  db_game = game_store.df
+  # 指標ごとの表示ルールと選手ごとの有無 (リビジョンごとに一度だけ作る)
+  practice_metrics = metrics.get_registry(practice_store)
+  game_metrics = metrics.get_registry(game_store)
 
   # 4. タブの定義
-  tab1, tab2, tab3, tab4 = st.tabs(
-      ["👤 個人分析", "⚔️ 比較分析", "📝 データ登録", "🏟️ 試合分析"]
+  # 選択中のタブだけを計算する（タブ切り替えで再実行し、非表示のタブは描画しない）
+  tab1, tab2, tab3, tab4 = lazy_tabs(
+      ["👤 個人分析", "⚔️ 比較分析", "📝 データ登録", "🏟️ 試合分析"], key="main_tab"
   )
+  keep_widget_state(tab1, ["p_tab1", "range_tab1", "cond_tab1", "m_tab1", "scope_spray", "m_spray"])
+  keep_widget_state(tab2, ["m_tab2", "cond_tab2", "compare_a", "compare_b"])
+  keep_widget_state(tab4, ["p_tab4", "date_range_tab4", "cat_tab4", "match_tab4", "m_tab4_h", "pitch_tab4", "outcome_tab4", "view_tab4", "by_tab4"])
 
   # 5. 各タブの中身
   with tab1:
     st.title("🔵 個人別打撃分析")
-    if not db_df.empty:
-            player_col = 'Player Name' if 'Player Name' in db_df.columns else db_df.columns[-1]
-            cond_col = 'スイング条件' if 'スイング条件' in db_df.columns else 'スイング条件_str'
-            db_df[cond_col] = db_df[cond_col].fillna("未設定").astype(str).str.strip()
+    if is_open(tab1) and not db_df.empty:
+            profiling.stage("tab1.filter")
+            player_col = practice_store.player_col
+            cond_col = practice_store.cond_col
+            # 期間・条件・指標の切り替えは集計キューブだけで答える（リビジョンごとに一度だけ構築）
+            cube_p = get_analysis(practice_store)
             
             all_possible_conds = sorted(db_df[cond_col].unique().tolist())
-            existing_players = sort_players_by_number(db_df[player_col].dropna().unique().tolist())
+            existing_players = sort_players_by_number(cube_p.observed_players())
 
             c1, c2, c3, c4 = st.columns([2, 2, 2, 2])
             with c1: 
                 target_player = st.selectbox("選手を選択", existing_players, key="p_tab1")
             
-            pdf = db_df[db_df[player_col] == target_player].copy()
-            if not pdf.empty:
-                pdf['Date_Only_Str'] = pdf['DateTime'].astype(str).str.extract(r'(\d{4}-\d{2}-\d{2})')[0]
-                pdf['Date_Only'] = pd.to_datetime(pdf['Date_Only_Str'], errors='coerce').dt.date
-                valid_dates = pdf['Date_Only'].dropna()
-                min_date = min(valid_dates) if not valid_dates.empty else datetime.date(2024,1,1)
-                max_date = max(valid_dates) if not valid_dates.empty else datetime.date.today()
+            pmask = cube_p.mask(players=[target_player])
+            if cube_p.row_count(pmask) > 0:
+                min_date, max_date = cube_p.date_bounds(pmask)
+                if min_date is None:
+                    min_date, max_date = datetime.date(2024,1,1), datetime.date.today()
                 
                 with c2: date_range = st.date_input("分析期間", value=(min_date, max_date), key="range_tab1")
                 with c3: sel_conds = st.multiselect("打撃条件 (U列)", all_possible_conds, default=all_possible_conds, key="cond_tab1")
                 with c4:
-                    keywords = ["スコア", "速度", "角度", "効率", "パワー", "時間", "スピード", "飛距離", "G)", "度"]
-                    valid_metrics = [c for c in pdf.columns if any(k in str(c) for k in keywords)]
-                    valid_metrics = [c for c in valid_metrics if pd.to_numeric(pdf[c], errors='coerce').dropna().any()]
+                    valid_metrics = practice_metrics.for_player(target_player)
                     priority = ["バットスピード (km/h)", "スイング時間 (秒)", "アッパースイング度 (°)"]
                     sorted_metrics = [m for m in priority if m in valid_metrics] + [m for m in valid_metrics if m not in priority]
                     target_metric = st.selectbox("分析指標", sorted_metrics, key="m_tab1")
+                    metric_info = practice_metrics.get(target_metric)
 
-                mask = (pdf[cond_col].isin(sel_conds))
-                if isinstance(date_range, (list, tuple)) and len(date_range) == 2:
-                    mask &= (pdf['Date_Only'] >= date_range[0]) & (pdf['Date_Only'] <= date_range[1])
-                
-                vdf = pdf[mask].copy()
+                has_range = isinstance(date_range, (list, tuple)) and len(date_range) == 2
+                start, end = date_range if has_range else (None, None)
+                vmask = cube_p.mask(players=[target_player], conds=sel_conds, start=start, end=end)
+                n_rows = cube_p.row_count(vmask)
 
-                if vdf.empty:
+                if n_rows == 0:
                     st.warning(f"⚠️ 一致するデータがありません。")
                 else:
-                    if "手の最大スピード" in target_metric and "バットスピード (km/h)" in vdf.columns:
-                        vdf[target_metric] = pd.to_numeric(vdf['バットスピード (km/h)'], errors='coerce') / pd.to_numeric(vdf[target_metric], errors='coerce')
-                    else:
-                        vdf[target_metric] = pd.to_numeric(vdf[target_metric], errors='coerce')
-                    
-                    valid_vals = vdf[target_metric].dropna()
-                    if not valid_vals.empty:
-                        m_max = valid_vals.min() if "時間" in target_metric else valid_vals.max()
-                        m_avg = valid_vals.mean()
+                    profiling.stage("tab1.aggregate")
+                    n_vals, m_avg, v_min_all, v_max_all = cube_p.stats(vmask, target_metric)
+                    if n_vals > 0:
+                        m_max = v_min_all if metric_info.smaller_is_better else v_max_all
                         col_m1, col_m2, col_m3 = st.columns([2, 2, 4])
                         with col_m1:
-                            label = "MIN" if "時間" in target_metric else "MAX"
-                            st.metric(label=f"期間内 {label}", value=f"{m_max:.3f}" if "時間" in target_metric or "手の最大スピード" in target_metric else f"{m_max:.1f}")
+                            label = "MIN" if metric_info.smaller_is_better else "MAX"
+                            st.metric(label=f"期間内 {label}", value=f"{m_max:{metric_info.fmt}}")
                         with col_m2:
-                            st.metric(label="期間内 平均", value=f"{m_avg:.3f}" if "時間" in target_metric or "手の最大スピード" in target_metric else f"{m_avg:.1f}")
+                            st.metric(label="期間内 平均", value=f"{m_avg:{metric_info.fmt}}")
                         with col_m3:
-                            st.info(f"💡 {len(vdf)}件のスイングを分析中")
+                            st.info(f"💡 {n_rows}件のスイングを分析中")
 
+                    profiling.stage("tab1.render")
                     st.subheader(f"📊 {target_metric}：ゾーン別詳細分析")
-                    vdf['StrikeZoneX'] = pd.to_numeric(vdf['StrikeZoneX'], errors='coerce')
-                    vdf['StrikeZoneY'] = pd.to_numeric(vdf['StrikeZoneY'], errors='coerce')
                     hand = PLAYER_HANDS.get(target_player, "右")
                     
-                    fig_heat = go.Figure()
-                    fig_heat.add_shape(type="rect", x0=-500, x1=500, y0=-100, y1=600, fillcolor="#1a4314", line_width=0, layer="below")
-                    L_x, L_y, R_x, R_y = 125, 140, -125, 140
-                    fig_heat.add_shape(type="path", path=f"M {R_x} {R_y} L -450 600 L 450 600 L {L_x} {L_y} Z", fillcolor="#8B4513", line_width=0, layer="below")
-                    fig_heat.add_shape(type="circle", x0=-120, x1=120, y0=-50, y1=160, fillcolor="#8B4513", line_width=0, layer="below")
-                    fig_heat.add_shape(type="path", path="M -25 70 L 25 70 L 25 45 L 0 5 L -25 45 Z", fillcolor="white", line=dict(color="#444", width=3), layer="below")
+                    tab1_view = (target_player, tuple(sel_conds), start, end, target_metric)
+
+                    def build_heat():
+                        fig_heat = go.Figure()
+                        fig_heat.add_shape(type="rect", x0=-500, x1=500, y0=-100, y1=600, fillcolor="#1a4314", line_width=0, layer="below")
+                        L_x, L_y, R_x, R_y = 125, 140, -125, 140
+                        fig_heat.add_shape(type="path", path=f"M {R_x} {R_y} L -450 600 L 450 600 L {L_x} {L_y} Z", fillcolor="#8B4513", line_width=0, layer="below")
+                        fig_heat.add_shape(type="circle", x0=-120, x1=120, y0=-50, y1=160, fillcolor="#8B4513", line_width=0, layer="below")
+                        fig_heat.add_shape(type="path", path="M -25 70 L 25 70 L 25 45 L 0 5 L -25 45 Z", fillcolor="white", line=dict(color="#444", width=3), layer="below")
                     
-                    grid_side = 55; z_x_start, z_y_start = -(grid_side * 2.5), 180
+                        grid_side = 55; z_x_start, z_y_start = -(grid_side * 2.5), 180
                     
-                    grid_val = np.zeros((5, 5))
-                    grid_count = np.zeros((5, 5))
-                    grid_max = np.full((5, 5), -9999.0)
-                    grid_min = np.full((5, 5), 9999.0)
-
-                    for _, row in vdf.dropna(subset=['StrikeZoneX', 'StrikeZoneY', target_metric]).iterrows():
-                        r = 0 if row['StrikeZoneY'] > SZ_Y_MAX else 1 if row['StrikeZoneY'] > SZ_Y_TH2 else 2 if row['StrikeZoneY'] > SZ_Y_TH1 else 3 if row['StrikeZoneY'] > SZ_Y_MIN else 4
-                        c = 0 if row['StrikeZoneX'] < SZ_X_MIN else 1 if row['StrikeZoneX'] < SZ_X_TH1 else 2 if row['StrikeZoneX'] <= SZ_X_TH2 else 3 if row['StrikeZoneX'] <= SZ_X_MAX else 4
-                        val = row[target_metric]
-                        grid_val[r, c] += val
-                        grid_count[r, c] += 1
-                        if val > grid_max[r, c]: grid_max[r, c] = val
-                        if val < grid_min[r, c]: grid_min[r, c] = val
-
-                    display_grid = np.where(grid_count > 0, grid_val / grid_count, 0)
+                        zone5 = cube_p.zone_stats(vmask, target_metric, layout=5)
+                        display_grid, grid_count = zone5.mean, zone5.count
+                        grid_max, grid_min = zone5.max, zone5.min
                     
-                    for r in range(5):
-                        for c in range(5):
-                            x0, x1 = z_x_start + c * grid_side, z_x_start + (c + 1) * grid_side
-                            y0, y1 = z_y_start + (4 - r) * grid_side, z_y_start + (5 - r) * grid_side
-                            val_h = display_grid[r, c]
-                            color, f_color = get_color(val_h, target_metric, row_idx=max(0, min(2, r - 1)))
-                            fig_heat.add_shape(type="rect", x0=x0, x1=x1, y0=y0, y1=y1, fillcolor=color, line=dict(color="#222", width=1))
-                            
-                            if grid_count[r, c] > 0:
-                                v_max, v_min, v_cnt = grid_max[r, c], grid_min[r, c], int(grid_count[r, c])
-                                fmt = ".3f" if "時間" in target_metric or "手の最大スピード" in target_metric else ".1f"
-                                fig_heat.add_annotation(x=(x0+x1)/2, y=(y0+y1)/2, text=f"{val_h:{fmt}}", showarrow=False, font=dict(size=14, color=f_color, weight="bold"))
-                                
-                                hover_label = (f"平均: {val_h:{fmt}}<br>最大: {v_max:{fmt}}<br>最小: {v_min:{fmt}}<br>試行: {v_cnt}")
-                                fig_heat.add_trace(go.Scatter(x=[(x0+x1)/2], y=[(y0+y1)/2], text=[hover_label], hoverinfo="text", mode="markers", marker=dict(color="rgba(0,0,0,0)", size=25), showlegend=False))
-
-                    fig_heat.add_shape(type="rect", x0=z_x_start+grid_side, x1=z_x_start+4*grid_side, y0=z_y_start+grid_side, y1=z_y_start+4*grid_side, line=dict(color="red", width=4), layer="above")
-                    fig_heat.update_layout(width=900, height=650, xaxis=dict(range=[-320, 320], visible=False), yaxis=dict(range=[-40, 520], visible=False), margin=dict(l=0, r=0, t=10, b=0))
-                    st.plotly_chart(fig_heat, use_container_width=True)
+                        # 25マスを 1 つのヒートマップ + 1 つの文字トレースで描く
+                        fmt = metric_info.fmt
+                        cell_colors, font_colors = get_colors(display_grid, target_metric, rows=ROWS_5X5)
+                        labels = np.full((5, 5), "", dtype=object); hovers = np.full((5, 5), "", dtype=object)
+                        for r in range(5):
+                            for c in range(5):
+                                val_h = display_grid[r, c]
+                                if grid_count[r, c] > 0:
+                                    v_max, v_min, v_cnt = grid_max[r, c], grid_min[r, c], int(grid_count[r, c])
+                                    labels[r, c] = f"{val_h:{fmt}}"
+                                    hovers[r, c] = (f"平均: {val_h:{fmt}}<br>最大: {v_max:{fmt}}<br>最小: {v_min:{fmt}}<br>試行: {v_cnt}")
+                        figures.add_grid(
+                            fig_heat, cell_colors,
+                            x_edges=z_x_start + grid_side * np.arange(6), y_edges=z_y_start + grid_side * (5 - np.arange(6)),
+                            labels=labels, font_colors=font_colors, hover=hovers, line=dict(color="#222", width=1),
+                        )
+
+                        fig_heat.add_shape(type="rect", x0=z_x_start+grid_side, x1=z_x_start+4*grid_side, y0=z_y_start+grid_side, y1=z_y_start+4*grid_side, line=dict(color="red", width=4), layer="above")
+                        fig_heat.update_layout(width=900, height=650, xaxis=dict(range=[-320, 320], visible=False), yaxis=dict(range=[-40, 520], visible=False), margin=dict(l=0, r=0, t=10, b=0))
+                        return fig_heat
+
+                    fig_heat = cached_figure("heat5", practice_store, tab1_view, build_heat)
+                    show_chart(fig_heat, use_container_width=True)
 
                     st.subheader(f"📍 {target_metric}：インパクトポイント")
-                    fig_point = go.Figure()
-                    fig_point.add_shape(type="rect", x0=-250, x1=250, y0=-50, y1=300, fillcolor="#8B4513", line_width=0, layer="below")
-                    fig_point.add_shape(type="path", path="M -30 15 L 30 15 L 30 8 L 0 0 L -30 8 Z", fillcolor="white", line=dict(color="#444", width=2))
-                    bx = 75 if hand == "左" else -75
-                    fig_point.add_shape(type="rect", x0=bx-15, x1=bx+15, y0=20, y1=160, fillcolor="rgba(200,200,200,0.4)", line_width=0)
-                    fig_point.add_shape(type="circle", x0=bx-10, x1=bx+10, y0=165, y1=195, fillcolor="rgba(200,200,200,0.4)", line_width=0)
-                    fig_point.add_shape(type="rect", x0=SZ_X_MIN, x1=SZ_X_MAX, y0=SZ_Y_MIN, y1=SZ_Y_MAX, line=dict(color="rgba(255,255,255,0.8)", width=4))
-                    for _, row in vdf.dropna(subset=['StrikeZoneX', 'StrikeZoneY', target_metric]).iterrows():
-                        plot_x = row['StrikeZoneX']
-                        r_pt = 0 if row['StrikeZoneY'] > SZ_Y_TH2 else 1 if row['StrikeZoneY'] > SZ_Y_TH1 else 2
-                        dot_color, _ = get_color(row[target_metric], target_metric, row_idx=r_pt)
-                        fig_point.add_trace(go.Scatter(x=[plot_x], y=[row['StrikeZoneY']], mode='markers', marker=dict(size=14, color=dot_color, line=dict(width=1.2, color="white")), showlegend=False))
-                    fig_point.update_layout(height=750, xaxis=dict(range=[-130, 130], visible=False), yaxis=dict(range=[-20, 230], visible=False), margin=dict(l=0, r=0, t=10, b=0))
-                    st.plotly_chart(fig_point, use_container_width=True)
+                    def build_points():
+                        fig_point = go.Figure()
+                        fig_point.add_shape(type="rect", x0=-250, x1=250, y0=-50, y1=300, fillcolor="#8B4513", line_width=0, layer="below")
+                        fig_point.add_shape(type="path", path="M -30 15 L 30 15 L 30 8 L 0 0 L -30 8 Z", fillcolor="white", line=dict(color="#444", width=2))
+                        bx = 75 if hand == "左" else -75
+                        fig_point.add_shape(type="rect", x0=bx-15, x1=bx+15, y0=20, y1=160, fillcolor="rgba(200,200,200,0.4)", line_width=0)
+                        fig_point.add_shape(type="circle", x0=bx-10, x1=bx+10, y0=165, y1=195, fillcolor="rgba(200,200,200,0.4)", line_width=0)
+                        fig_point.add_shape(type="rect", x0=SZ_X_MIN, x1=SZ_X_MAX, y0=SZ_Y_MIN, y1=SZ_Y_MAX, line=dict(color="rgba(255,255,255,0.8)", width=4))
+                        # 個々のスイングを描く点グラフだけは行単位のデータを使う（選手・期間は日付索引の二分探索で取り出す）
+                        pdf = db_df.iloc[date_index.get_index(practice_store).rows(target_player, start, end)]
+                        vdf = pdf[pdf[cond_col].isin(sel_conds)]
+                        vals = swing_store.metric_values(vdf, target_metric).to_numpy()
+                        pt_rows, pt_cols = vdf[swing_store.ZONE_ROW3].to_numpy(), vdf[swing_store.ZONE_COL3].to_numpy()
+                        plot_ok = np.flatnonzero((pt_rows >= 0) & (pt_cols >= 0) & ~np.isnan(vals))
+                        # 点が多いときはサーバー側で間引き、1 つの WebGL トレースで描く
+                        shown = plot_ok[figures.decimate(len(plot_ok))]
+                        # 点の色は値と Plotly のカラースケールで付ける（アッパースイング度は高さごとにスケールが違うので高さごとに 1 トレース）
+                        pt_x, pt_y = vdf['StrikeZoneX'].to_numpy(), vdf['StrikeZoneY'].to_numpy()
+                        scale = metrics.color_scale(target_metric)
+                        groups = [(r, shown[pt_rows[shown] == r]) for r in range(3)] if scale == "upper_swing" else [(None, shown)]
+                        for row, idx in groups:
+                            if len(idx) == 0:
+                                continue
+                            lo, hi = vals[idx].min(), vals[idx].max()
+                            hi = hi if hi > lo else lo + 1.0  # 値が 1 種類だけのときも範囲を持たせる (plotly_colorscale と同じ)
+                            figures.add_points(fig_point, pt_x[idx], pt_y[idx], vals[idx], colorscale=(color_scales.plotly_colorscale(scale, lo, hi, row=row), lo, hi))
+                        fig_point.update_layout(height=750, xaxis=dict(range=[-130, 130], visible=False), yaxis=dict(range=[-20, 230], visible=False), margin=dict(l=0, r=0, t=10, b=0))
+                        return fig_point, len(plot_ok), len(shown)
+
+                    fig_point, n_plot, n_shown = cached_figure("points", practice_store, tab1_view, build_points)
+                    show_chart(fig_point, use_container_width=True)
+                    if n_shown < n_plot:
+                        st.caption(f"※ 点が多いため {n_plot}件中 {n_shown}件を間引いて表示しています")
 
                     st.subheader(f"📈 {target_metric}：月別推移")
-                    pdf_for_graph = pdf.copy()
-                    if "手の最大スピード" in target_metric and "バットスピード (km/h)" in pdf_for_graph.columns:
-                        pdf_for_graph[target_metric] = pd.to_numeric(pdf_for_graph['バットスピード (km/h)'], errors='coerce') / pd.to_numeric(pdf_for_graph[target_metric], errors='coerce')
-                    else:
-                        pdf_for_graph[target_metric] = pd.to_numeric(pdf_for_graph[target_metric], errors='coerce')
-                    pdf_for_graph['Month_Name'] = pd.to_datetime(pdf_for_graph['Date_Only']).dt.month.astype(str) + "月"
-                    pdf_for_graph['Month_Sort'] = pd.to_datetime(pdf_for_graph['Date_Only']).dt.strftime('%Y-%m')
-                    graph_df = pdf_for_graph[pdf_for_graph[cond_col].isin(sel_conds)].dropna(subset=[target_metric])
-                    if not graph_df.empty:
-                        monthly_stats = graph_df.groupby(['Month_Sort', 'Month_Name'])[target_metric].agg(['mean', 'max', 'min']).reset_index()
-                        monthly_stats = monthly_stats.sort_values('Month_Sort')
+                    monthly_stats = cube_p.monthly(cube_p.mask(players=[target_player], conds=sel_conds), target_metric)
+                    if not monthly_stats.empty:
                         fig_trend = go.Figure()
-                        is_time = "時間" in target_metric
+                        is_time = metric_info.smaller_is_better
                         trend_best_label = "月間最速(MIN)" if is_time else "月間最大(MAX)"
                         trend_best_val = monthly_stats['min'] if is_time else monthly_stats['max']
                         fig_trend.add_trace(go.Scatter(x=monthly_stats['Month_Name'], y=trend_best_val, name=trend_best_label, line=dict(color='#FF4B4B', width=4), mode='lines+markers'))
                         fig_trend.add_trace(go.Scatter(x=monthly_stats['Month_Name'], y=monthly_stats['mean'], name="月間平均", line=dict(color='#0068C9', width=3, dash='dot'), mode='lines+markers'))
                         fig_trend.update_layout(height=350, margin=dict(l=20, r=20, t=20, b=20), hovermode="x unified", legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1), yaxis=dict(rangemode="tozero"), xaxis=dict(type='category'))
-                        st.plotly_chart(fig_trend, use_container_width=True)
+                        show_chart(fig_trend, use_container_width=True)
+
+                    st.subheader("🧭 打球方向・飛距離（スプレーチャート）")
+                    # 打球は方向 × 飛距離のマスごとに集計したキューブで答える（期間内の打球数によらず一定時間）
+                    spray_cube = spray.get_cube(practice_store)
+                    sc1, sc2 = st.columns([2, 3])
+                    with sc1: spray_scope = st.radio("対象", ["選手", "チーム全体"], horizontal=True, key="scope_spray")
+                    with sc2: spray_metric = st.radio("色分け", [spray.EXIT_VELOCITY, spray.LAUNCH_ANGLE], horizontal=True, key="m_spray")
+                    spray_players = None if spray_scope == "チーム全体" else [target_player]
+                    smask = spray_cube.mask(players=spray_players, conds=sel_conds, start=start, end=end)
+                    n_hits, ev_avg, _, _ = spray_cube.stats(smask, spray.EXIT_VELOCITY)
+                    if n_hits == 0:
+                        st.info("ℹ️ 期間内に打球方向・飛距離のある打球がありません。")
+                    else:
+                        la_avg = spray_cube.stats(smask, spray.LAUNCH_ANGLE)[1]
+                        hard_rate = spray_cube.stats(smask, spray.HARD_HIT)[1]
+                        sweet_rate = spray_cube.stats(smask, spray.SWEET_SPOT_RATE)[1]
+                        pct = lambda v: "-" if np.isnan(v) else f"{v:.0%}"
+                        sm1, sm2, sm3, sm4 = st.columns(4)
+                        sm1.metric("打球速度 平均", f"{ev_avg:.1f}")
+                        sm2.metric("打球角度 平均", "-" if np.isnan(la_avg) else f"{la_avg:.1f}")
+                        sm3.metric(f"強い打球 ({spray.HARD_HIT_KMH:.0f}km/h〜)", pct(hard_rate))
+                        sm4.metric(f"理想角度 ({spray.SWEET_SPOT[0]:.0f}〜{spray.SWEET_SPOT[1]:.0f}°)", pct(sweet_rate))
+
+                        def build_spray():
+                            cells = spray.cell_stats(spray_cube, smask, spray_metric)
+                            ev_cells = spray.cell_stats(spray_cube, smask, spray.EXIT_VELOCITY)
+                            la_cells = spray.cell_stats(spray_cube, smask, spray.LAUNCH_ANGLE)
+                            hard_cells = spray.cell_stats(spray_cube, smask, spray.HARD_HIT)
+                            sweet_cells = spray.cell_stats(spray_cube, smask, spray.SWEET_SPOT_RATE)
+                            cell_colors, font_colors = get_colors(cells.mean, spray_metric)
+                            labels = np.full((5, 5), "", dtype=object); hovers = np.full((5, 5), "", dtype=object)
+                            for r in range(5):
+                                for c in range(5):
+                                    n_cell = int(ev_cells.count[r, c])
+                                    if cells.count[r, c] > 0:
+                                        labels[r, c] = f"{cells.mean[r, c]:.0f}"
+                                    if n_cell > 0 or cells.count[r, c] > 0:
+                                        hovers[r, c] = (
+                                            f"{SPRAY_SECTORS[c]} / {SPRAY_RINGS[r]}<br>"
+                                            f"打球速度 平均: {ev_cells.mean[r, c]:.1f}<br>打球角度 平均: {la_cells.mean[r, c]:.1f}<br>"
+                                            f"強い打球: {pct(hard_cells.mean[r, c])}<br>理想角度: {pct(sweet_cells.mean[r, c])}<br>打球数: {n_cell}"
+                                        )
+                            fig_spray = go.Figure()
+                            figures.add_fan(
+                                fig_spray, cell_colors, SPRAY_ANGLE_EDGES, spray.FAN_RADIUS_EDGES,
+                                labels=labels, font_colors=font_colors, hover=hovers, line=dict(color="#222", width=1),
+                            )
+                            fig_spray.update_layout(
+                                height=520, margin=dict(l=20, r=20, t=20, b=20), paper_bgcolor="#1a4314",
+                                polar=dict(
+                                    sector=[45, 135], bgcolor="#1a4314",
+                                    angularaxis=dict(rotation=90, direction="clockwise", tickvals=list(SPRAY_ANGLE_EDGES), ticksuffix="°", color="white"),
+                                    radialaxis=dict(range=[0, spray.FAN_RADIUS_EDGES[-1]], tickvals=list(spray.FAN_RADIUS_EDGES[1:-1]), ticksuffix="m", color="white"),
+                                ),
+                            )
+                            return fig_spray
+
+                        spray_view = (spray_scope, None if spray_players is None else target_player, tuple(sel_conds), start, end, spray_metric)
+                        fig_spray = cached_figure("spray", practice_store, spray_view, build_spray)
+                        show_chart(fig_spray, use_container_width=True)
+                        st.caption(f"※ {n_hits}件の打球。マスの数字は{spray_metric}の平均（打球方向はセンター 0°、右方向が正。110m以上は外周のマスにまとめて表示）")
                         
+    profiling.stage(None)
+
     with tab2:
         st.title("⚔️ 選手間比較分析")
-        if not db_df.empty:
-            player_col = 'Player Name' if 'Player Name' in db_df.columns else db_df.columns[-1]
-            existing_players = sort_players_by_number(db_df[player_col].dropna().unique().tolist())
+        if is_open(tab2) and not db_df.empty:
+            profiling.stage("tab2.filter")
+            cube_p = get_analysis(practice_store)
+            existing_players = sort_players_by_number(cube_p.observed_players())
             
-            keywords = ["スコア", "速度", "角度", "効率", "パワー", "時間", "スピード", "飛距離", "G)", "度"]
-            all_metrics_c = [c for c in db_df.columns if any(k in str(c) for k in keywords)]
-            all_metrics_c = [c for c in all_metrics_c if pd.to_numeric(db_df[c], errors='coerce').dropna().any()]
+            all_metrics_c = practice_metrics.for_players()
             
             priority = ["バットスピード (km/h)", "スイング時間 (秒)", "アッパースイング度 (°)"]
             sorted_comp_metrics = [m for m in priority if m in all_metrics_c] + [m for m in all_metrics_c if m not in priority]
@@ -537,39 +525,29 @@ else:
             c1, c2 = st.columns(2)
             with c1: comp_metric = st.selectbox("比較指標", sorted_comp_metrics, key="m_tab2")
             with c2:
-                cond_col = 'スイング条件' if 'スイング条件' in db_df.columns else 'スイング条件_str'
-                all_conds_c = sorted([str(x) for x in db_df[cond_col].unique().tolist()])
+                cond_col = practice_store.cond_col
+                all_conds_c = sorted(db_df[cond_col].unique().tolist())
                 sel_conds_c = st.multiselect("打撃条件で絞り込む", all_conds_c, default=all_conds_c, key="cond_tab2")
             
-            db_df_c = db_df.copy()
-            db_df_c[cond_col] = db_df_c[cond_col].fillna("未設定").astype(str).str.strip()
-            fdf = db_df_c[db_df_c[cond_col].isin(sel_conds_c)].copy()
+            fmask = cube_p.mask(conds=sel_conds_c)
             
-            if not fdf.empty and comp_metric:
-                if "手の最大スピード" in comp_metric:
-                    fdf[comp_metric] = pd.to_numeric(fdf['バットスピード (km/h)'], errors='coerce') / pd.to_numeric(fdf[comp_metric], errors='coerce')
-                else:
-                    fdf[comp_metric] = pd.to_numeric(fdf[comp_metric], errors='coerce')
-                fdf['StrikeZoneY'] = pd.to_numeric(fdf['StrikeZoneY'], errors='coerce')
-                is_time = "スイング時間" in comp_metric
+            if cube_p.row_count(fmask) > 0 and comp_metric:
+                profiling.stage("tab2.aggregate")
+                comp_info = practice_metrics.get(comp_metric)
+                is_time = comp_info.smaller_is_better
                 is_upper = "アッパースイング度" in comp_metric
 
                 st.subheader(f"🥇 {'理想範囲への的中率' if is_upper else '指標別'} トップ3")
                 
                 if is_upper:
-                    def check_success(row):
-                        val, y = row[comp_metric], row['StrikeZoneY']
-                        if pd.isna(val) or pd.isna(y): return None
-                        if y > SZ_Y_TH2: return 3.0 <= val <= 10.0
-                        elif y > SZ_Y_TH1: return 8.0 <= val <= 15.0
-                        else: return 10.0 <= val <= 20.0
-                    fdf['is_success'] = fdf.apply(check_success, axis=1)
-                    top3_series = fdf.groupby(player_col)['is_success'].mean().sort_values(ascending=False).head(3)
+                    # 高さ(行)ごとの理想範囲への的中 (1/0) をキューブで集計済み
+                    top3_series = cube_p.top(fmask, comp_metric + cube.IDEAL_SUFFIX, 3)
                     top3_scores = [f"{s*100:.1f}%" for s in top3_series.values]
                 else:
-                    top3_series = fdf.groupby(player_col)[comp_metric].mean().sort_values(ascending=is_time).head(3)
-                    top3_scores = [f"{s:.2f}" if "手の最大スピード" in comp_metric else (f"{s:.3f}" if is_time else f"{s:.1f}") for s in top3_series.values]
+                    top3_series = cube_p.top(fmask, comp_metric, 3, ascending=is_time)
+                    top3_scores = [f"{s:{comp_info.fmt}}" for s in top3_series.values]
 
+                profiling.stage("tab2.render")
                 top3_names = top3_series.index.tolist()
                 podium_order = [1, 0, 2] if len(top3_names) >= 3 else list(range(len(top3_names)))
                 t_cols = st.columns(3)
@@ -578,15 +556,21 @@ else:
                         name, score_str, rank = top3_names[idx], top3_scores[idx], idx + 1
                         with t_cols[i]:
                             st.markdown(f"<div style='text-align: center; background-color: #333; padding: 5px; border-radius: 5px;'><span style='font-size: 1.1rem; font-weight: bold; color: white;'>{rank}位: {name}</span><br><span style='font-size: 0.9rem; color: #ddd;'>{score_str}</span></div>", unsafe_allow_html=True)
-                            grid, _ = get_3x3_grid(fdf[fdf[player_col] == name], comp_metric)
-                            fig = go.Figure()
-                            for r_idx in range(3):
-                                for c_idx in range(3):
-                                    v = grid[r_idx, c_idx]; color, f_color = get_color(v, comp_metric, row_idx=r_idx)
-                                    fig.add_shape(type="rect", x0=c_idx-0.5, x1=c_idx+0.5, y0=2.5-r_idx, y1=1.5-r_idx, fillcolor=color, line=dict(color="#222", width=2))
-                                    if v > 0: fig.add_annotation(x=c_idx, y=2-r_idx, text=f"{v:.2f}" if "手の最大スピード" in comp_metric else (f"{v:.3f}" if is_time else f"{v:.1f}"), showarrow=False, font=dict(color=f_color, weight="bold", size=14))
-                            fig.update_layout(height=350, margin=dict(l=5, r=5, t=5, b=5), xaxis=dict(visible=False, range=[-0.6, 2.6]), yaxis=dict(visible=False, range=[-0.6, 2.6]), plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', showlegend=False)
-                            st.plotly_chart(fig, use_container_width=True, key=f"top3_{rank}", config={'displayModeBar': False})
+                            def build_podium():
+                                grid, _ = get_3x3_grid(cube_p, fmask & cube_p.mask(players=[name]), comp_metric)
+                                fig = go.Figure()
+                                cell_colors, font_colors = get_colors(grid, comp_metric, rows=ROWS_3X3)
+                                labels = np.full((3, 3), "", dtype=object)
+                                for r_idx in range(3):
+                                    for c_idx in range(3):
+                                        v = grid[r_idx, c_idx]
+                                        if v > 0: labels[r_idx, c_idx] = f"{v:{comp_info.fmt}}"
+                                figures.add_grid(fig, cell_colors, x_edges=[-0.5, 0.5, 1.5, 2.5], y_edges=[2.5, 1.5, 0.5, -0.5], labels=labels, font_colors=font_colors, line=dict(color="#222", width=2))
+                                fig.update_layout(height=350, margin=dict(l=5, r=5, t=5, b=5), xaxis=dict(visible=False, range=[-0.6, 2.6]), yaxis=dict(visible=False, range=[-0.6, 2.6]), plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)', showlegend=False)
+                                return fig
+
+                            fig = cached_figure("podium", practice_store, (name, tuple(sel_conds_c), comp_metric), build_podium)
+                            show_chart(fig, use_container_width=True, key=f"top3_{rank}", config={'displayModeBar': False})
 
                 st.markdown("---")
                 st.subheader("🆚 2名ピックアップ比較")
@@ -594,29 +578,41 @@ else:
                 with ca: player_a = st.selectbox("選手Aを選択", existing_players, key="compare_a")
                 with cb: player_b = st.selectbox("選手Bを選択", existing_players, key="compare_b")
                 if player_a and player_b:
-                    limit = 0.05 if "手の最大スピード" in comp_metric else (0.010 if is_time else 5.0)
-                    g_a, _ = get_3x3_grid(fdf[fdf[player_col] == player_a], comp_metric)
-                    g_b, _ = get_3x3_grid(fdf[fdf[player_col] == player_b], comp_metric)
+                    limit = comp_info.tolerance
+                    g_a, _ = cached_figure("grid3", practice_store, (player_a, tuple(sel_conds_c), comp_metric), lambda: get_3x3_grid(cube_p, fmask & cube_p.mask(players=[player_a]), comp_metric))
+                    g_b, _ = cached_figure("grid3", practice_store, (player_b, tuple(sel_conds_c), comp_metric), lambda: get_3x3_grid(cube_p, fmask & cube_p.mask(players=[player_b]), comp_metric))
                     p_cols = st.columns(2)
                     for idx, (name, mine, yours) in enumerate([(player_a, g_a, g_b), (player_b, g_b, g_a)]):
                         with p_cols[idx]:
                             st.write(f"**{name} の傾向**")
-                            fig_pair = go.Figure()
-                            for r_idx in range(3):
-                                for c_idx in range(3):
-                                    v, ov = mine[r_idx, c_idx], yours[r_idx, c_idx]
-                                    diff = abs(v - ov) if (v > 0 and ov > 0) else 0
-                                    lw, lc = (5, "yellow") if diff >= limit else (1, "gray")
-                                    if is_time: font_c = "red" if (v < ov and v > 0 and ov > 0) else "blue" if (v > ov and v > 0 and ov > 0) else "black"
-                                    else: font_c = "red" if (v > ov and v > 0 and ov > 0) else "blue" if (v < ov and v > 0 and ov > 0) else "black"
-                                    fig_pair.add_shape(type="rect", x0=c_idx-0.5, x1=c_idx+0.5, y0=2.5-r_idx, y1=1.5-r_idx, fillcolor="white", line=dict(color=lc, width=lw))
-                                    if v > 0: fig_pair.add_annotation(x=c_idx, y=2-r_idx, text=f"{v:.2f}" if "手の最大スピード" in comp_metric else (f"{v:.3f}" if is_time else f"{v:.1f}"), showarrow=False, font=dict(color=font_c, weight="bold", size=16))
-                            fig_pair.update_layout(height=400, margin=dict(t=30), xaxis=dict(tickvals=[0,1,2], ticktext=['左','中','右'], side="top"), yaxis=dict(tickvals=[0,1,2], ticktext=['高','中','低']))
-                            st.plotly_chart(fig_pair, use_container_width=True, key=f"pair_{idx}")
+                            def build_pair():
+                                fig_pair = go.Figure()
+                                font_colors = np.full((3, 3), "black", dtype=object); labels = np.full((3, 3), "", dtype=object)
+                                highlight = []
+                                for r_idx in range(3):
+                                    for c_idx in range(3):
+                                        v, ov = mine[r_idx, c_idx], yours[r_idx, c_idx]
+                                        diff = abs(v - ov) if (v > 0 and ov > 0) else 0
+                                        if diff >= limit: highlight.append((r_idx, c_idx))
+                                        if is_time: font_colors[r_idx, c_idx] = "red" if (v < ov and v > 0 and ov > 0) else "blue" if (v > ov and v > 0 and ov > 0) else "black"
+                                        else: font_colors[r_idx, c_idx] = "red" if (v > ov and v > 0 and ov > 0) else "blue" if (v < ov and v > 0 and ov > 0) else "black"
+                                        if v > 0: labels[r_idx, c_idx] = f"{v:{comp_info.fmt}}"
+                                figures.add_grid(fig_pair, np.full((3, 3), "white", dtype=object), x_edges=[-0.5, 0.5, 1.5, 2.5], y_edges=[2.5, 1.5, 0.5, -0.5], labels=labels, font_colors=font_colors, line=dict(color="gray", width=1), font_size=16)
+                                # 差が大きいマスだけ黄色の太枠で囲む
+                                for r_idx, c_idx in highlight:
+                                    fig_pair.add_shape(type="rect", x0=c_idx-0.5, x1=c_idx+0.5, y0=2.5-r_idx, y1=1.5-r_idx, line=dict(color="yellow", width=5))
+                                fig_pair.update_layout(height=400, margin=dict(t=30), xaxis=dict(tickvals=[0,1,2], ticktext=['左','中','右'], side="top"), yaxis=dict(tickvals=[0,1,2], ticktext=['高','中','低']))
+                                return fig_pair
+
+                            other = player_b if idx == 0 else player_a
+                            fig_pair = cached_figure("pair", practice_store, (name, other, tuple(sel_conds_c), comp_metric), build_pair)
+                            show_chart(fig_pair, use_container_width=True, key=f"pair_{idx}")
+
+        profiling.stage(None)
 
     with tab3:
         st.title("📝 データ登録")
-        sub_tab_practice, sub_tab_game = st.tabs(["🏋️ 練習データ登録", "🏟️ 試合データ登録"])
+        sub_tab_practice, sub_tab_game, sub_tab_bulk = st.tabs(["🏋️ 練習データ登録", "🏟️ 試合データ登録", "📦 一括登録"])
         reg_players_sorted = sort_players_by_number(PLAYERS)
         
         with sub_tab_practice:
@@ -627,65 +623,84 @@ else:
             if p_uploaded_file is not None:
                 try:
                     input_df = pd.read_excel(p_uploaded_file)
-                    input_df['試合区別'] = "練習"
                     if st.button("練習データをGitHubへ保存"):
                         with st.spinner('保存中...'):
-                            time_col_name = input_df.columns[0]
-                            cmap = {time_col_name: 'time_col', 'ExitVelocity': '打球速度', 'PitchBallVelocity': '投球速度', 'LaunchAngle': '打球角度', 'ExitDirection': '打球方向', 'Spin': '回転数', 'Distance': '飛距離', 'SpinDirection': '回転方向'}
-                            input_df = input_df.rename(columns=cmap)
-                            date_str = p_reg_date.strftime('%Y-%m-%d')
-                            input_df['DateTime'] = date_str + ' ' + input_df['time_col'].astype(str).str.strip()
-                            input_df['Player Name'] = p_reg_player
-                            if 'スイング条件' not in input_df.columns: input_df['スイング条件'] = "未設定"
-                            # --- 修正：練習用パスへ保存 ---
-                            latest_db = load_data_from_github(GITHUB_FILE_PATH)
-                            updated_db = pd.concat([latest_db, input_df], ignore_index=True) if not latest_db.empty else input_df
-                            success, message = save_to_github(updated_db, GITHUB_FILE_PATH)
-                            if success: st.success("✅ 練習データを保存しました！"); st.balloons()
-                            else: st.error(f"❌ 失敗: {message}")
+                            input_df = ingest.prepare_rows(input_df, p_reg_player, p_reg_date)
+                            # --- 修正：練習用パスへ保存（追記のみ・登録済みの行は除く） ---
+                            save_new_rows(input_df, GITHUB_FILE_PATH, lambda n: "✅ 練習データを保存しました！")
                 except Exception as e: st.error(f"❌ エラー: {e}")
 
         with sub_tab_game:
             c1, c2, c3 = st.columns(3)
             with c1: g_reg_player = st.selectbox("登録する選手を選択", reg_players_sorted, key="reg_p_game")
             with c2: g_reg_date = st.date_input("打撃日を選択", value=datetime.date.today(), key="reg_d_game")
-            with c3: game_category = st.selectbox("試合区別", ["オープン戦", "紅白戦", "JAVA大会", "二大大会", "二大大会予選", "その他"], key="reg_cat_game")
+            with c3: game_category = st.selectbox("試合区別", GAME_CATEGORIES, key="reg_cat_game")
             g_uploaded_file = st.file_uploader("試合のExcelファイルをアップロード (.xlsx)", type=["xlsx"], key="file_game")
             if g_uploaded_file is not None:
                 try:
                     input_df = pd.read_excel(g_uploaded_file)
-                    input_df['試合区別'] = game_category
-                    
-                    # --- 追加修正：試合データの「コース」列を解析して座標列を作る ---
-                    if 'コース' in input_df.columns:
-                        coords = input_df['コース'].apply(convert_course_to_coord)
-                        input_df['StrikeZoneX'] = [c[0] for c in coords]
-                        input_df['StrikeZoneY'] = [c[1] for c in coords]
-                    
                     if st.button("試合データをGitHubへ保存"):
                         with st.spinner('保存中...'):
-                            time_col_name = input_df.columns[0]
-                            cmap = {time_col_name: 'time_col', 'ExitVelocity': '打球速度', 'PitchBallVelocity': '投球速度', 'LaunchAngle': '打球角度', 'ExitDirection': '打球方向', 'Spin': '回転数', 'Distance': '飛距離', 'SpinDirection': '回転方向'}
-                            input_df = input_df.rename(columns=cmap)
-                            date_str = g_reg_date.strftime('%Y-%m-%d')
-                            input_df['DateTime'] = date_str + ' ' + input_df['time_col'].astype(str).str.strip()
-                            input_df['Player Name'] = g_reg_player
-                            if 'スイング条件' not in input_df.columns: input_df['スイング条件'] = "未設定"
-                            # --- 修正：試合用パスへ保存 ---
-                            latest_db = load_data_from_github(GITHUB_GAME_FILE_PATH)
-                            updated_db = pd.concat([latest_db, input_df], ignore_index=True) if not latest_db.empty else input_df
-                            success, message = save_to_github(updated_db, GITHUB_GAME_FILE_PATH)
-                            if success: st.success(f"✅ [{game_category}] データを保存しました！"); st.balloons()
-                            else: st.error(f"❌ 失敗: {message}")
+                            # 「コース」列の座標変換・列名変換・DateTime 作成は ingest.prepare_rows で行う
+                            input_df = ingest.prepare_rows(input_df, g_reg_player, g_reg_date, category=game_category)
+                            # --- 修正：試合用パスへ保存（追記のみ・登録済みの試合は除く） ---
+                            save_new_rows(input_df, GITHUB_GAME_FILE_PATH, lambda n: f"✅ [{game_category}] データを保存しました！")
+                except Exception as e: st.error(f"❌ エラー: {e}")
+
+        # --- 一括登録：複数のExcel (またはzip) をまとめて並列に読み込み、1回で保存 ---
+        with sub_tab_bulk:
+            c1, c2 = st.columns(2)
+            with c1: bulk_kind = st.radio("登録先", ["練習", "試合"], horizontal=True, key="reg_kind_bulk")
+            with c2: bulk_category = st.selectbox("試合区別", GAME_CATEGORIES, key="reg_cat_bulk", disabled=(bulk_kind == "練習"))
+            bulk_files = st.file_uploader("Excelファイル (.xlsx) または zip をまとめてアップロード", type=["xlsx", "zip"], accept_multiple_files=True, key="file_bulk")
+            if bulk_files:
+                try:
+                    items = ingest.expand_uploads([(f.name, f.getvalue()) for f in bulk_files])
+                    if not items:
+                        st.warning("⚠️ Excelファイルが見つかりません。")
+                    else:
+                        # ファイル名から選手・日付を推定し、表で確認・修正してから保存する
+                        plan = pd.DataFrame({
+                            "ファイル": [name for name, _ in items],
+                            "選手": [ingest.infer_player(name, reg_players_sorted) for name, _ in items],
+                            "打撃日": [ingest.infer_date(name) or datetime.date.today() for name, _ in items],
+                        })
+                        plan = st.data_editor(
+                            plan,
+                            column_config={
+                                "ファイル": st.column_config.TextColumn(disabled=True),
+                                "選手": st.column_config.SelectboxColumn(options=reg_players_sorted, required=True),
+                                "打撃日": st.column_config.DateColumn(required=True),
+                            },
+                            hide_index=True,
+                            use_container_width=True,
+                            key="plan_bulk",
+                        )
+                        if plan["選手"].isna().any():
+                            st.warning("⚠️ 選手が未設定のファイルがあります。表で選択してください。")
+                        elif st.button(f"{len(items)}ファイルをまとめてGitHubへ保存"):
+                            with st.spinner('読み込み・保存中...'):
+                                category = ingest.PRACTICE_CATEGORY if bulk_kind == "練習" else bulk_category
+                                assignments = list(zip(plan["選手"], pd.to_datetime(plan["打撃日"])))
+                                batch_df = ingest.build_batch(items, assignments, category=category)
+                                target_path = GITHUB_FILE_PATH if bulk_kind == "練習" else GITHUB_GAME_FILE_PATH
+                                if batch_df.empty:
+                                    st.error("❌ 失敗: データが空です")
+                                else:
+                                    save_new_rows(batch_df, target_path, lambda n: f"✅ {len(items)}ファイル / {n}件のデータを保存しました！")
                 except Exception as e: st.error(f"❌ エラー: {e}")
 
        # --- タブ4：試合分析 (構成入れ替え：ヒートマップ → 詳細データ) ---
     with tab4:
         st.title("🏟️ 試合分析")
         
-        if not db_game.empty:
+        if is_open(tab4) and not db_game.empty:
+            profiling.stage("tab4.filter")
+            # ストライク状況・球種・結果・コース別の集計は状況別キューブ（リビジョンごとに一度だけ構築）を絞り込んで行う
+            # BATTING_SQL_ENGINE を指定したときは同じ集計を SQL で行う
+            game_split = sql_engine.get_table(game_store, hand_ratio=False) if sql_engine.enabled() else split_cube.get_cube(game_store)
             # 1. 選手選択
-            game_player_col = 'Player Name' if 'Player Name' in db_game.columns else db_game.columns[-1]
+            game_player_col = game_store.player_col
             game_players = sort_players_by_number(db_game[game_player_col].dropna().unique().tolist())
             
             c1, c2, c3 = st.columns([2, 3, 3])
@@ -696,21 +711,17 @@ else:
             player_hand = PLAYER_HANDS.get(target_game_player, "右")
             st.markdown(f"👤 **{target_game_player}** ({player_hand}打者) の視点で表示中")
             
-            gdf = db_game[db_game[game_player_col] == target_game_player].copy()
+            # 選手・期間の絞り込みは日付索引（リビジョンごとに一度だけ構築）の二分探索で行う
+            game_index = date_index.get_index(game_store)
+            gdf = db_game.iloc[game_index.rows(target_game_player)]
             
             if not gdf.empty:
-                # ─── 【強化修正】DateTimeから日付文字列（YYYY-MM-DD）のみを抽出してパース ───
-                # time_col のバグで DateTime が壊れていても、先頭の10文字（日付部分）を生かす
-                gdf['Date_Only_Str'] = gdf['DateTime'].astype(str).str.slice(0, 10)
-                gdf['DateTime_Parsed'] = pd.to_datetime(gdf['Date_Only_Str'], format='%Y-%m-%d', errors='coerce')
+                # DateTime の日付部分はストア構築時に解析済み（time_col が壊れていても日付は生かす）
+                min_date, max_date = game_index.bounds(target_game_player)
                 
-                valid_dates = gdf['DateTime_Parsed'].dropna()
-                
-                if valid_dates.empty:
+                if min_date is None:
                     st.error("⚠️ データの「DateTime」列から日付を読み取れませんでした。Excelデータ自体の1列目（時間列など）が空欄になっていないか確認してください。")
                 else:
-                    min_date = valid_dates.min().date()
-                    max_date = valid_dates.max().date()
                     
                     # カレンダーで期間を指定
                     selected_date_range = st.date_input(
@@ -725,10 +736,7 @@ else:
                     if isinstance(selected_date_range, tuple) and len(selected_date_range) == 2:
                         start_date, end_date = selected_date_range
                         # 選択された期間でgdfを先行してフィルタリング
-                        gdf = gdf[
-                            (gdf['DateTime_Parsed'].dt.date >= start_date) & 
-                            (gdf['DateTime_Parsed'].dt.date <= end_date)
-                        ].copy()
+                        gdf = db_game.iloc[game_index.rows(target_game_player, start_date, end_date)]
                     
                     # 期間絞り込み後にデータが残っているか再確認
                     if gdf.empty:
@@ -742,24 +750,23 @@ else:
                             selected_cat = st.selectbox("試合種別を選択", game_cats, key="cat_tab4")
                         
                         if selected_cat == "全試合":
-                            cat_filtered_df = gdf.copy()
+                            cat_filtered_df = gdf
                         else:
-                            cat_filtered_df = gdf[gdf['試合区別'] == selected_cat].copy()
+                            cat_filtered_df = gdf[gdf['試合区別'] == selected_cat]
 
-                        # 3. 試合（対戦相手）の選択
-                        opponent_col = cat_filtered_df.columns[0]
-                        cat_filtered_df['Match_Label'] = cat_filtered_df[opponent_col].astype(str) + " (" + cat_filtered_df['DateTime'].astype(str).str[:10] + ")"
+                        # 3. 試合（対戦相手）の選択（「対戦相手 (日付)」はストア構築時に作ったカテゴリ列）
+                        match_labels = cat_filtered_df[swing_store.MATCH_COL]
                         
-                        match_options = ["全試合合計"] + sorted(cat_filtered_df['Match_Label'].unique().tolist(), reverse=True)
+                        match_options = ["全試合合計"] + sorted(match_labels.dropna().unique().tolist(), reverse=True)
                         with c3:
                             selected_match = st.selectbox("試合（対戦相手）を選択", match_options, key="match_tab4")
 
                         # 4. 最終的なデータの抽出
                         if selected_match == "全試合合計":
-                            final_gdf = cat_filtered_df.copy()
+                            final_gdf = cat_filtered_df
                             display_title = f"📊 {selected_cat} 合計データ"
                         else:
-                            final_gdf = cat_filtered_df[cat_filtered_df['Match_Label'] == selected_match].copy()
+                            final_gdf = cat_filtered_df[match_labels == selected_match]
                             display_title = f"⚡️ {selected_match}"
 
                         # --- 統計計算・サマリー・ヒートマップ表示 ---
@@ -767,37 +774,40 @@ else:
                             st.markdown(f"### {display_title}")
 
                             # 統計計算準備
-                            keywords_h = ["速度", "角度", "効率", "パワー", "時間", "スピード", "飛距離", "度"]
-                            valid_metrics_h = [c for c in final_gdf.columns if any(k in str(c) for k in keywords_h)]
-                            valid_metrics_h = [c for c in valid_metrics_h if pd.to_numeric(final_gdf[c], errors='coerce').dropna().any()]
+                            valid_metrics_h = game_metrics.for_player(target_game_player, kinds=metrics.MEASURED_KINDS)
                             target_metric_h = st.selectbox("分析する指標を選択", valid_metrics_h, key="m_tab4_h")
-                            
-                            SMALLER_IS_BETTER = any(k in target_metric_h for k in ["時間", "度", "誤差", "ブレ"])
-
-                            final_gdf[target_metric_h] = pd.to_numeric(final_gdf[target_metric_h], errors='coerce')
-                            final_gdf['StrikeZoneX'] = pd.to_numeric(final_gdf['StrikeZoneX'], errors='coerce')
-                            final_gdf['StrikeZoneY'] = pd.to_numeric(final_gdf['StrikeZoneY'], errors='coerce')
-
-                            # ストライク状況別のデータ抽出
-                            strike_col = final_gdf.columns[2]
-                            final_gdf[strike_col] = pd.to_numeric(final_gdf[strike_col], errors='coerce')
-                            df_early = final_gdf[final_gdf[strike_col] != 2].copy()
-                            df_two = final_gdf[final_gdf[strike_col] == 2].copy()
-
-                            def get_stats(target_df, metric, smaller_better):
-                                vdf = target_df.dropna(subset=[metric])
-                                if vdf.empty: return 0, 0, 0
-                                avg = vdf[metric].mean()
-                                best = vdf[metric].min() if smaller_better else vdf[metric].max()
-                                return avg, best, len(vdf)
-
-                            avg_total, best_total, cnt_total = get_stats(final_gdf, target_metric_h, SMALLER_IS_BETTER)
-                            avg_early, best_early, cnt_early = get_stats(df_early, target_metric_h, SMALLER_IS_BETTER)
-                            avg_two, best_two, cnt_two = get_stats(df_two, target_metric_h, SMALLER_IS_BETTER)
-
-                            fmt = "{:.3f}" if "時間" in target_metric_h else ("{:.2f}" if "手の最大スピード" in target_metric_h else "{:.1f}")
+                            metric_info_h = game_metrics.get(target_metric_h)
+                            SMALLER_IS_BETTER = metric_info_h.smaller_is_better
+
+                            # 球種・結果 (SB) の絞り込み（全て選んだときは絞り込まず、空欄の打席も含める）
+                            all_pitches, all_outcomes = list(game_split.names["pitch"]), list(game_split.names["outcome"])
+                            f1, f2 = st.columns(2)
+                            with f1: sel_pitches = st.multiselect("球種で絞り込む", all_pitches, default=all_pitches, key="pitch_tab4")
+                            with f2: sel_outcomes = st.multiselect("結果 (SB) で絞り込む", all_outcomes, default=all_outcomes, key="outcome_tab4")
+                            pitch_filter = None if set(sel_pitches) == set(all_pitches) else sel_pitches
+                            outcome_filter = None if set(sel_outcomes) == set(all_outcomes) else sel_outcomes
+
+                            profiling.stage("tab4.aggregate")
+                            # 選手・期間・試合種別・試合・球種・結果の絞り込みをキューブ（SQL）の条件にして集計する
+                            has_dates = isinstance(selected_date_range, tuple) and len(selected_date_range) == 2
+                            gmask = game_split.mask(
+                                players=[target_game_player],
+                                start=selected_date_range[0] if has_dates else None,
+                                end=selected_date_range[1] if has_dates else None,
+                                cats=None if selected_cat == "全試合" else [selected_cat],
+                                matches=None if selected_match == "全試合合計" else [selected_match],
+                                pitches=pitch_filter,
+                                outcomes=outcome_filter,
+                            )
+                            splits = game_split.strike_splits(gmask, target_metric_h, SMALLER_IS_BETTER)
+                            avg_total, best_total, cnt_total = splits["全状況"]
+                            avg_early, best_early, cnt_early = splits["0,1ストライク"]
+                            avg_two, best_two, cnt_two = splits["2ストライク"]
+
+                            fmt = "{:" + metric_info_h.fmt + "}"
                             label_best = "最小(Best)" if SMALLER_IS_BETTER else "最高(Best)"
 
+                            profiling.stage("tab4.render")
                             # A. 指標サマリー
                             st.markdown(f"##### 📈 ストライク状況別比較 ({target_metric_h})")
                             sum_c1, sum_c2, sum_c3 = st.columns(3)
@@ -813,66 +823,80 @@ else:
 
                             # B. ヒートマップ表示（反転ロジック込み）
                             st.markdown("---")
-                            view_mode = st.radio("表示するヒートマップの状況を選択", ["全状況", "0,1ストライク", "2ストライク"], horizontal=True)
+                            view_mode = st.radio("表示するヒートマップの状況を選択", list(swing_store.STRIKE_SPLITS), horizontal=True, key="view_tab4")
                             
-                            if view_mode == "0,1ストライク":
-                                vdf_h = df_early.dropna(subset=['StrikeZoneX', 'StrikeZoneY', target_metric_h]).copy()
-                            elif view_mode == "2ストライク":
-                                vdf_h = df_two.dropna(subset=['StrikeZoneX', 'StrikeZoneY', target_metric_h]).copy()
-                            else:
-                                vdf_h = final_gdf.dropna(subset=['StrikeZoneX', 'StrikeZoneY', target_metric_h]).copy()
+                            view_strikes = {"0,1ストライク": "early", "2ストライク": "two"}.get(view_mode)
+                            zone_g = game_split.zone_stats(gmask & game_split.mask(strikes=view_strikes), target_metric_h, flip=(player_hand == "左"))
+                            has_view = zone_g.count.sum() > 0
 
                             st.subheader(f"🎯 コース別詳細分析 ({view_mode})")
                             inner_side = "右側" if player_hand == "左" else "左側"
                             outer_side = "左側" if player_hand == "左" else "右側"
                             st.caption(f"※{player_hand}打者目線: {inner_side}が内角 / {outer_side}が外角")
 
-                            if not vdf_h.empty:
-                                import plotly.graph_objects as go
-                                import numpy as np
-                                fig_heat_g = go.Figure()
-                                fig_heat_g.add_shape(type="rect", x0=SZ_X_MIN, x1=SZ_X_MAX, y0=SZ_Y_MIN, y1=SZ_Y_MAX, fillcolor="#222", line_width=1, layer="below")
-                                
-                                grid_val_g = np.zeros((3, 3)); grid_count_g = np.zeros((3, 3))
-                                for _, row in vdf_h.iterrows():
-                                    x, y = row['StrikeZoneX'], row['StrikeZoneY']
-                                    if x < SZ_X_TH1: c_raw = 0
-                                    elif x <= SZ_X_TH2: c_raw = 1
-                                    else: c_raw = 2
-                                    c = (2 - c_raw) if player_hand == "左" else c_raw
-                                    if y > SZ_Y_TH2: r = 0
-                                    elif y > SZ_Y_TH1: r = 1
-                                    else: r = 2
-                                    grid_val_g[r, c] += row[target_metric_h]; grid_count_g[r, c] += 1
-                                
-                                display_grid_g = np.where(grid_count_g > 0, grid_val_g / grid_count_g, 0)
-                                w = (SZ_X_MAX - SZ_X_MIN) / 3
-                                h_grid = (SZ_Y_MAX - SZ_Y_MIN) / 3
+                            if has_view:
+                                tab4_view = (target_game_player, selected_date_range, selected_cat, selected_match, target_metric_h, view_mode, tuple(sel_pitches), tuple(sel_outcomes))
+
+                                def build_heat_g():
+                                    fig_heat_g = go.Figure()
+                                    fig_heat_g.add_shape(type="rect", x0=SZ_X_MIN, x1=SZ_X_MAX, y0=SZ_Y_MIN, y1=SZ_Y_MAX, fillcolor="#222", line_width=1, layer="below")
                                 
-                                for r_idx in range(3):
-                                    for c_idx in range(3):
-                                        x0, x1 = SZ_X_MIN + c_idx * w, SZ_X_MIN + (c_idx+1) * w
-                                        y1 = SZ_Y_MAX - r_idx * h_grid; y0 = y1 - h_grid
-                                        v = display_grid_g[r_idx, c_idx]; cnt = int(grid_count_g[r_idx, c_idx])
-                                        color, f_color = get_color(v, target_metric_h, row_idx=r_idx)
-                                        fig_heat_g.add_shape(type="rect", x0=x0, x1=x1, y0=y0, y1=y1, fillcolor=color, line=dict(color="#444", width=2))
-                                        if v > 0:
-                                            txt = fmt.format(v)
-                                            fig_heat_g.add_annotation(x=(x0+x1)/2, y=(y0+y1)/2 + (h_grid*0.15), text=txt, showarrow=False, font=dict(size=16, color=f_color, weight="bold"))
-                                            fig_heat_g.add_annotation(x=(x0+x1)/2, y=(y0+y1)/2 - (h_grid*0.2), text=f"{cnt}打席", showarrow=False, font=dict(size=10, color=f_color))
+                                    display_grid_g, grid_count_g = zone_g.mean, zone_g.count
+                                    cell_colors, font_colors = get_colors(display_grid_g, target_metric_h, rows=ROWS_3X3)
+                                    labels = np.full((3, 3), "", dtype=object); counts = np.full((3, 3), "", dtype=object)
+                                    for r_idx in range(3):
+                                        for c_idx in range(3):
+                                            v = display_grid_g[r_idx, c_idx]; cnt = int(grid_count_g[r_idx, c_idx])
+                                            if v > 0:
+                                                labels[r_idx, c_idx] = fmt.format(v); counts[r_idx, c_idx] = f"{cnt}打席"
+                                    figures.add_grid(
+                                        fig_heat_g, cell_colors,
+                                        x_edges=np.linspace(SZ_X_MIN, SZ_X_MAX, 4), y_edges=np.linspace(SZ_Y_MAX, SZ_Y_MIN, 4),
+                                        labels=labels, font_colors=font_colors, line=dict(color="#444", width=2), font_size=16, label_offset=0.15,
+                                        sublabels=counts, sub_offset=-0.2,
+                                    )
                                 
-                                fig_heat_g.update_layout(width=500, height=550, xaxis=dict(visible=False, range=[SZ_X_MIN-10, SZ_X_MAX+10]), yaxis=dict(visible=False, range=[SZ_Y_MIN-10, SZ_Y_MAX+10]), plot_bgcolor="rgba(0,0,0,0)", margin=dict(l=10,r=10,t=10,b=10))
-                                st.plotly_chart(fig_heat_g, config={'displayModeBar': False})
+                                    fig_heat_g.update_layout(width=500, height=550, xaxis=dict(visible=False, range=[SZ_X_MIN-10, SZ_X_MAX+10]), yaxis=dict(visible=False, range=[SZ_Y_MIN-10, SZ_Y_MAX+10]), plot_bgcolor="rgba(0,0,0,0)", margin=dict(l=10,r=10,t=10,b=10))
+                                    return fig_heat_g
+
+                                fig_heat_g = cached_figure("heat_g", game_store, tab4_view, build_heat_g)
+                                show_chart(fig_heat_g, config={'displayModeBar': False})
                             else:
                                 st.warning(f"{view_mode} の有効なデータがありません。")
 
+                            # C. 球種・結果別の内訳（キューブのグループを足し合わせるだけで、データは走査しない）
+                            st.markdown("---")
+                            breakdown_by = st.radio("内訳の切り口", ["球種", "結果 (SB)"], horizontal=True, key="by_tab4")
+                            st.subheader(f"🧮 {breakdown_by}別の内訳 ({target_metric_h})")
+                            breakdown = game_split.breakdown(gmask, target_metric_h, by="pitch" if breakdown_by == "球種" else "outcome", smaller_better=SMALLER_IS_BETTER)
+                            if breakdown.empty:
+                                st.warning(f"{breakdown_by}の記録がある打席がありません。")
+                            else:
+                                value_cols = {"mean": "平均", "best": label_best, "early": "0,1ストライク平均", "two": "2ストライク平均"}
+                                st.dataframe(
+                                    breakdown.rename(columns={"count": "打席", **value_cols}).rename_axis(breakdown_by),
+                                    column_config={c: st.column_config.NumberColumn(format="%" + metric_info_h.fmt) for c in value_cols.values()},
+                                    use_container_width=True,
+                                )
+
                             st.markdown("---")
                             st.write(f"🔍 **詳細データ一覧**")
-                            cols_idx = list(range(1, 6)) + list(range(9, len(final_gdf.columns) - 1))
-                            st.dataframe(final_gdf.iloc[:, cols_idx], use_container_width=True)
+                            raw_cols_g = game_store.raw_columns
+                            cols_idx = list(range(1, 6)) + list(range(9, len(raw_cols_g)))
+                            detail_gdf = final_gdf
+                            if pitch_filter is not None:
+                                detail_gdf = detail_gdf[detail_gdf[swing_store.PITCH_COL].isin(pitch_filter)]
+                            if outcome_filter is not None:
+                                detail_gdf = detail_gdf[detail_gdf[swing_store.OUTCOME_COL].isin(outcome_filter)]
+                            st.dataframe(detail_gdf[[raw_cols_g[i] for i in cols_idx]], use_container_width=True)
                         else:
                             st.warning("条件に一致するデータがありません。")
             else:
                 st.warning(f"{target_game_player} の試合データは見つかりませんでした。")
-        else:
+        elif is_open(tab4):
             st.info("試合データ (game_data.csv) が登録されていません。")
+
+  # 6. 計測結果 (全員のデータを見られるパスワードのときだけ表示)
+  profile_run = profiling.end_run()
+  if current_pw == "1189":
+    show_profile_panel(profile_run)
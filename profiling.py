@@ -0,0 +1,183 @@
+# --- 処理時間・メモリの計測 ---
+# 再実行 (Streamlit のスクリプト 1 回分) ごとに、どの処理にどれだけ時間がかかったかを記録する。
+#   span(name)  : with で囲んだ処理の時間 (同じ名前は回数・合計・最大をまとめる)
+#   timed(name) : 関数を呼ぶたびに span と同じように記録するデコレーター (get_colors など)
+#   stage(name) : タブの「絞り込み → 集計 → 描画」のような連続した段階。
+#                 次の stage を呼ぶと前の段階が終わる (stage(None) で終了のみ)
+# begin_run / end_run の間に記録したものが 1 回分の結果になり、直近 HISTORY_SIZE 回分を保持する。
+# 環境変数 BATTING_PROFILE_LOG にファイル名を指定すると、結果を JSON Lines で追記する。
+# メモリのピークは tracemalloc を有効にしたときだけ測る (Python のメモリ確保が遅くなるため)。
+# 記録は実行中のスレッドごとに分かれ、begin_run していないスレッドでは何もしない。
+import collections
+import contextlib
+import datetime
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+  import resource
+except ImportError:  # Windows
+  resource = None
+
+LOG_PATH = os.environ.get("BATTING_PROFILE_LOG")
+HISTORY_SIZE = 50
+
+_local = threading.local()
+_history = collections.deque(maxlen=HISTORY_SIZE)
+_lock = threading.Lock()
+
+
+class Run:
+
+  def __init__(self, label=None):
+    self.label = label
+    self.started = datetime.datetime.now()
+    self.t0 = time.perf_counter()
+    self.spans = {}  # 名前 -> [回数, 合計秒, 最大秒]
+    self.stages = []  # (名前, 秒) を実行順に
+    self.stage_name = None
+    self.stage_t0 = None
+    self.seconds = None
+    self.peak_mb = None
+    self.max_rss_mb = None
+
+  def add(self, name, seconds):
+    entry = self.spans.get(name)
+    if entry is None:
+      self.spans[name] = [1, seconds, seconds]
+    else:
+      entry[0] += 1
+      entry[1] += seconds
+      entry[2] = max(entry[2], seconds)
+
+  def close_stage(self, now):
+    if self.stage_name is not None:
+      self.stages.append((self.stage_name, now - self.stage_t0))
+    self.stage_name = None
+
+  def to_dict(self):
+    return {
+        "started": self.started.isoformat(timespec="milliseconds"),
+        "label": self.label,
+        "seconds": self.seconds,
+        "peak_mb": self.peak_mb,
+        "max_rss_mb": self.max_rss_mb,
+        "stages": [{"name": n, "seconds": s} for n, s in self.stages],
+        "spans": {
+            n: {"count": c, "total": t, "max": m}
+            for n, (c, t, m) in sorted(self.spans.items(), key=lambda kv: -kv[1][1])
+        },
+    }
+
+
+def current():
+  return getattr(_local, "run", None)
+
+
+def begin_run(label=None):
+  # 前回の実行が st.rerun などで途中終了していた場合は記録せずに捨てる
+  run = Run(label)
+  _local.run = run
+  if tracemalloc.is_tracing():
+    tracemalloc.reset_peak()
+  return run
+
+
+def end_run():
+  run = current()
+  if run is None:
+    return None
+  _local.run = None
+  now = time.perf_counter()
+  run.close_stage(now)
+  run.seconds = now - run.t0
+  if tracemalloc.is_tracing():
+    # tracemalloc はプロセス全体で 1 つなので、同時に動いた他セッションの分も含む
+    run.peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+  run.max_rss_mb = _max_rss_mb()
+  with _lock:
+    _history.append(run)
+  if LOG_PATH:
+    _write_log(run)
+  return run
+
+
+def _max_rss_mb():
+  # プロセス開始からの最大常駐メモリ (Linux は KiB、macOS はバイト単位)
+  if resource is None:
+    return None
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _write_log(run):
+  line = json.dumps(run.to_dict(), ensure_ascii=False)
+  try:
+    with _lock, open(LOG_PATH, "a", encoding="utf-8") as f:
+      f.write(line + "\n")
+  except OSError:
+    pass
+
+
+def history():
+  # 新しい順
+  with _lock:
+    return list(reversed(_history))
+
+
+@contextlib.contextmanager
+def span(name):
+  run = current()
+  if run is None:
+    yield
+    return
+  t0 = time.perf_counter()
+  try:
+    yield
+  finally:
+    run.add(name, time.perf_counter() - t0)
+
+
+def timed(name):
+  def decorate(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+      run = current()
+      if run is None:
+        return func(*args, **kwargs)
+      t0 = time.perf_counter()
+      try:
+        return func(*args, **kwargs)
+      finally:
+        run.add(name, time.perf_counter() - t0)
+
+    return wrapper
+
+  return decorate
+
+
+def stage(name):
+  run = current()
+  if run is None:
+    return
+  now = time.perf_counter()
+  run.close_stage(now)
+  if name is not None:
+    run.stage_name, run.stage_t0 = name, now
+
+
+# --- メモリ計測の切り替え ---
+def memory_tracing():
+  return tracemalloc.is_tracing()
+
+
+def set_memory_tracing(enabled):
+  if enabled and not tracemalloc.is_tracing():
+    tracemalloc.start()
+  elif not enabled and tracemalloc.is_tracing():
+    tracemalloc.stop()
@@ -0,0 +1,26 @@
+# --- 選手一覧 (背番号 名字 名前 → 打席の左右) ---
+# アプリとベンチマーク (bench/) で共有する
+PLAYER_HANDS = {
+    "#1 熊田 任洋": "左",
+    "#2 逢澤 崚介": "左",
+    "#3 三塚 武蔵": "左",
+    "#4 北村 祥治": "右",
+    "#5 前田 健伸": "左",
+    "#6 佐藤 勇基": "右",
+    "#7 西村 友哉": "右",
+    "#8 和田 佳大": "左",
+    "#9 今泉 颯太": "右",
+    "#10 福井 章吾": "左",
+    "#22 高祖 健輔": "左",
+    "#23 箱山 遥人": "右",
+    "#24 坂巻 尚哉": "右",
+    "#26 西村 彰浩": "左",
+    "#27 小畑 尋規": "右",
+    "#28 宮崎 仁斗": "右",
+    "#29 徳本 健太朗": "左",
+    "#39 柳 元珍": "左",
+    "#99 尾瀬 雄大": "左",
+    "#33 網谷 圭将": "右",
+    "#35 永濱 晃汰": "左",
+}
+PLAYERS = list(PLAYER_HANDS.keys())
@@ -0,0 +1,79 @@
+# --- 保存キュー (同時に行われた登録をまとめて 1 回で保存する) ---
+# 試合日などに複数のスタッフが同時に登録すると、それぞれが別々にパーティションと
+# マニフェストを書き込み、マニフェストの更新が競合しやすい。
+# submit は登録をデータセットごとのキューに入れ、最初に入れたセッションが
+# BATCH_WINDOW_SEC だけ待ってから、その間に集まった登録を 1 つのパーティションにまとめて保存する。
+# 保存中に届いた登録は、保存が終わりしだい次のまとまりとして続けて保存する。
+# 各セッションは自分の登録を含むまとまりの保存が終わるまで待ち、その結果 (成功 / エラー) を受け取る。
+# マニフェストの競合 (他のプロセス・端末が先に更新した) は data_layer.append_rows が
+# 取り直し → 自分のパーティションだけを追記し直して、間隔を空けながら再試行する。
+import collections
+import concurrent.futures
+import threading
+import time
+
+import pandas as pd
+
+import data_layer
+
+BATCH_WINDOW_SEC = 0.2
+
+
+class _Queue:
+
+  def __init__(self):
+    self.pending = []  # (DataFrame, token, Future)
+    self.flushing = False
+    self.lock = threading.Lock()
+
+
+_queues = collections.defaultdict(_Queue)
+_queues_lock = threading.Lock()
+
+
+def _queue(user, repo, path):
+  with _queues_lock:
+    return _queues[(user, repo, path)]
+
+
+def submit(user, repo, path, new_df, token):
+  # 戻り値は data_layer.append_rows と同じ (成功したか, メッセージ)
+  q = _queue(user, repo, path)
+  future = concurrent.futures.Future()
+  with q.lock:
+    q.pending.append((new_df, token, future))
+    lead = not q.flushing
+    q.flushing = True
+  if lead:
+    _drain(q, user, repo, path)
+  return future.result()
+
+
+def _drain(q, user, repo, path):
+  # キューが空になるまで、たまった登録をまとめて保存する
+  time.sleep(BATCH_WINDOW_SEC)
+  while True:
+    with q.lock:
+      batch, q.pending = q.pending, []
+      if not batch:
+        q.flushing = False
+        return
+    _commit(batch, user, repo, path)
+
+
+def _commit(batch, user, repo, path):
+  # 列の並びが同じ登録ごとに 1 つのパーティションにする (一括登録で列が違う場合は分ける)
+  groups = collections.defaultdict(list)
+  for item in batch:
+    groups[tuple(item[0].columns)].append(item)
+  for items in groups.values():
+    try:
+      frames = [df for df, _, _ in items]
+      combined = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+      result = data_layer.append_rows(user, repo, path, combined, items[0][1])
+    except Exception as e:
+      for _, _, future in items:
+        future.set_exception(e)
+      continue
+    for _, _, future in items:
+      future.set_result(result)
@@ -0,0 +1,71 @@
+# --- 列指向スナップショット (Parquet) ---
+# CSV は人が編集できる正本として残し、取得・型変換済みのデータを
+# リビジョン (ETag) 付きの Parquet としてローカルに保存しておく。
+# プロセスの再起動後は CSV を解析し直さず、ここから読み込む。
+# 文字列列は Parquet の辞書エンコード、カテゴリ列はそのまま辞書として保存される。
+# pyarrow が無い環境ではスナップショットを使わない (従来どおり CSV のみ)。
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+try:
+  import pyarrow  # noqa: F401
+
+  AVAILABLE = True
+except ImportError:
+  AVAILABLE = False
+
+SNAPSHOT_DIR = os.environ.get(
+    "BATTING_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot"),
+)
+
+
+def _base_path(namespace, key):
+  name = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:20]
+  return os.path.join(SNAPSHOT_DIR, namespace, name)
+
+
+def write(namespace, key, df, meta):
+  if not AVAILABLE:
+    return False
+  base = _base_path(namespace, key)
+  try:
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    # 書き込み途中のファイルを読まないよう、一時ファイルから置き換える
+    # (メタ情報は Parquet の後に書くので、メタがあれば本体も揃っている)
+    df.to_parquet(f"{base}.parquet.tmp", index=False)
+    os.replace(f"{base}.parquet.tmp", f"{base}.parquet")
+    with open(f"{base}.json.tmp", "w", encoding="utf-8") as f:
+      json.dump(dict(meta, key=repr(key)), f, ensure_ascii=False)
+    os.replace(f"{base}.json.tmp", f"{base}.json")
+  except (OSError, ValueError, ImportError):
+    return False
+  return True
+
+
+def read_meta(namespace, key):
+  if not AVAILABLE:
+    return None
+  try:
+    with open(f"{_base_path(namespace, key)}.json", encoding="utf-8") as f:
+      meta = json.load(f)
+  except (OSError, ValueError):
+    return None
+  return meta if meta.get("key") == repr(key) else None
+
+
+def read(namespace, key, columns=None):
+  # columns を指定すると必要な列だけを読み込む
+  meta = read_meta(namespace, key)
+  if meta is None:
+    return None, None
+  try:
+    df = pd.read_parquet(
+        f"{_base_path(namespace, key)}.parquet", columns=columns
+    )
+  except (OSError, ValueError, ImportError):
+    return None, None
+  return meta, df
@@ -0,0 +1,222 @@
+# --- 試合の状況別キューブ (選手 × 試合区別 × 試合 × 球種 × 結果 × ストライク × 日付 × コース) ---
+# 試合データをリビジョンごとに一度だけ集計しておき、タブ4 の絞り込み (選手・期間・試合種別・試合) と
+# 球種・結果 (SB)・ストライク状況の組み合わせは、キューブの行 (グループ) を絞り込んで足し合わせるだけで答える。
+# 「ストレートの 2 ストライク・外角低め」のような組み合わせや球種別の内訳も、生データを走査しない。
+# 値は手の最大スピードを比にしない生の値 (hand_ratio=False。SQL エンジンの試合の表と同じ)。
+# 呼び方は sql_engine.SqlTable と同じなので、タブ4 はどちらを使っても同じコードで動く。
+# データが追記されたリビジョンでは、追加行だけを集計して既存のキューブに足し込む。
+import dataclasses
+
+import numpy as np
+import pandas as pd
+
+import cube
+import swing_store
+import zone_engine
+
+MATCH_CAT_COL = "試合区別"
+# コースは 3x3 の行・列 (欠損は -1) を +1 して 0〜3 の 4 マスで持つ
+ZONE_SLOTS = 4
+NO_DAY = cube.NO_DAY
+NO_STRIKES = -1
+# names のキー → ストアの列
+LABEL_COLS = {
+    "cat": MATCH_CAT_COL,
+    "match": swing_store.MATCH_COL,
+    "pitch": swing_store.PITCH_COL,
+    "outcome": swing_store.OUTCOME_COL,
+}
+KEY_COLS = ("player", "cat", "match", "pitch", "outcome", "strikes", "day", "zone")
+# summarize (breakdown) の列: 件数・平均・ベスト・0,1 ストライクの平均・2 ストライクの平均
+BREAKDOWN_COLUMNS = ["count", "mean", "best", "early", "two"]
+
+
+@dataclasses.dataclass(frozen=True)
+class SplitCube:
+  names: dict  # "player" / "cat" / "match" / "pitch" / "outcome" -> 名前の並び (コード順)
+  metrics: tuple
+  keys: dict  # KEY_COLS -> グループごとのコード (欠損は -1、日付なしは NO_DAY)
+  rows: np.ndarray  # グループ内の行数
+  count: np.ndarray  # (グループ数, 指標数)
+  total: np.ndarray
+  sumsq: np.ndarray
+  vmin: np.ndarray
+  vmax: np.ndarray
+
+  @property
+  def n_groups(self):
+    return len(self.rows)
+
+  @property
+  def player_names(self):
+    return self.names["player"]
+
+  def metric_index(self, metric):
+    return self.metrics.index(metric)
+
+  def mask(self, players=None, start=None, end=None, cats=None, matches=None, strikes=None,
+           pitches=None, outcomes=None):
+    # strikes: "early" (0,1 ストライク。カウント不明を含む) / "two" (2 ストライク)
+    m = np.ones(self.n_groups, dtype=bool)
+    for kind, values in (
+        ("player", players), ("cat", cats), ("match", matches),
+        ("pitch", pitches), ("outcome", outcomes),
+    ):
+      if values is not None:
+        m &= np.isin(self.keys[kind], cube._codes(self.names[kind], values))
+    day = self.keys["day"]
+    if start is not None:
+      m &= (day != NO_DAY) & (day >= cube.to_day(start))
+    if end is not None:
+      m &= (day != NO_DAY) & (day <= cube.to_day(end))
+    if strikes is not None:
+      m &= (self.keys["strikes"] == 2) == (strikes == "two")
+    return m
+
+  def row_count(self, mask):
+    return int(self.rows[mask].sum())
+
+  def observed(self, kind, mask=None):
+    # 絞り込んだ範囲に出てくる名前 (コード順)
+    codes = self.keys[kind] if mask is None else self.keys[kind][mask]
+    return [self.names[kind][i] for i in np.unique(codes[codes >= 0])]
+
+  def stats(self, mask, metric):
+    # (件数, 平均, 最小, 最大)
+    j = self.metric_index(metric)
+    count = self.count[mask, j].sum()
+    if count == 0:
+      return 0, np.nan, np.nan, np.nan
+    return (
+        int(count),
+        self.total[mask, j].sum() / count,
+        np.nanmin(self.vmin[mask, j]),
+        np.nanmax(self.vmax[mask, j]),
+    )
+
+  def strike_splits(self, mask, metric, smaller_better=False):
+    # 状況 (swing_store.STRIKE_SPLITS) ごとの (平均, ベスト, 件数)。値のある打席が無い状況は (0, 0, 0)
+    out = {}
+    for name, strikes in zip(swing_store.STRIKE_SPLITS, (None, "early", "two")):
+      part = mask if strikes is None else mask & self.mask(strikes=strikes)
+      n, mean, lo, hi = self.stats(part, metric)
+      out[name] = (0, 0, 0) if n == 0 else (mean, lo if smaller_better else hi, n)
+    return out
+
+  def zone_stats(self, mask, metric, flip=False):
+    j = self.metric_index(metric)
+    zone = self.keys["zone"][mask]
+    return zone_engine.aggregate(
+        zone // ZONE_SLOTS - 1,
+        zone % ZONE_SLOTS - 1,
+        self.count[mask, j],
+        self.total[mask, j],
+        self.vmin[mask, j],
+        self.vmax[mask, j],
+        3,
+        flip,
+    )
+
+  def breakdown(self, mask, metric, by="pitch", smaller_better=False):
+    j = self.metric_index(metric)
+    return summarize(
+        self.names[by],
+        self.keys[by][mask],
+        self.keys["strikes"][mask] == 2,
+        self.count[mask, j],
+        self.total[mask, j],
+        self.vmin[mask, j],
+        self.vmax[mask, j],
+        smaller_better,
+    )
+
+
+def summarize(names, codes, two, count, total, vmin, vmax, smaller_better=False):
+  # 値 (球種・結果など) ごとの件数・平均・ベストと、0,1 / 2 ストライクの平均 (データのある値のみ・コード順)
+  n = len(names)
+  ok = (codes >= 0) & (count > 0)
+
+  def mean(sel):
+    c = np.bincount(codes[sel], weights=count[sel], minlength=n)
+    s = np.bincount(codes[sel], weights=total[sel], minlength=n)
+    return c, np.divide(s, c, out=np.full(n, np.nan), where=c > 0)
+
+  all_n, all_mean = mean(ok)
+  _, early = mean(ok & ~two)
+  _, two_mean = mean(ok & two)
+  best = np.full(n, np.nan)
+  (np.fmin if smaller_better else np.fmax).at(best, codes[ok], (vmin if smaller_better else vmax)[ok])
+  has = all_n > 0
+  columns = (all_n.astype("int64"), all_mean, best, early, two_mean)
+  return pd.DataFrame(
+      {name: values[has] for name, values in zip(BREAKDOWN_COLUMNS, columns)},
+      index=pd.Index([name for name, h in zip(names, has) if h]),
+  )
+
+
+def _names(store, col):
+  if col not in store.df.columns:
+    return ()
+  return tuple(store.df[col].astype("category").cat.categories)
+
+
+def _all_names(store):
+  names = {"player": _names(store, store.player_col)}
+  names.update({kind: _names(store, col) for kind, col in LABEL_COLS.items()})
+  return names
+
+
+def _codes(df, col, names):
+  if col not in df.columns:
+    return np.full(len(df), -1, dtype="int64")
+  return pd.Categorical(df[col], categories=names).codes.astype("int64")
+
+
+def _metric_arrays(store, df):
+  return {
+      metric: swing_store.metric_values(df, metric, hand_ratio=False).to_numpy()
+      for metric in store.metric_cols
+  }
+
+
+def build_cube(store, df=None):
+  # df を渡すと (追加行などの) 一部の行だけを集計する。コードは store のカテゴリに従う
+  if df is None:
+    df = store.df
+  names = _all_names(store)
+  day = df[swing_store.DATE_COL].to_numpy().astype("datetime64[D]")
+  strikes = df[swing_store.STRIKES_COL].to_numpy()
+  zone = (df[swing_store.ZONE_ROW3].to_numpy().astype("int64") + 1) * ZONE_SLOTS + (
+      df[swing_store.ZONE_COL3].to_numpy().astype("int64") + 1
+  )
+  keys = pd.DataFrame({
+      "player": _codes(df, store.player_col, names["player"]),
+      **{kind: _codes(df, col, names[kind]) for kind, col in LABEL_COLS.items()},
+      "strikes": np.where(np.isnan(strikes), NO_STRIKES, np.nan_to_num(strikes)).astype("int64"),
+      "day": np.where(np.isnat(day), NO_DAY, day.astype("int64")).astype("int64"),
+      "zone": zone,
+  })
+  # 選手が欠損している行はどの選手にも属さないので除外する
+  keys = keys[keys["player"] >= 0]
+  arrays = _metric_arrays(store, df)
+  group_keys, stats = cube.group_stats(keys, arrays)
+  return SplitCube(names, tuple(arrays), group_keys, **stats)
+
+
+def merge_cubes(head, tail):
+  # tail のカテゴリは head のカテゴリを先頭にそのまま含む (cube.merge_cubes と同じ)
+  group_keys, stats = cube.merge_stats(
+      head.keys, cube.stat_arrays(head), tail.keys, cube.stat_arrays(tail)
+  )
+  return SplitCube(tail.names, head.metrics, group_keys, **stats)
+
+
+# --- リビジョン単位のメモ化 (cube.memoized) ---
+_cubes = {}
+
+
+def get_cube(store):
+  return cube.memoized(
+      _cubes, store.key, store, build_cube, merge_cubes,
+      reusable=lambda cached: cached.metrics == tuple(store.metric_cols),
+  )
@@ -0,0 +1,55 @@
+# --- スプレーチャート (打球方向 × 飛距離) ---
+# 打球を方向 5 × 飛距離 5 のマス (zone_engine.spray_rows / spray_cols) に分け、
+# マスごとの打球速度・打球角度と、強い打球・理想角度の割合を集計する。
+# 集計は cube.py と同じキューブ (選手 × スイング条件 × 日付 × マス) をリビジョンごとに一度だけ作り、
+# タブ1と同じ絞り込み (選手 / チーム全体・期間・打撃条件) はグループを足し合わせるだけで答える。
+# 表示にかかる時間は期間内の打球数によらない。
+import numpy as np
+
+import cube
+import swing_store
+
+EXIT_VELOCITY = "打球速度"
+LAUNCH_ANGLE = "打球角度"
+# 強い打球 (打球速度 km/h 以上) と、長打になりやすい打球角度の範囲 (°)
+HARD_HIT_KMH = 150.0
+SWEET_SPOT = (8.0, 32.0)
+HARD_HIT = EXIT_VELOCITY + "::hard"
+SWEET_SPOT_RATE = LAUNCH_ANGLE + "::sweet"
+ZONE_COLS = (swing_store.SPRAY_ROW, swing_store.SPRAY_COL)
+# 図の半径の区切り。最も遠い段 (110m〜) は外周の幅 20m のマスとして描く
+FAN_RADIUS_EDGES = np.array([0.0, 30.0, 60.0, 90.0, 110.0, 130.0])
+
+
+def _values(store, df, metric):
+  if metric not in store.metric_cols:
+    return np.full(len(df), np.nan)
+  return swing_store.metric_values(df, metric).to_numpy()
+
+
+def _metric_arrays(store, df):
+  # マスに入らない打球 (ファウル・計測なし) は集計しない
+  in_field = (df[swing_store.SPRAY_ROW].to_numpy() >= 0) & (df[swing_store.SPRAY_COL].to_numpy() >= 0)
+  ev = np.where(in_field, _values(store, df, EXIT_VELOCITY), np.nan)
+  la = np.where(in_field, _values(store, df, LAUNCH_ANGLE), np.nan)
+  low, high = SWEET_SPOT
+  return {
+      EXIT_VELOCITY: ev,
+      LAUNCH_ANGLE: la,
+      # 1/0 の平均が割合になる (値が無い打球は NaN)
+      HARD_HIT: np.where(np.isnan(ev), np.nan, (ev >= HARD_HIT_KMH).astype("float64")),
+      SWEET_SPOT_RATE: np.where(np.isnan(la), np.nan, ((la >= low) & (la <= high)).astype("float64")),
+  }
+
+
+def build_cube(store, df=None):
+  return cube.build_cube(store, df, zone_cols=ZONE_COLS, metric_arrays=_metric_arrays)
+
+
+def get_cube(store):
+  return cube.get_cube(store, build=build_cube)
+
+
+def cell_stats(spray_cube, mask, metric):
+  # (飛距離, 方向) の 5x5。行 0 が最も近いマス
+  return spray_cube.zone_stats(mask, metric, layout=5)
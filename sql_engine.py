@@ -0,0 +1,448 @@
+# --- 組み込み SQL エンジン (任意) ---
+# 環境変数 BATTING_SQL_ENGINE に "sqlite" か "duckdb" を指定すると、タブの集計
+# (ゾーン別・月別・トップ3・ストライク状況別) を集計キューブ / pandas の代わりに
+# メモリ上のデータベースへの SQL で行う。未指定なら使わない。
+# DuckDB が入っていなければ SQLite (標準ライブラリ) で動かす。
+#
+# ストアごとに 1 つの表 swings を作り、選手・打撃条件・試合区別・試合は整数コード、
+# 日付は 1970-01-01 からの日数、指標は c0, c1, ... の列で持つ (値は swing_store.metric_values と同じ)。
+# 選手 + 日付、打撃条件、ゾーン、試合区別 + 試合に索引を張る。
+#
+# SqlTable は集計キューブ (cube.Cube) と同じ呼び方ができる:
+#   mask(...) で絞り込み条件 (Filter) を作り、& で重ねて、stats / zone_stats / by_player /
+#   top / monthly などに渡す。条件は SQL の WHERE になり、集計は GROUP BY で行う。
+#   試合の表は状況別キューブ (split_cube.SplitCube) と同じ球種・結果の絞り込みと内訳 (breakdown) も持つ。
+# データが追記されたリビジョンでは追加行だけを INSERT する。表は行番号 (row_id) を持ち、
+# 各リビジョンの SqlTable は自分の行数までしか見ないので、古いリビジョンの結果は変わらない。
+import dataclasses
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+import cube
+import split_cube
+import swing_store
+import zone_engine
+
+try:
+  import duckdb
+except ImportError:
+  duckdb = None
+
+ENGINE = os.environ.get("BATTING_SQL_ENGINE", "").strip().lower()
+MATCH_CAT_COL = "試合区別"
+
+
+def enabled():
+  return ENGINE in ("sqlite", "duckdb")
+
+
+# --- 絞り込み条件 ---
+@dataclasses.dataclass(frozen=True)
+class Filter:
+  players: frozenset = None  # 選手コード (None は絞り込まない)
+  conds: frozenset = None
+  cats: frozenset = None
+  matches: frozenset = None
+  start: int = None  # 日数
+  end: int = None
+  strikes: str = None  # "early" (0,1 ストライク) / "two" (2 ストライク)
+  pitches: frozenset = None
+  outcomes: frozenset = None
+
+  def __and__(self, other):
+    def both(a, b):
+      if a is None or b is None:
+        return b if a is None else a
+      return a & b
+
+    def tighter(a, b, pick):
+      if a is None or b is None:
+        return b if a is None else a
+      return pick(a, b)
+
+    if self.strikes and other.strikes and self.strikes != other.strikes:
+      raise ValueError("ストライク状況の条件が矛盾しています")
+    return Filter(
+        both(self.players, other.players),
+        both(self.conds, other.conds),
+        both(self.cats, other.cats),
+        both(self.matches, other.matches),
+        tighter(self.start, other.start, max),
+        tighter(self.end, other.end, min),
+        self.strikes or other.strikes,
+        both(self.pitches, other.pitches),
+        both(self.outcomes, other.outcomes),
+    )
+
+
+_TWO_STRIKES = "CASE WHEN strikes = 2 THEN 1 ELSE 0 END"
+
+
+def _where(f, n_rows):
+  clauses, params = ["row_id < ?"], [n_rows]
+  for col, codes in (
+      ("player", f.players), ("cond", f.conds), ("cat", f.cats), ("match", f.matches),
+      ("pitch", f.pitches), ("outcome", f.outcomes),
+  ):
+    if codes is None:
+      continue
+    if not codes:
+      clauses.append("0 = 1")
+      continue
+    clauses.append(f"{col} IN ({', '.join('?' * len(codes))})")
+    params.extend(sorted(codes))
+  if f.start is not None:
+    clauses.append("day >= ?")
+    params.append(f.start)
+  if f.end is not None:
+    clauses.append("day <= ?")
+    params.append(f.end)
+  if f.strikes is not None:
+    clauses.append(f"{_TWO_STRIKES} = ?")
+    params.append(1 if f.strikes == "two" else 0)
+  return " AND ".join(clauses), params
+
+
+# --- データベース ---
+class Database:
+  # 接続 1 つをスレッド間で共有するので、問い合わせはロックで 1 つずつ流す
+
+  def __init__(self, engine):
+    self.engine = engine if engine == "duckdb" and duckdb is not None else "sqlite"
+    if self.engine == "duckdb":
+      self.conn = duckdb.connect()
+    else:
+      self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+    self.lock = threading.Lock()
+
+  def query(self, sql, params=()):
+    with self.lock:
+      return self.conn.execute(sql, params).fetchall()
+
+  def insert(self, frame, create=False):
+    with self.lock:
+      if self.engine == "duckdb":
+        # NaN は NULL にする (DuckDB は浮動小数の NaN を値として扱う)
+        frame = frame.astype({c: "Float64" for c in frame.columns if frame[c].dtype == "float64"})
+        self.conn.register("incoming", frame)
+        if create:
+          self.conn.execute("CREATE TABLE swings AS SELECT * FROM incoming")
+        else:
+          self.conn.execute("INSERT INTO swings SELECT * FROM incoming")
+        self.conn.unregister("incoming")
+      else:
+        if create:
+          self.conn.execute(_create_sql(frame))
+        frame.to_sql("swings", self.conn, if_exists="append", index=False)
+        self.conn.commit()
+      if create:
+        for name, cols in INDEXES:
+          self.conn.execute(f"CREATE INDEX {name} ON swings ({cols})")
+
+
+INDEXES = [
+    ("idx_player_day", "player, day"),
+    ("idx_cond", "cond"),
+    ("idx_zone", "zr5, zc5"),
+    ("idx_cat_match", "cat, match"),
+]
+
+
+def _create_sql(frame):
+  # row_id は SQLite の rowid (範囲の絞り込みが索引なしで速い)
+  cols = ["row_id INTEGER PRIMARY KEY"]
+  for c in frame.columns[1:]:
+    cols.append(f"{c} {'REAL' if frame[c].dtype == 'float64' else 'INTEGER'}")
+  return f"CREATE TABLE swings ({', '.join(cols)})"
+
+
+# --- 表の行 ---
+def _names(store, col):
+  if col is None or col not in store.df.columns:
+    return ()
+  s = store.df[col]
+  if isinstance(s.dtype, pd.CategoricalDtype):
+    return tuple(s.cat.categories)
+  return tuple(sorted(s.dropna().unique()))
+
+
+def _codes(values, names):
+  return pd.Categorical(values, categories=names).codes.astype("int64")
+
+
+def _frame(store, df, start_row, names, metrics, hand_ratio):
+  day = df[swing_store.DATE_COL].to_numpy().astype("datetime64[D]")
+  nat = np.isnat(day)
+  month = day.astype("datetime64[M]").astype("int64")
+  cols = {
+      "row_id": np.arange(start_row, start_row + len(df), dtype="int64"),
+      "player": _codes(df[store.player_col], names["player"]),
+      "cond": _codes(df[store.cond_col], names["cond"]),
+      "cat": _codes(df[MATCH_CAT_COL], names["cat"]) if names["cat"] else np.full(len(df), -1),
+      "match": (
+          _codes(df[swing_store.MATCH_COL], names["match"]) if names["match"] else np.full(len(df), -1)
+      ),
+      "pitch": _codes(df[swing_store.PITCH_COL], names["pitch"]),
+      "outcome": _codes(df[swing_store.OUTCOME_COL], names["outcome"]),
+      "day": np.where(nat, np.nan, day.astype("int64").astype("float64")),
+      "month": np.where(nat, np.nan, month.astype("float64")),
+      "zr3": df[swing_store.ZONE_ROW3].to_numpy().astype("int64"),
+      "zc3": df[swing_store.ZONE_COL3].to_numpy().astype("int64"),
+      "zr5": df[swing_store.ZONE_ROW5].to_numpy().astype("int64"),
+      "zc5": df[swing_store.ZONE_COL5].to_numpy().astype("int64"),
+      "strikes": df[swing_store.STRIKES_COL].to_numpy().astype("float64"),
+  }
+  arrays = _metric_arrays(store, df, hand_ratio)
+  for j, metric in enumerate(metrics):
+    cols[f"c{j}"] = arrays[metric]
+  frame = pd.DataFrame(cols)
+  # 選手が欠損している行はどの選手にも属さないので入れない (集計キューブと同じ)
+  return frame[frame["player"] >= 0]
+
+
+def _metric_arrays(store, df, hand_ratio):
+  if hand_ratio:
+    return cube._metric_arrays(store, df)
+  return {m: swing_store.metric_values(df, m, hand_ratio=False).to_numpy() for m in store.metric_cols}
+
+
+def _all_names(store):
+  return {
+      "player": _names(store, store.player_col),
+      "cond": _names(store, store.cond_col),
+      "cat": _names(store, MATCH_CAT_COL),
+      # 「対戦相手 (日付)」はストア構築時に作ったカテゴリ列 (swing_store.MATCH_COL)
+      "match": _names(store, swing_store.MATCH_COL),
+      "pitch": _names(store, swing_store.PITCH_COL),
+      "outcome": _names(store, swing_store.OUTCOME_COL),
+  }
+
+
+# --- 問い合わせ (集計キューブと同じ呼び方) ---
+@dataclasses.dataclass(frozen=True)
+class SqlTable:
+  db: Database
+  n_rows: int
+  names: dict  # "player" / "cond" / "cat" / "match" / "pitch" / "outcome" -> 名前の並び (コード順)
+  metrics: tuple
+  revision: object = None
+  hand_ratio: bool = True
+
+  @property
+  def player_names(self):
+    return self.names["player"]
+
+  @property
+  def cond_names(self):
+    return self.names["cond"]
+
+  def metric_index(self, metric):
+    return self.metrics.index(metric)
+
+  def _col(self, metric):
+    return f"c{self.metric_index(metric)}"
+
+  def _lookup(self, kind, values):
+    if values is None:
+      return None
+    lookup = {n: i for i, n in enumerate(self.names[kind])}
+    return frozenset(lookup[v] for v in values if v in lookup)
+
+  def mask(self, players=None, conds=None, start=None, end=None, cats=None, matches=None, strikes=None,
+           pitches=None, outcomes=None):
+    return Filter(
+        self._lookup("player", players),
+        self._lookup("cond", conds),
+        self._lookup("cat", cats),
+        self._lookup("match", matches),
+        None if start is None else cube.to_day(start),
+        None if end is None else cube.to_day(end),
+        strikes,
+        self._lookup("pitch", pitches),
+        self._lookup("outcome", outcomes),
+    )
+
+  def _run(self, select, f, extra="", tail=""):
+    where, params = _where(f if f is not None else Filter(), self.n_rows)
+    if extra:
+      where += " AND " + extra
+    return self.db.query(f"SELECT {select} FROM swings WHERE {where} {tail}", params)
+
+  def row_count(self, mask):
+    return int(self._run("COUNT(*)", mask)[0][0])
+
+  def observed_players(self, mask=None):
+    rows = self._run("DISTINCT player", mask, tail="ORDER BY player")
+    return [self.player_names[r[0]] for r in rows]
+
+  def available_metrics(self, mask=None):
+    if not self.metrics:
+      return []
+    select = ", ".join(f"COUNT(c{j})" for j in range(len(self.metrics)))
+    counts = self._run(select, mask)[0]
+    return [m for m, n in zip(self.metrics, counts) if n and cube.IDEAL_SUFFIX not in m]
+
+  def observed(self, kind, mask=None):
+    # 絞り込んだ範囲に出てくる名前 (コード順)
+    rows = self._run(f"DISTINCT {kind}", mask, f"{kind} >= 0", f"ORDER BY {kind}")
+    return [self.names[kind][r[0]] for r in rows]
+
+  def date_bounds(self, mask):
+    lo, hi = self._run("MIN(day), MAX(day)", mask, "day IS NOT NULL")[0]
+    if lo is None:
+      return None, None
+    return cube.from_day(lo), cube.from_day(hi)
+
+  def stats(self, mask, metric):
+    # (件数, 平均, 最小, 最大)
+    c = self._col(metric)
+    n, total, lo, hi = self._run(f"COUNT({c}), SUM({c}), MIN({c}), MAX({c})", mask)[0]
+    if not n:
+      return 0, np.nan, np.nan, np.nan
+    return int(n), total / n, lo, hi
+
+  def zone_stats(self, mask, metric, layout=3, flip=False):
+    c = self._col(metric)
+    zr, zc = ("zr3", "zc3") if layout == 3 else ("zr5", "zc5")
+    rows = self._run(
+        f"{zr}, {zc}, COUNT({c}), SUM({c}), MIN({c}), MAX({c})",
+        mask,
+        f"{zr} >= 0 AND {zc} >= 0 AND {c} IS NOT NULL",
+        f"GROUP BY {zr}, {zc}",
+    )
+    shape = (layout, layout)
+    count, total = np.zeros(shape), np.zeros(shape)
+    v_min, v_max = np.full(shape, np.nan), np.full(shape, np.nan)
+    for r, col, n, s, lo, hi in rows:
+      if flip:
+        col = (layout - 1) - col
+      count[r, col], total[r, col], v_min[r, col], v_max[r, col] = n, s, lo, hi
+    mean = np.divide(total, count, out=np.zeros(shape), where=count > 0)
+    return zone_engine.ZoneStats(mean, v_min, v_max, count, total)
+
+  def by_player(self, mask, metric):
+    # 選手ごとの平均 (データのある選手のみ・選手コード順)
+    c = self._col(metric)
+    rows = self._run(
+        f"player, SUM({c}) / COUNT({c})", mask, f"{c} IS NOT NULL", "GROUP BY player ORDER BY player",
+    )
+    return pd.Series(
+        [r[1] for r in rows], index=[self.player_names[r[0]] for r in rows], dtype="float64",
+    )
+
+  def top(self, mask, metric, n=3, ascending=False):
+    # 平均の上位 n 人 (ascending=True なら小さい順)
+    c = self._col(metric)
+    order = "ASC" if ascending else "DESC"
+    rows = self._run(
+        f"player, SUM({c}) / COUNT({c}) AS mean", mask, f"{c} IS NOT NULL",
+        f"GROUP BY player ORDER BY mean {order}, player LIMIT {int(n)}",
+    )
+    return pd.Series(
+        [r[1] for r in rows], index=[self.player_names[r[0]] for r in rows], dtype="float64",
+    )
+
+  def monthly(self, mask, metric):
+    # 月ごとの平均・最大・最小 (Month_Sort 順)
+    c = self._col(metric)
+    rows = self._run(
+        f"month, SUM({c}) / COUNT({c}), MAX({c}), MIN({c})",
+        mask,
+        f"day IS NOT NULL AND {c} IS NOT NULL",
+        "GROUP BY month ORDER BY month",
+    )
+    if not rows:
+      return pd.DataFrame(columns=["Month_Sort", "Month_Name", "mean", "max", "min"])
+    month_ts = pd.DatetimeIndex(np.array([int(r[0]) for r in rows], dtype="datetime64[M]"))
+    return pd.DataFrame({
+        "Month_Sort": month_ts.strftime("%Y-%m"),
+        "Month_Name": [f"{m}月" for m in month_ts.month],
+        "mean": [r[1] for r in rows],
+        "max": [r[2] for r in rows],
+        "min": [r[3] for r in rows],
+    })
+
+  def strike_splits(self, mask, metric, smaller_better=False):
+    # 状況 (swing_store.STRIKE_SPLITS) ごとの (平均, ベスト, 件数)。値のある打席が無い状況は (0, 0, 0)
+    c = self._col(metric)
+    rows = self._run(
+        f"{_TWO_STRIKES}, COUNT({c}), SUM({c}), MIN({c}), MAX({c})",
+        mask, f"{c} IS NOT NULL", f"GROUP BY {_TWO_STRIKES}",
+    )
+    parts = {two: (n, s, lo, hi) for two, n, s, lo, hi in rows}
+    early, two = parts.get(0, (0, 0.0, None, None)), parts.get(1, (0, 0.0, None, None))
+    out = {}
+    for name, picked in zip(swing_store.STRIKE_SPLITS, ([early, two], [early], [two])):
+      picked = [p for p in picked if p[0]]
+      n = sum(p[0] for p in picked)
+      if n == 0:
+        out[name] = (0, 0, 0)
+        continue
+      mean = sum(p[1] for p in picked) / n
+      best = min(p[2] for p in picked) if smaller_better else max(p[3] for p in picked)
+      out[name] = (mean, best, n)
+    return out
+
+  def breakdown(self, mask, metric, by="pitch", smaller_better=False):
+    # 値 (球種・結果) ごとの件数・平均・ベストと 0,1 / 2 ストライクの平均 (split_cube.summarize と同じ形)
+    c = self._col(metric)
+    rows = self._run(
+        f"{by}, {_TWO_STRIKES}, COUNT({c}), SUM({c}), MIN({c}), MAX({c})",
+        mask, f"{by} >= 0 AND {c} IS NOT NULL", f"GROUP BY {by}, {_TWO_STRIKES}",
+    )
+    cols = np.array(rows, dtype="float64").reshape(-1, 6).T
+    return split_cube.summarize(
+        self.names[by], cols[0].astype("int64"), cols[1] == 1, *cols[2:], smaller_better,
+    )
+
+
+def build_table(store, hand_ratio=True, engine=None):
+  db = Database(engine or ENGINE)
+  names = _all_names(store)
+  metrics = tuple(_metric_arrays(store, store.df.iloc[:0], hand_ratio))
+  db.insert(_frame(store, store.df, 0, names, metrics, hand_ratio), create=True)
+  return SqlTable(db, len(store.df), names, metrics, store.revision, hand_ratio)
+
+
+def _fold(table, store):
+  # 追加行だけを INSERT し、名前 (カテゴリ) の並びは既存のコードを保ったまま伸ばす
+  names = _all_names(store)
+  for kind, old in table.names.items():
+    new = names[kind]
+    if new[: len(old)] != old:
+      names[kind] = old + tuple(n for n in new if n not in set(old))
+  tail = store.df.iloc[store.parent_rows:]
+  if not tail.empty:
+    table.db.insert(_frame(store, tail, store.parent_rows, names, table.metrics, table.hand_ratio))
+  return dataclasses.replace(table, n_rows=len(store.df), names=names, revision=store.revision)
+
+
+# --- リビジョン単位のメモ化 ---
+_tables = {}
+_lock = threading.Lock()
+
+
+def get_table(store, hand_ratio=True):
+  key = (store.key, hand_ratio)
+  with _lock:
+    cached = _tables.get(key)
+  if cached is not None and store.revision is not None and cached.revision == store.revision:
+    return cached
+  if (
+      cached is not None
+      and store.parent_revision is not None
+      and cached.revision == store.parent_revision
+      and cached.n_rows == store.parent_rows
+      and cached.metrics == tuple(_metric_arrays(store, store.df.iloc[:0], hand_ratio))
+  ):
+    table = _fold(cached, store)
+  else:
+    table = build_table(store, hand_ratio)
+  if store.revision is not None and store.key is not None:
+    with _lock:
+      _tables[key] = table
+  return table
@@ -0,0 +1,366 @@
+# --- 保存先 (ストレージ) ---
+# data_layer がファイルを読み書きする先を差し替えられるようにする。
+#   GitHubStorage : GitHub Contents API (本番)。接続はセッションのプールで使い回し、
+#                   上書き用に読んだ/書いたファイルの SHA と内容を覚えて、保存前の取得を省く
+#   LocalStorage  : ローカルのディレクトリ (リポジトリのチェックアウトなど)。遠征先やオフライン用
+#   SQLiteStorage : SQLite のファイル 1 つにまとめて保存する
+# どれも同じ操作を持ち、状態は HTTP のステータスと同じ数値で返す (通信エラーは ERROR = 0)。
+#   read(path, etag=None, stream=False) -> Result(status, content, etag)  etag が一致すれば 304
+#       stream=True なら content は本文を読むファイルオブジェクト (受信しながら読める)。
+#       読み終えたら呼び出し側が close する
+#   read_for_update(path, fresh)  -> Result(status, content, sha)   上書き用の内容と SHA
+#   write(path, content, message, sha=None) -> Result(status, sha=書き込み後の SHA)
+#   delete(path, message, sha)    -> Result(status)   sha が現在の内容と食い違えば 409
+# 既存ファイルの上書きには直前に読んだ SHA が必要で、食い違えば 409 (競合) を返す。
+# 使う保存先は環境変数 BATTING_STORAGE で選ぶ (プロセスの起動時に決まる):
+#   未設定 / "github"     : GitHub
+#   "local:<ディレクトリ>" : LocalStorage
+#   "sqlite:<ファイル>"    : SQLiteStorage
+import base64
+import collections
+import datetime
+import hashlib
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+ERROR = 0
+OK = 200
+CREATED = 201
+NOT_MODIFIED = 304
+MISSING = 404
+CONFLICT = 409
+
+REQUEST_TIMEOUT_SEC = 30
+POOL_SIZE = 8
+STORAGE_SPEC = os.environ.get("BATTING_STORAGE", "github")
+
+Result = collections.namedtuple(
+    "Result", ["status", "content", "etag", "sha"], defaults=(b"", None, None)
+)
+
+
+def content_sha(content):
+  return hashlib.sha1(content).hexdigest()
+
+
+def is_conflict(status):
+  # GitHub は SHA の食い違いを 409、SHA なしでの上書きを 422 で返す
+  return status in (CONFLICT, 422)
+
+
+# --- GitHub ---
+class GitHubStorage:
+
+  def __init__(self, user, repo, token, branch="main"):
+    self.user = user
+    self.repo = repo
+    self.branch = branch
+    self.session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=POOL_SIZE)
+    self.session.mount("https://", adapter)
+    self.session.headers["Authorization"] = f"token {token}"
+    self._known = {}  # パス -> (SHA, 内容)。read_for_update / write で分かったもの (未作成なら None)
+    self._lock = threading.Lock()
+
+  def url(self, path):
+    return f"https://api.github.com/repos/{self.user}/{self.repo}/contents/{path}"
+
+  def read(self, path, etag=None, stream=False):
+    headers = {"Accept": "application/vnd.github.raw"}
+    if etag:
+      headers["If-None-Match"] = etag
+    try:
+      res = self.session.get(
+          self.url(path),
+          headers=headers,
+          params={"ref": self.branch},
+          timeout=REQUEST_TIMEOUT_SEC,
+          stream=stream,
+      )
+    except requests.RequestException:
+      return Result(ERROR)
+    if res.status_code != OK:
+      res.close()
+      return Result(res.status_code, etag=res.headers.get("ETag"))
+    if stream:
+      # 最後まで読めば接続はプールに戻る
+      res.raw.decode_content = True
+      return Result(OK, res.raw, res.headers.get("ETag"))
+    return Result(OK, res.content, res.headers.get("ETag"))
+
+  def read_for_update(self, path, fresh=False):
+    # 自分が最後に読んだ/書いた内容をそのまま返す。他から更新されていれば
+    # write が競合を返すので、そのときは fresh=True で取り直す
+    if not fresh:
+      with self._lock:
+        known = self._known.get(path)
+      if known is not None:
+        return Result(OK, known[1], sha=known[0])
+    try:
+      res = self.session.get(
+          self.url(path),
+          headers={"Accept": "application/vnd.github.v3+json"},
+          params={"ref": self.branch},
+          timeout=REQUEST_TIMEOUT_SEC,
+      )
+    except requests.RequestException:
+      return Result(ERROR)
+    if res.status_code != OK:
+      if res.status_code == MISSING:
+        with self._lock:
+          self._known[path] = None
+      return Result(res.status_code)
+    body = res.json()
+    content = base64.b64decode(body.get("content", ""))
+    sha = body.get("sha")
+    with self._lock:
+      self._known[path] = (sha, content)
+    return Result(OK, content, sha=sha)
+
+  def write(self, path, content, message, sha=None):
+    data = {"message": message, "content": base64.b64encode(content).decode()}
+    if sha:
+      data["sha"] = sha
+    try:
+      res = self.session.put(
+          self.url(path),
+          headers={"Accept": "application/vnd.github.v3+json"},
+          json=data,
+          timeout=REQUEST_TIMEOUT_SEC,
+      )
+    except requests.RequestException:
+      return Result(ERROR)
+    if res.status_code not in (OK, CREATED):
+      if is_conflict(res.status_code):
+        with self._lock:
+          self._known.pop(path, None)
+      return Result(res.status_code)
+    new_sha = (res.json().get("content") or {}).get("sha")
+    with self._lock:
+      # 上書きするファイル (マニフェスト) だけ覚える。追記パーティションは二度と書かない
+      if path in self._known or sha:
+        self._known[path] = (new_sha, content)
+    return Result(res.status_code, sha=new_sha)
+
+  def delete(self, path, message, sha):
+    try:
+      res = self.session.delete(
+          self.url(path),
+          headers={"Accept": "application/vnd.github.v3+json"},
+          json={"message": message, "sha": sha},
+          timeout=REQUEST_TIMEOUT_SEC,
+      )
+    except requests.RequestException:
+      return Result(ERROR)
+    with self._lock:
+      self._known.pop(path, None)
+    return Result(res.status_code)
+
+
+# --- ローカルのディレクトリ ---
+class LocalStorage:
+
+  def __init__(self, root):
+    self.root = os.path.abspath(root)
+    self._lock = threading.Lock()
+
+  def _file(self, path):
+    return os.path.join(self.root, *path.split("/"))
+
+  def read(self, path, etag=None, stream=False):
+    # ETag は更新時刻とサイズから作る (304 のときはファイルを読まない)
+    try:
+      st = os.stat(self._file(path))
+    except FileNotFoundError:
+      return Result(MISSING)
+    except OSError:
+      return Result(ERROR)
+    current = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    if etag == current:
+      return Result(NOT_MODIFIED, etag=current)
+    try:
+      f = open(self._file(path), "rb")
+    except OSError:
+      return Result(ERROR)
+    if stream:
+      return Result(OK, f, current)
+    with f:
+      try:
+        return Result(OK, f.read(), current)
+      except OSError:
+        return Result(ERROR)
+
+  def read_for_update(self, path, fresh=False):
+    try:
+      with open(self._file(path), "rb") as f:
+        content = f.read()
+    except FileNotFoundError:
+      return Result(MISSING)
+    except OSError:
+      return Result(ERROR)
+    return Result(OK, content, sha=content_sha(content))
+
+  def write(self, path, content, message, sha=None):
+    # message はこの保存先では使わない (履歴を持たない)
+    target = self._file(path)
+    with self._lock:
+      current = self.read_for_update(path)
+      if current.status == ERROR:
+        return Result(ERROR)
+      exists = current.status == OK
+      if (exists and sha != current.sha) or (not exists and sha):
+        return Result(CONFLICT)
+      try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+          f.write(content)
+        os.replace(tmp, target)
+      except OSError:
+        return Result(ERROR)
+    return Result(OK if exists else CREATED, sha=content_sha(content))
+
+  def delete(self, path, message, sha):
+    with self._lock:
+      current = self.read_for_update(path)
+      if current.status != OK:
+        return Result(current.status)
+      if sha != current.sha:
+        return Result(CONFLICT)
+      try:
+        os.remove(self._file(path))
+      except OSError:
+        return Result(ERROR)
+    return Result(OK)
+
+
+# --- SQLite ---
+class SQLiteStorage:
+
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+    conn = self._connect()
+    try:
+      conn.execute(
+          "CREATE TABLE IF NOT EXISTS files ("
+          " path TEXT PRIMARY KEY, content BLOB NOT NULL,"
+          " sha TEXT NOT NULL, message TEXT, updated_at TEXT)"
+      )
+      conn.commit()
+    finally:
+      conn.close()
+
+  def _connect(self):
+    # 接続はスレッドをまたいで使えないので、操作ごとに開く
+    return sqlite3.connect(self.path, timeout=REQUEST_TIMEOUT_SEC)
+
+  def read(self, path, etag=None, stream=False):
+    try:
+      conn = self._connect()
+      try:
+        row = conn.execute("SELECT sha FROM files WHERE path = ?", (path,)).fetchone()
+        if row is None:
+          return Result(MISSING)
+        current = f'"{row[0]}"'
+        if etag == current:
+          return Result(NOT_MODIFIED, etag=current)
+        row = conn.execute("SELECT content, sha FROM files WHERE path = ?", (path,)).fetchone()
+      finally:
+        conn.close()
+    except sqlite3.Error:
+      return Result(ERROR)
+    if row is None:
+      return Result(MISSING)
+    content = bytes(row[0])
+    return Result(OK, io.BytesIO(content) if stream else content, f'"{row[1]}"')
+
+  def read_for_update(self, path, fresh=False):
+    try:
+      conn = self._connect()
+      try:
+        row = conn.execute("SELECT content, sha FROM files WHERE path = ?", (path,)).fetchone()
+      finally:
+        conn.close()
+    except sqlite3.Error:
+      return Result(ERROR)
+    if row is None:
+      return Result(MISSING)
+    return Result(OK, bytes(row[0]), sha=row[1])
+
+  def write(self, path, content, message, sha=None):
+    new_sha = content_sha(content)
+    now = datetime.datetime.now().isoformat(timespec="seconds")
+    try:
+      with self._lock:
+        conn = self._connect()
+        try:
+          conn.execute("BEGIN IMMEDIATE")
+          row = conn.execute("SELECT sha FROM files WHERE path = ?", (path,)).fetchone()
+          if (row is not None and sha != row[0]) or (row is None and sha):
+            conn.rollback()
+            return Result(CONFLICT)
+          conn.execute(
+              "INSERT OR REPLACE INTO files (path, content, sha, message, updated_at)"
+              " VALUES (?, ?, ?, ?, ?)",
+              (path, sqlite3.Binary(content), new_sha, message, now),
+          )
+          conn.commit()
+        finally:
+          conn.close()
+    except sqlite3.Error:
+      return Result(ERROR)
+    return Result(CREATED if row is None else OK, sha=new_sha)
+
+  def delete(self, path, message, sha):
+    try:
+      with self._lock:
+        conn = self._connect()
+        try:
+          conn.execute("BEGIN IMMEDIATE")
+          row = conn.execute("SELECT sha FROM files WHERE path = ?", (path,)).fetchone()
+          if row is None:
+            conn.rollback()
+            return Result(MISSING)
+          if sha != row[0]:
+            conn.rollback()
+            return Result(CONFLICT)
+          conn.execute("DELETE FROM files WHERE path = ?", (path,))
+          conn.commit()
+        finally:
+          conn.close()
+    except sqlite3.Error:
+      return Result(ERROR)
+    return Result(OK)
+
+
+# --- 保存先の選択 ---
+def from_spec(spec, user, repo, token):
+  kind, _, arg = (spec or "github").partition(":")
+  if kind == "github":
+    return GitHubStorage(user, repo, token)
+  if kind == "local":
+    return LocalStorage(arg or ".")
+  if kind == "sqlite":
+    return SQLiteStorage(arg or "batting.db")
+  raise ValueError(f"BATTING_STORAGE が不正です: {spec}")
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(user, repo, token):
+  # (user, repo, token) ごとに 1 つを使い回す (GitHub はセッションの接続プールを共有する)
+  key = (STORAGE_SPEC, user, repo, token)
+  with _backends_lock:
+    backend = _backends.get(key)
+    if backend is None:
+      backend = _backends[key] = from_spec(STORAGE_SPEC, user, repo, token)
+  return backend
@@ -0,0 +1,385 @@
+# --- 型付きスイングデータストア ---
+# 文字列のまま読み込んだ CSV を、データのリビジョンごとに一度だけ型変換する。
+# 各タブは毎回 pd.to_numeric をかけ直す代わりに、このストアを参照する。
+# データが追記されただけのリビジョンでは、追加行だけを型変換して既存のストアに連結する。
+import dataclasses
+import threading
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+import snapshot
+import zone_engine
+
+METRIC_KEYWORDS = [
+    "スコア", "速度", "角度", "効率", "パワー", "時間", "スピード", "飛距離", "G)", "度",
+]
+CATEGORY_COLS = ["試合区別"]
+BAT_SPEED_COL = "バットスピード (km/h)"
+HAND_SPEED_KEY = "手の最大スピード"
+STRIKE_COL = "ストライク"
+# 分析 (タブ1・2) だけに使うストアで残す元データの列
+ANALYSIS_EXTRA_COLS = ("StrikeZoneX", "StrikeZoneY")
+
+# 派生列 (元の CSV には存在しない列は "_" で始める)
+DATE_COL = "_date"
+ZONE_ROW3, ZONE_COL3 = "_zr3", "_zc3"
+ZONE_ROW5, ZONE_COL5 = "_zr5", "_zc5"
+HAND_EFF_COL = "_hand_eff"
+STRIKES_COL = "_strikes"
+MATCH_COL = "_match"  # 試合の行の「対戦相手 (日付)」(カテゴリ)。練習の行は欠損
+SPRAY_ROW, SPRAY_COL = "_spray_r", "_spray_c"  # 飛距離・打球方向のマス (zone_engine)
+PITCH_COL, OUTCOME_COL = "_pitch", "_outcome"  # 表記をそろえた球種・結果 (SB) の分類 (カテゴリ)
+DERIVED_COLS = (
+    DATE_COL, ZONE_ROW3, ZONE_COL3, ZONE_ROW5, ZONE_COL5, HAND_EFF_COL, STRIKES_COL,
+    MATCH_COL, SPRAY_ROW, SPRAY_COL, PITCH_COL, OUTCOME_COL,
+)
+PITCH_TYPE_COL, OUTCOME_SRC_COL = "球種", "SB"
+# 同じ球種の別表記 (記録者によって省略形が混ざる)
+PITCH_ALIASES = {"カット": "カットボール", "チェンジ": "チェンジアップ"}
+# 結果 (SB) の記録は "左安" "7H" "二併打" "3ファウルフライ" のように表記が揺れるので分類にまとめる。
+# (分類, 正規表現)。上から順に判定し、どれにも当たらなければ "その他"
+OUTCOME_RULES = [
+    ("空振り", r"空振"),
+    ("フライ", r"邪飛|ファウルフライ|犠飛"),
+    ("ファウル", r"ファウル|ファうる"),
+    ("本塁打", r"本塁打|HR"),
+    ("長打", r"二塁打|三塁打|2B|3B"),
+    ("単打", r"安|H|ヒット"),
+    ("失策", r"失策|E"),
+    ("ゴロ", r"ゴロ|ごろ|併"),
+    ("ライナー", r"直|ライナー"),
+    ("フライ", r"飛|フライ"),
+]
+OUTCOME_OTHER = "その他"
+DIRECTION_COL, DISTANCE_COL = "打球方向", "飛距離"
+COURSE_COL = "コース"
+PRACTICE_CATEGORY = "練習"
+# 派生列の構成を変えたら上げる (古いスナップショットは使わずに作り直す)
+STORE_FORMAT = 5
+
+# 指標は float32 で保持する。計算時に float64 へ戻す際、センサー値の桁数
+# (小数第 4 位まで) で丸めて float32 の表現誤差が色分けの境界に影響しないようにする
+METRIC_DECIMALS = 4
+
+
+@dataclasses.dataclass(frozen=True)
+class SwingStore:
+  df: pd.DataFrame
+  revision: object = None
+  raw_columns: tuple = ()
+  player_col: str = None
+  cond_col: str = None
+  metric_cols: tuple = ()
+  key: object = None  # メモ化・派生キャッシュ用の識別子
+  # 追記で作られたストアの場合、先頭 parent_rows 行は parent_revision のストアと同一
+  parent_revision: object = None
+  parent_rows: int = 0
+
+  @property
+  def empty(self):
+    return self.df.empty
+
+
+def is_metric_name(col):
+  return any(k in str(col) for k in METRIC_KEYWORDS)
+
+
+# metric_cols を渡すと、値が全て欠損していてもその列を指標として扱う (追記分の型をそろえる)
+def build_store(raw, revision=None, metric_cols=()):
+  known_metrics = set(metric_cols)
+  raw_columns = tuple(raw.columns)
+  if raw.empty:
+    return SwingStore(raw, revision, raw_columns)
+
+  player_col = "Player Name" if "Player Name" in raw_columns else raw_columns[-1]
+  cond_col = "スイング条件" if "スイング条件" in raw_columns else "スイング条件_str"
+  cols, metric_cols = {}, []
+  for c in raw_columns:
+    s = raw[c]
+    if c == cond_col:
+      cols[c] = s.fillna("未設定").astype(str).str.strip().astype("category")
+    elif c == player_col or c in CATEGORY_COLS:
+      cols[c] = s.astype("category")
+    elif c in ("StrikeZoneX", "StrikeZoneY"):
+      # ゾーン境界と厳密に比較するため座標は float64 のまま持つ
+      cols[c] = pd.to_numeric(s, errors="coerce")
+    elif is_metric_name(c):
+      num = pd.to_numeric(s, errors="coerce")
+      if c in known_metrics or num.notna().any():
+        cols[c] = num.astype("float32")
+        metric_cols.append(c)
+      else:
+        cols[c] = s
+    else:
+      cols[c] = s
+  if cond_col not in cols:
+    cols[cond_col] = pd.Series("未設定", index=raw.index, dtype="category")
+
+  # --- 派生列 ---
+  # DateTime は "日付 時刻" の形 (ingest.prepare_rows) なので先頭 10 文字が日付
+  if "DateTime" in raw_columns:
+    date_str = raw["DateTime"].astype(str).str[:10]
+    cols[DATE_COL] = pd.to_datetime(date_str, format="%Y-%m-%d", errors="coerce")
+  else:
+    date_str = pd.Series("nan", index=raw.index)
+    cols[DATE_COL] = pd.Series(pd.NaT, index=raw.index, dtype="datetime64[ns]")
+
+  # 試合の選択肢 (タブ4) は 1 列目 (対戦相手) と日付から作る
+  category = raw[CATEGORY_COLS[0]] if CATEGORY_COLS[0] in raw_columns else None
+  is_game = (
+      np.zeros(len(raw), dtype=bool)
+      if category is None
+      else (category.notna() & (category != PRACTICE_CATEGORY)).to_numpy()
+  )
+  label = raw[raw_columns[0]].astype(str) + " (" + date_str + ")"
+  cols[MATCH_COL] = label.where(is_game).astype("category")
+  cols[PITCH_COL] = _labels(raw, PITCH_TYPE_COL).replace(PITCH_ALIASES).astype("category")
+  cols[OUTCOME_COL] = _outcome_classes(_labels(raw, OUTCOME_SRC_COL))
+
+  x = cols.get("StrikeZoneX", pd.Series(np.nan, index=raw.index))
+  y = cols.get("StrikeZoneY", pd.Series(np.nan, index=raw.index))
+  if COURSE_COL in raw_columns and is_game.any():
+    # 試合の行は保存済みの座標ではなく「コース」から作り直す。
+    # 以前の登録時の変換は イン/ハイ 等を判定せず インハイ を真ん中にしていたので、
+    # 過去の行と新しく登録した行が同じコースで別のマスに入らないようにする
+    cx, cy = zone_engine.course_to_coords(raw[COURSE_COL].where(is_game))
+    parsed = ~np.isnan(cx)
+    x = x.where(~parsed, cx)
+    y = y.where(~parsed, cy)
+    cols["StrikeZoneX"], cols["StrikeZoneY"] = x, y
+  cols[ZONE_ROW3] = zone_engine.zone_rows(y, 3)
+  cols[ZONE_COL3] = zone_engine.zone_cols(x, 3)
+  cols[ZONE_ROW5] = zone_engine.zone_rows(y, 5)
+  cols[ZONE_COL5] = zone_engine.zone_cols(x, 5)
+  # 打球方向は指標の名前に当たらないので、ここで数値にしてマスだけを持つ
+  cols[SPRAY_ROW] = zone_engine.spray_rows(_numeric(raw, DISTANCE_COL))
+  cols[SPRAY_COL] = zone_engine.spray_cols(_numeric(raw, DIRECTION_COL))
+
+  hand_col = next((c for c in metric_cols if HAND_SPEED_KEY in c), None)
+  if hand_col is not None and BAT_SPEED_COL in metric_cols:
+    cols[HAND_EFF_COL] = _as_float64(cols[BAT_SPEED_COL]) / _as_float64(
+        cols[hand_col]
+    )
+
+  strike_col = STRIKE_COL
+  if strike_col not in raw_columns:
+    strike_col = raw_columns[min(2, len(raw_columns) - 1)]
+  cols[STRIKES_COL] = pd.to_numeric(raw[strike_col], errors="coerce").astype("float32")
+
+  df = pd.DataFrame(cols, index=raw.index)
+  return SwingStore(
+      df, revision, raw_columns, player_col, cond_col, tuple(metric_cols)
+  )
+
+
+def _labels(raw, col):
+  # 全角・半角と前後の空白をそろえた文字列 (空欄は欠損)
+  if col not in raw.columns:
+    return pd.Series(np.nan, index=raw.index, dtype="str")
+  s = raw[col].astype("str").str.normalize("NFKC").str.strip()
+  return s.where(raw[col].notna() & (s != ""))
+
+
+def _outcome_classes(labels):
+  # 表記の種類ごとに一度だけ判定してから行に展開する
+  cat = pd.Categorical(labels)
+  names = pd.Series(cat.categories.astype("str"))
+  classes = np.select(
+      [names.str.contains(p).to_numpy() for _, p in OUTCOME_RULES],
+      [c for c, _ in OUTCOME_RULES],
+      OUTCOME_OTHER,
+  )
+  # 末尾の None は表記なし (コード -1) の行
+  by_code = np.append(np.asarray(classes, dtype=object), None)
+  return pd.Series(by_code[cat.codes], index=labels.index, dtype="str").astype("category")
+
+
+def _numeric(raw, col):
+  if col not in raw.columns:
+    return np.full(len(raw), np.nan)
+  return pd.to_numeric(raw[col], errors="coerce").to_numpy(dtype="float64")
+
+
+def _as_float64(s):
+  if s.dtype == "float32":
+    return s.astype("float64").round(METRIC_DECIMALS)
+  return s.astype("float64")
+
+
+def metric_values(df, metric, hand_ratio=True):
+  # 計算用の float64 値。手の最大スピードはバットスピードとの比 (効率) を返す
+  if hand_ratio and HAND_SPEED_KEY in metric and HAND_EFF_COL in df.columns:
+    return _as_float64(df[HAND_EFF_COL])
+  return _as_float64(df[metric])
+
+
+# --- ストライク状況別の集計 (タブ4) ---
+# strike_splits (split_cube.SplitCube / sql_engine.SqlTable) は状況名 → (平均, ベスト, 件数) を返す。
+# 0,1 ストライクはカウント不明の打席を含む。ベストは smaller_better なら最小、そうでなければ最大。
+# 値のある打席が無い状況は (0, 0, 0)
+STRIKE_SPLITS = ("全状況", "0,1ストライク", "2ストライク")
+
+
+def _analysis_columns(columns, player_col, cond_col, metric_cols):
+  keep = {player_col, cond_col, *CATEGORY_COLS, *ANALYSIS_EXTRA_COLS}
+  keep.update(metric_cols)
+  keep.update(DERIVED_COLS)
+  return [c for c in columns if c in keep]
+
+
+def analysis_columns(store):
+  return _analysis_columns(
+      store.df.columns, store.player_col, store.cond_col, store.metric_cols
+  )
+
+
+# --- スナップショット (snapshot.py) ---
+def _snapshot_meta(store, projected=False):
+  return {
+      "revision": store.revision,
+      "columns": list(store.df.columns),
+      "raw_columns": list(store.raw_columns),
+      "player_col": store.player_col,
+      "cond_col": store.cond_col,
+      "metric_cols": list(store.metric_cols),
+      "projected": projected,  # 分析用の列だけを保存したもの
+      "format": STORE_FORMAT,
+  }
+
+
+def restore_snapshot(key, revision, analysis_only=False):
+  meta = snapshot.read_meta("stores", key)
+  if meta is None or meta.get("revision") != revision:
+    return None
+  if meta.get("format") != STORE_FORMAT:
+    return None
+  if meta.get("projected") and not analysis_only:
+    return None
+  columns = None
+  if analysis_only:
+    columns = _analysis_columns(
+        meta["columns"], meta["player_col"], meta["cond_col"], meta["metric_cols"]
+    )
+  meta, df = snapshot.read("stores", key, columns)
+  if df is None:
+    return None
+  return SwingStore(
+      df,
+      revision,
+      tuple(meta["raw_columns"]),
+      meta["player_col"],
+      meta["cond_col"],
+      tuple(meta["metric_cols"]),
+      key,
+  )
+
+
+# --- リビジョン単位のメモ化 ---
+# analysis_only=True のストアは分析 (タブ1・2) に使う列だけを保持する。
+# スナップショットからは Parquet の列指定で必要な列だけを読み込む
+_stores = {}
+_lock = threading.Lock()
+
+
+def get_store(key, raw, revision, analysis_only=False, history=None):
+  # history: 以前のリビジョン → その時点の行数 (data_layer.history)
+  with _lock:
+    cached = _stores.get(key)
+  if cached is not None and revision is not None and cached.revision == revision:
+    return cached
+  store = None
+  if cached is not None and revision is not None and history:
+    store = _fold(cached, raw, revision, history)
+    if store is not None:
+      snapshot.write("stores", key, store.df, _snapshot_meta(store, analysis_only))
+  if store is None and revision is not None:
+    store = restore_snapshot(key, revision, analysis_only)
+  if store is None:
+    store = build_store(raw, revision)
+    if revision is not None and not store.empty:
+      snapshot.write("stores", key, store.df, _snapshot_meta(store))
+    if analysis_only and not store.empty:
+      store = dataclasses.replace(store, df=store.df[analysis_columns(store)])
+    store = dataclasses.replace(store, key=key)
+  if revision is not None:
+    with _lock:
+      _stores[key] = store
+  return store
+
+
+# --- 追記分の取り込み ---
+def _fold(cached, raw, revision, history):
+  n = history.get(cached.revision)
+  if n is None or n != len(cached.df) or cached.raw_columns != tuple(raw.columns):
+    return None
+  if n == len(raw):
+    delta_df = cached.df.iloc[:0]
+  else:
+    delta = build_store(raw.iloc[n:], revision, cached.metric_cols)
+    if delta.metric_cols != cached.metric_cols:
+      # 追加行で新しい指標列が現れた → 列の型が変わるので作り直す
+      return None
+    delta_df = delta.df
+  return dataclasses.replace(
+      cached,
+      df=concat_frames(cached.df, delta_df),
+      revision=revision,
+      parent_revision=cached.revision,
+      parent_rows=n,
+  )
+
+
+def concat_frames(head, tail):
+  # カテゴリ列はカテゴリを合わせて連結する (既存のコードはそのまま)
+  if tail.empty:
+    return head
+  index = head.index.append(tail.index)
+  cols = {}
+  for c in head.columns:
+    a, b = head[c], tail[c]
+    if isinstance(a.dtype, pd.CategoricalDtype) and isinstance(b.dtype, pd.CategoricalDtype):
+      cols[c] = pd.Series(union_categoricals([_cat_like(a, b), _cat_like(b, a)]), index=index)
+    else:
+      cols[c] = pd.concat([a, b]).set_axis(index)
+  return pd.DataFrame(cols, index=index)
+
+
+def _cat_like(a, b):
+  # カテゴリが空の列 (スナップショットから読むと object 型になる) の型を b に合わせる
+  if len(a.cat.categories) == 0 and a.cat.categories.dtype != b.cat.categories.dtype:
+    return a.cat.set_categories(b.cat.categories[:0])
+  return a
+
+
+def restrict_players(store, players):
+  if store.empty or store.player_col not in store.df.columns:
+    return store
+  key = (store.key, tuple(players))
+  with _lock:
+    cached = _stores.get(key)
+  if cached is not None and cached.revision == store.revision:
+    return cached
+  if cached is not None and store.parent_revision == cached.revision:
+    # 追記されたリビジョン → 追加行だけを絞り込んで連結する
+    tail = store.df.iloc[store.parent_rows:]
+    restricted = dataclasses.replace(
+        store,
+        df=concat_frames(cached.df, tail[tail[store.player_col].isin(players)]),
+        key=key,
+        parent_revision=cached.revision,
+        parent_rows=len(cached.df),
+    )
+  else:
+    restricted = dataclasses.replace(
+        store,
+        df=store.df[store.df[store.player_col].isin(players)],
+        key=key,
+        parent_revision=None,
+        parent_rows=0,
+    )
+  if store.revision is not None:
+    with _lock:
+      _stores[key] = restricted
+  return restricted
@@ -0,0 +1,53 @@
+import pandas as pd
+
+import data_layer
+import storage
+from bench.local_github import LocalGitHub
+from bench.local_github import Response
+
+USER = "team"
+REPO = "batting"
+PATH = "data.csv"
+
+
+def _partitions(github):
+  prefix = data_layer.partition_dir(PATH) + "/"
+  return [p for p in github.files if p.startswith(prefix) and p.endswith(".csv")]
+
+
+def _rows():
+  return pd.DataFrame({"選手名": ["西村"], "日付": ["2024-05-01"], "スイング速度": [120.0]})
+
+
+def test_append_conflicts_leave_no_orphan_partition(monkeypatch):
+  monkeypatch.setattr(data_layer, "SAVE_BACKOFF_SEC", 0)
+  with LocalGitHub() as github:
+    put = github.put
+    manifest_writes = []
+
+    def conflicting_put(url, **kwargs):
+      # マニフェストは毎回ほかの端末に先を越される
+      if url.endswith(data_layer.manifest_path(PATH)):
+        manifest_writes.append(url)
+        return Response(storage.CONFLICT, body={"message": "conflict"})
+      return put(url, **kwargs)
+
+    github.put = conflicting_put
+    ok, _ = data_layer.append_rows(USER, REPO, PATH, _rows(), "conflict-token")
+
+  assert not ok
+  assert len(manifest_writes) == data_layer.SAVE_ATTEMPTS
+  # パーティションは再試行のたびに書き直さず、最後に消す
+  part_puts = [p for m, p, _ in github.requests if m == "PUT" and p.endswith(".csv")]
+  assert len(part_puts) == 1
+  assert _partitions(github) == []
+
+
+def test_append_writes_partition_and_manifest():
+  with LocalGitHub() as github:
+    ok, _ = data_layer.append_rows(USER, REPO, PATH, _rows(), "token")
+
+  assert ok
+  manifest = data_layer.parse_manifest(github.files[data_layer.manifest_path(PATH)])
+  prefix = data_layer.partition_dir(PATH) + "/"
+  assert [prefix + p["file"] for p in manifest] == _partitions(github)
@@ -0,0 +1,13 @@
+import ingest
+import roster
+
+
+def test_infer_player_by_full_name_and_number():
+  assert ingest.infer_player("西村友哉_0501.xlsx", roster.PLAYERS) == "#7 西村 友哉"
+  assert ingest.infer_player("#26_練習.xlsx", roster.PLAYERS) == "#26 西村 彰浩"
+
+
+def test_infer_player_ambiguous_surname():
+  # 西村は #7 と #26 の 2 人いるので名字だけでは決めない
+  assert ingest.infer_player("西村_0501.xlsx", roster.PLAYERS) is None
+  assert ingest.infer_player("#26 西村.xlsx", roster.PLAYERS) == "#26 西村 彰浩"
@@ -0,0 +1,158 @@
+# --- ストライクゾーン定義とゾーン判定 ---
+import collections
+
+import numpy as np
+import pandas as pd
+
+# --- ストライクゾーン定義 (cm) ---
+SZ_X_MIN, SZ_X_MAX = -28.8, 28.8
+SZ_X_TH1, SZ_X_TH2 = -9.6, 9.6
+SZ_Y_MIN, SZ_Y_MAX = 45.0, 110.0
+SZ_Y_TH1, SZ_Y_TH2 = 66.6, 88.3
+
+# 境界の扱いは従来の if/else 判定と同じ:
+#   列: x < TH1 → 内側, TH1 <= x <= TH2 → 真ん中, x > TH2 → 外側
+#   行: y > TH2 → 高め, TH1 < y <= TH2 → 真ん中, y <= TH1 → 低め
+# 5x5 はその外周にゾーン外の 1 マスを加えたもの。
+# searchsorted の side で境界の含み方を切り替える ("right": x >= 境界, "left": x > 境界)
+_COL_EDGES = {
+    3: (np.array([SZ_X_TH1]), np.array([SZ_X_TH2])),
+    5: (np.array([SZ_X_MIN, SZ_X_TH1]), np.array([SZ_X_TH2, SZ_X_MAX])),
+}
+_ROW_EDGES = {
+    3: np.array([SZ_Y_TH1, SZ_Y_TH2]),
+    5: np.array([SZ_Y_MIN, SZ_Y_TH1, SZ_Y_TH2, SZ_Y_MAX]),
+}
+
+
+# 座標が欠損している場合は -1 を返す
+def zone_cols(x, layout=3):
+  x = np.asarray(x, dtype="float64")
+  closed, open_ = _COL_EDGES[layout]
+  idx = np.searchsorted(closed, x, side="right") + np.searchsorted(
+      open_, x, side="left"
+  )
+  return np.where(np.isnan(x), -1, idx).astype("int8")
+
+
+def zone_rows(y, layout=3):
+  y = np.asarray(y, dtype="float64")
+  idx = (layout - 1) - np.searchsorted(_ROW_EDGES[layout], y, side="left")
+  return np.where(np.isnan(y), -1, idx).astype("int8")
+
+
+# --- 打球方向 × 飛距離のマス (スプレーチャート) ---
+# 打球方向はセンター 0°、一塁側 (右方向) が正。フェアゾーン (±45°) を 5 方向、
+# 飛距離を 5 段階に分け、ストライクゾーンの 5x5 と同じ (行, 列) として扱う。
+#   行: 飛距離 (0 が最も近い)  列: 方向 (0 がレフト側)
+# ファウル・飛距離 0 (計測なし)・上限を超える値・欠損は -1
+SPRAY_ANGLE_EDGES = np.array([-45.0, -27.0, -9.0, 9.0, 27.0, 45.0])
+SPRAY_DISTANCE_EDGES = np.array([0.0, 30.0, 60.0, 90.0, 110.0, 200.0])
+SPRAY_SECTORS = ("レフト", "左中間", "センター", "右中間", "ライト")
+SPRAY_RINGS = ("〜30m", "30〜60m", "60〜90m", "90〜110m", "110m〜")
+
+
+def _bins(v, edges, include_low):
+  v = np.asarray(v, dtype="float64")
+  idx = np.clip(np.searchsorted(edges, v, side="right") - 1, 0, len(edges) - 2)
+  low_ok = v >= edges[0] if include_low else v > edges[0]
+  return np.where(low_ok & (v <= edges[-1]), idx, -1).astype("int8")
+
+
+def spray_cols(direction):
+  return _bins(direction, SPRAY_ANGLE_EDGES, include_low=True)
+
+
+def spray_rows(distance):
+  return _bins(distance, SPRAY_DISTANCE_EDGES, include_low=False)
+
+
+# --- ゾーン集計 ---
+# mean / min / max / count / sum は (layout, layout) の配列
+ZoneStats = collections.namedtuple(
+    "ZoneStats", ["mean", "min", "max", "count", "sum"]
+)
+
+
+def aggregate(rows, cols, count, total, vmin, vmax, layout=3, flip=False):
+  # 集計済みのグループ (集計キューブ cube.py / split_cube.py の行) をゾーン別にまとめる。
+  # 各グループのゾーン (行, 列) と件数・合計・最小・最大を渡す (ゾーン外の -1 と件数 0 は数えない)
+  rows = np.asarray(rows, dtype="int64")
+  cols = np.asarray(cols, dtype="int64")
+  count = np.asarray(count, dtype="float64")
+  valid = (rows >= 0) & (cols >= 0) & (count > 0)
+  if flip:
+    # 左打者は内角・外角が左右逆になる
+    cols = (layout - 1) - cols
+  idx = (rows * layout + cols)[valid]
+  size = layout * layout
+  n = np.bincount(idx, weights=count[valid], minlength=size)
+  s = np.bincount(idx, weights=np.asarray(total, dtype="float64")[valid], minlength=size)
+  v_min = np.full(size, np.inf)
+  v_max = np.full(size, -np.inf)
+  np.minimum.at(v_min, idx, np.asarray(vmin, dtype="float64")[valid])
+  np.maximum.at(v_max, idx, np.asarray(vmax, dtype="float64")[valid])
+  has = n > 0
+  mean = np.divide(s, n, out=np.zeros(size), where=has)
+  v_min[~has] = np.nan
+  v_max[~has] = np.nan
+  shape = (layout, layout)
+  return ZoneStats(
+      mean.reshape(shape),
+      v_min.reshape(shape),
+      v_max.reshape(shape),
+      n.reshape(shape),
+      s.reshape(shape),
+  )
+
+
+# --- コース文字列を座標に変換する ---
+# 列全体をカテゴリ化し、種類ごとに一度だけトークンを判定してから行に展開する。
+# 3x3 (内/真ん中/外 × 高め/真ん中/低め、インハイ・アウトロー等) に加えて
+# ゾーン外のボール (内ボール・高めボール等) を含む 5x5 と、数字コードにも対応する。
+#   1〜9  : 3x3 のマス番号 (高め→低め、内→外の順)
+#   11〜55: 5x5 の行・列 (1 が高め側 / 内側)
+# 横は 内/イン・外/アウト、高さは 高め/ハイ・低め/ロー で判定する (インハイ は内角高め)。
+# 座標は上のストライクゾーンの各マスの中に入る値
+_X_BY_COL5 = np.array([-38.4, -19.2, 0.0, 19.2, 38.4])
+_Y_BY_ROW5 = np.array([120.0, 99.1, 77.5, 55.8, 35.0])
+# (正規表現, 5x5 の列 / 行)。先に一致したものを採用し、どれにも一致しなければ真ん中
+_COL_TOKENS = [
+    (r"(?:内|イン)角?ボール", 0),
+    (r"(?:外|アウト)角?ボール", 4),
+    (r"内|イン", 1),
+    (r"外|アウト", 3),
+]
+_ROW_TOKENS = [
+    (r"高め?ボール", 0),
+    (r"低め?ボール", 4),
+    (r"高め|ハイ", 1),
+    (r"低め|ロー", 3),
+]
+
+
+def _course_cells(labels):
+  # 種類ごとのコース文字列 → 5x5 の (行, 列)
+  labels = labels.str.normalize("NFKC").str.strip()
+  cols = np.select([labels.str.contains(p) for p, _ in _COL_TOKENS], [c for _, c in _COL_TOKENS], 2)
+  rows = np.select([labels.str.contains(p) for p, _ in _ROW_TOKENS], [r for _, r in _ROW_TOKENS], 2)
+  code9 = labels.str.fullmatch(r"[1-9]").to_numpy()
+  n9 = pd.to_numeric(labels.where(code9), errors="coerce").to_numpy() - 1
+  code25 = labels.str.fullmatch(r"[1-5][1-5]").to_numpy()
+  n25 = pd.to_numeric(labels.where(code25), errors="coerce").to_numpy()
+  rows = np.where(code9, n9 // 3 + 1, np.where(code25, n25 // 10 - 1, rows))
+  cols = np.where(code9, n9 % 3 + 1, np.where(code25, n25 % 10 - 1, cols))
+  return rows.astype("int64"), cols.astype("int64")
+
+
+def course_to_coords(course):
+  # コース列 → (StrikeZoneX, StrikeZoneY)。欠損は NaN
+  cat = pd.Categorical(course)
+  codes = cat.codes
+  if len(cat.categories) == 0:
+    nan = np.full(len(codes), np.nan)
+    return nan, nan.copy()
+  rows, cols = _course_cells(pd.Series(cat.categories.astype(str)))
+  x = np.where(codes >= 0, _X_BY_COL5[cols][codes], np.nan)
+  y = np.where(codes >= 0, _Y_BY_ROW5[rows][codes], np.nan)
+  return x, y